@@ -0,0 +1,219 @@
+"""Spending trends and forecasts for ``/api/stats/analytics``.
+
+Every monthly series is built from one read of ``monthly_rollups`` (see
+rollups.py). Those rows are the user's expanded occurrences, already summed
+per month, category, payment method and currency, so the read costs the
+same however often each expense recurs. :func:`summarise` turns the rows
+into NumPy arrays (month, category index, currency index, amount) and
+derives the series with vectorised group-bys (``bincount``), a matrix
+product for the per-category trends, ``convolve`` for the rolling average
+and ``cumsum`` for the month-to-date curves. Without NumPy the same numbers
+are computed in plain Python.
+
+Month-to-date figures come from the day totals the calendar shows (the
+schedule window, see schedule.py), so they exclude deactivated one-time
+expenses, which the monthly totals count like ``/api/stats/summary`` does.
+"""
+from datetime import date
+
+try:
+    import numpy as np
+except ImportError:          # optional: pure-Python fallback
+    np = None
+
+ROLLING_MONTHS = 3          # trailing average window
+TREND_MONTHS = 6            # complete months behind each category trend
+
+LOAD = '''
+    SELECT month, category_id, currency, SUM(total) FROM monthly_rollups
+    WHERE user_id = ? AND month >= ? AND month < ?
+    GROUP BY month, category_id, currency
+'''
+
+
+def _month_index(d):
+    return d.year * 12 + d.month - 1
+
+
+def _month_start(index):
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def span(today, months):
+    """Return (first day of the first of ``months`` months, end of next month)."""
+    index = _month_index(today)
+    return _month_start(index - months + 1), _month_start(index + 2)
+
+
+def daily_span(today):
+    """Return [first day of last month, first day of next month)."""
+    index = _month_index(today)
+    return _month_start(index - 1), _month_start(index + 1)
+
+
+def load(db, user_id, first, end):
+    """Columns ``(months, category ids, currencies, totals)`` for [first, end).
+
+    Category 0 means no category. The caller brings the rollups up to date.
+    """
+    cursor = db.cursor()
+    cursor.row_factory = None
+    rows = cursor.execute(LOAD, (user_id, first.strftime('%Y-%m'),
+                                 end.strftime('%Y-%m'))).fetchall()
+    return tuple(zip(*rows)) if rows else ((), (), (), ())
+
+
+def category_fields(db, ids):
+    """Display fields by category id for the non-zero ``ids``."""
+    ids = sorted(set(ids) - {0})
+    return {r['id']: {'name': r['name'], 'icon': r['icon'], 'icon_type': r['icon_type'],
+                      'color': r['color']}
+            for r in db.execute(f'SELECT * FROM categories WHERE id IN ({",".join("?" * len(ids))})',
+                                ids)}
+
+
+def _numpy_series(columns, daily, factors, first, months, split):
+    keys, categories, currencies, totals = columns
+    span = months + 1                                   # history plus next month
+    month = (np.array(keys, dtype='datetime64[M]')
+             - np.datetime64(first, 'M')).astype(np.int64)
+    ids, category = np.unique(np.array(categories, dtype=np.int64), return_inverse=True)
+    names, currency = np.unique(np.array(currencies, dtype=str), return_inverse=True)
+    rate = np.array([factors.get(c, 1) for c in names.tolist()], dtype=float)
+    value = np.array(totals, dtype=float) * rate[currency]
+
+    grid = np.bincount(category * span + month, weights=value,
+                       minlength=len(ids) * span).reshape(len(ids), span)
+    monthly = grid[:, :months].sum(axis=0)
+
+    rolling = [None] * min(ROLLING_MONTHS - 1, months)
+    if months >= ROLLING_MONTHS:
+        kernel = np.ones(ROLLING_MONTHS) / ROLLING_MONTHS
+        rolling += np.convolve(monthly, kernel, mode='valid').tolist()
+
+    previous, current = monthly[:-12], monthly[12:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change = np.where(previous > 0, (current / previous - 1) * 100, np.nan)
+    yoy = [None] * min(12, months) + [None if np.isnan(c) else c for c in change.tolist()]
+
+    # Least-squares slope per category over the complete months before this one
+    k = min(TREND_MONTHS, months - 1)
+    trend = grid[:, months - 1 - k:months - 1]
+    if k >= 2:
+        x = np.arange(k) - (k - 1) / 2
+        slopes = trend @ x / (x @ x)
+        # Next month is two steps after the last complete month
+        projected = trend.mean(axis=1) + slopes * (k + 1 - (k - 1) / 2)
+    else:
+        slopes = np.zeros(len(ids))
+        projected = trend.mean(axis=1) if k else grid[:, months - 1]
+    forecasts = np.maximum(np.maximum(projected, 0), grid[:, months])
+
+    daily = np.array(daily, dtype=float)
+    return {
+        'ids': ids.tolist(), 'grid': grid.tolist(), 'monthly': monthly.tolist(),
+        'rolling': rolling, 'yoy': yoy, 'slopes': slopes.tolist(),
+        'forecasts': forecasts.tolist(),
+        'previous_cumulative': np.cumsum(daily[:split]).tolist(),
+        'cumulative': np.cumsum(daily[split:]).tolist(),
+    }
+
+
+def _cumulative(values):
+    total, result = 0.0, []
+    for v in values:
+        total += v
+        result.append(total)
+    return result
+
+
+def _python_series(columns, daily, factors, first, months, split):
+    keys, categories, currencies, totals = columns
+    span = months + 1
+    base = _month_index(first)
+    ids = sorted(set(categories))
+    row_of = {c: i for i, c in enumerate(ids)}
+    grid = [[0.0] * span for _ in ids]
+    for key, category, currency, total in zip(keys, categories, currencies, totals):
+        month = int(key[:4]) * 12 + int(key[5:7]) - 1 - base
+        grid[row_of[category]][month] += total * factors.get(currency, 1)
+    monthly = [sum(row[m] for row in grid) for m in range(months)]
+
+    rolling = [sum(monthly[m - ROLLING_MONTHS + 1:m + 1]) / ROLLING_MONTHS
+               if m >= ROLLING_MONTHS - 1 else None for m in range(months)]
+    yoy = [(monthly[m] / monthly[m - 12] - 1) * 100 if m >= 12 and monthly[m - 12] > 0
+           else None for m in range(months)]
+
+    k = min(TREND_MONTHS, months - 1)
+    xs = [i - (k - 1) / 2 for i in range(k)]
+    slopes, forecasts = [], []
+    for row in grid:
+        trend = row[months - 1 - k:months - 1]
+        mean = sum(trend) / k if k else row[months - 1]
+        slope = sum(x * y for x, y in zip(xs, trend)) / sum(x * x for x in xs) if k >= 2 else 0.0
+        slopes.append(slope)
+        forecasts.append(max(mean + slope * (k + 1 - (k - 1) / 2), 0, row[months]))
+
+    return {
+        'ids': ids, 'grid': grid, 'monthly': monthly, 'rolling': rolling, 'yoy': yoy,
+        'slopes': slopes, 'forecasts': forecasts,
+        'previous_cumulative': _cumulative(daily[:split]),
+        'cumulative': _cumulative(daily[split:]),
+    }
+
+
+def _round(value, digits=2):
+    return None if value is None else round(value, digits)
+
+
+def summarise(columns, daily, factors, first, months, today, categories):
+    """Build the analytics body.
+
+    ``columns`` come from :func:`load` for :func:`span`, ``daily`` holds the
+    converted day totals over :func:`daily_span` and ``categories`` maps
+    category id to its display fields.
+    """
+    last_month, this_month = daily_span(today)[0], _month_start(_month_index(today))
+    series = (_numpy_series if np is not None else _python_series)(
+        columns, daily, factors, first, months, (this_month - last_month).days)
+    keys = [_month_start(_month_index(first) + m).strftime('%Y-%m') for m in range(months + 1)]
+    spent = series['cumulative'][today.day - 1]
+    scheduled = series['cumulative'][-1] - spent
+    previous = series['previous_cumulative']
+
+    groups = []
+    for i, category_id in enumerate(series['ids']):
+        row = series['grid'][i]
+        groups.append({
+            **categories.get(category_id, {'name': None, 'icon': None, 'icon_type': None,
+                                           'color': None}),
+            'id': category_id or None,
+            'total': round(sum(row[:months]), 2),
+            'monthly': [round(v, 2) for v in row[:months]],
+            'trend': round(series['slopes'][i], 2),
+            'scheduled_next_month': round(row[months], 2),
+            'forecast': round(series['forecasts'][i], 2),
+        })
+    groups.sort(key=lambda g: g['total'], reverse=True)
+
+    return {
+        'monthly': [{'month': keys[m], 'total': round(series['monthly'][m], 2),
+                     'rolling_average': _round(series['rolling'][m]),
+                     'change_year_over_year': _round(series['yoy'][m], 1)}
+                    for m in range(months)],
+        'categories': groups,
+        'month_to_date': {
+            'day': today.day,
+            'spent': round(spent, 2),
+            'scheduled': round(scheduled, 2),
+            'projected': round(spent + scheduled, 2),
+            'previous_same_day': round(previous[min(today.day, len(previous)) - 1], 2),
+            'cumulative': [round(v, 2) for v in series['cumulative']],
+            'previous_cumulative': [round(v, 2) for v in previous],
+        },
+        'forecast': {
+            'month': keys[months],
+            'scheduled': round(sum(g['scheduled_next_month'] for g in groups), 2),
+            'total': round(sum(g['forecast'] for g in groups), 2),
+        },
+    }
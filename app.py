@@ -1,23 +1,64 @@
-from flask import (Flask, render_template, request, redirect,
-                   url_for, session, jsonify, g)
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import (Flask, Response, render_template, request, redirect,
+                   url_for, session, jsonify, g, make_response, stream_with_context)
 from functools import wraps
-from database import init_db, get_db
+from itertools import groupby
+from database import (init_db, get_db, get_directory_db, db_path, pool_stats, pooled, data_version,
+                      bump_data_version)
+from recurrence import month_window, occurrences
+from rates import DEFAULT_API_URL, conversion_factors, get_rates, rates_generation
+from stats import (GRANULARITIES, breakdown, convert_sums, month_span, monthly_totals,
+                   period_day_totals, period_totals, top_occurring)
+import analytics
+import auth
+import defaults
+import icons
+import metrics
+import payloads
+import resultcache
+import rollups
+import schedule
+import sync
 import config
-import requests as http_requests
+import base64
+import csv
+import hashlib
+import hmac
+import html
+import io
 import json
-from datetime import datetime, timedelta
+import re
+import sqlite3
+from datetime import date, datetime, timedelta
 
 app = Flask(__name__)
+app.json = payloads.FastJSONProvider(app)
 app.secret_key = config.SECRET_KEY
 app.config['DATABASE'] = config.DATABASE
 
 # Initialize database
 init_db(app)
+metrics.init_app(app)
+app.after_request(payloads.compress)
 
 
 # ─── Helpers ────────────────────────────────────────────────────────────────────
 
+def metrics_token_required(f):
+    """Server-wide diagnostics: need ``Authorization: Bearer <METRICS_TOKEN>``.
+
+    Off (404) while METRICS_TOKEN is unset.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if not config.METRICS_TOKEN:
+            return jsonify({'error': 'Not found'}), 404
+        if not hmac.compare_digest(request.headers.get('Authorization', ''),
+                                   f'Bearer {config.METRICS_TOKEN}'):
+            return jsonify({'error': 'Unauthorized'}), 401
+        return f(*args, **kwargs)
+    return decorated
+
+
 def login_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -29,28 +70,254 @@ def login_required(f):
     return decorated
 
 
+def conditional(rates_dependent=False, cache=False):
+    """Serve a GET route with a strong ETag derived from the user's data version.
+
+    A matching ``If-None-Match`` is answered with 304 before the route runs.
+    Responses that convert currencies also depend on the day and on the
+    exchange-rate snapshot stored in SQLite, so those are folded into their
+    tag. With ``cache=True`` the JSON body is also kept in ``resultcache``
+    under the tag.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            uid = session['user_id']
+            # Read the versions before the data: a concurrent write or rate
+            # refresh can only make the tag older than the body, never newer.
+            parts = [uid, data_version(get_db(), uid), request.full_path]
+            if rates_dependent:
+                parts += [date.today().isoformat(), rates_generation(app.config['DATABASE'])]
+            etag = hashlib.sha1(repr(parts).encode()).hexdigest()
+
+            headers = {'Cache-Control': 'private, no-cache'}
+            for variant in payloads.etag_variants(etag):
+                if variant in request.if_none_match:
+                    return Response(status=304, headers={**headers, 'ETag': f'"{variant}"'})
+            body = resultcache.lookup(get_db(), uid, etag) if cache else None
+            if body is not None:
+                return Response(body, mimetype='application/json',
+                                headers={**headers, 'ETag': f'"{etag}"'})
+            resp = make_response(f(*args, **kwargs))
+            if resp.status_code == 200:
+                resp.set_etag(etag)
+                resp.headers.update(headers)
+                if cache:
+                    resultcache.store(get_db(), uid, etag, resp.get_data())
+            return resp
+        return decorated
+    return decorator
+
+
+EXPENSE_SELECT = '''
+    SELECT e.*, c.name as category_name, c.icon as category_icon,
+           c.icon_type as category_icon_type, c.color as category_color,
+           p.name as payment_method_name, p.icon as payment_method_icon,
+           p.icon_type as payment_method_icon_type
+    FROM expenses e
+    LEFT JOIN categories c ON e.category_id = c.id
+    LEFT JOIN payment_methods p ON e.payment_method_id = p.id
+'''
+
+# Columns written by create/update, in expense_values() order
+EXPENSE_COLUMNS = ('title', 'description', 'amount', 'currency', 'category_id',
+                   'payment_method_id', 'billing_date', 'billing_interval',
+                   'custom_interval_days', 'specific_days', 'is_active')
+EXPENSE_INSERT = (f"INSERT INTO expenses (user_id, {', '.join(EXPENSE_COLUMNS)}) "
+                  f"VALUES ({', '.join('?' * (len(EXPENSE_COLUMNS) + 1))})")
+EXPENSE_UPDATE = (f"UPDATE expenses SET {', '.join(c + '=?' for c in EXPENSE_COLUMNS)}, "
+                  "updated_at=CURRENT_TIMESTAMP WHERE id=? AND user_id=?")
+IMPORT_BATCH_SIZE = 500
+MAX_BATCH_OPS = 1000
+
+# sort name -> (ORDER BY column, direction); e.id is always the tie-breaker
+EXPENSE_SORTS = {
+    'date-desc': ('e.billing_date', 'DESC'), 'date-asc': ('e.billing_date', 'ASC'),
+    'amount-desc': ('e.amount', 'DESC'), 'amount-asc': ('e.amount', 'ASC'),
+    'title-asc': ('e.title', 'ASC'),
+}
+EXPENSE_SORT_KEYS = {'date-desc': 'billing_date', 'date-asc': 'billing_date',
+                     'amount-desc': 'amount', 'amount-asc': 'amount', 'title-asc': 'title'}
+PAGINATION_PARAMS = ('limit', 'cursor', 'sort', 'category_id', 'payment_method_id',
+                     'interval', 'active', 'date_from', 'date_to', 'q')
+MAX_PAGE_SIZE = 500
+MAX_RANGE_DAYS = 3660
+UPCOMING_DAYS = 30
+ANALYTICS_MONTHS = 24
+MAX_ANALYTICS_MONTHS = 120
+SEARCH_LIMIT = 50
+# bm25() weights for (title, description, user_id): title hits rank first
+SEARCH_WEIGHTS = (10.0, 1.0, 0.0)
+# Snippet delimiters; replaced by <mark> after the text is HTML-escaped
+MARK_OPEN, MARK_CLOSE = '\x02', '\x03'
+
+
+def expense_filters(args):
+    """Build WHERE clauses (without the user scope) from expense filter args."""
+    where, params = [], []
+    for arg, column in (('category_id', 'e.category_id'),
+                        ('payment_method_id', 'e.payment_method_id'),
+                        ('interval', 'e.billing_interval'),
+                        ('active', 'e.is_active')):
+        if args.get(arg, '') != '':
+            where.append(f'{column} = ?')
+            params.append(args[arg])
+    if args.get('date_from'):
+        where.append('e.billing_date >= ?')
+        params.append(args['date_from'])
+    if args.get('date_to'):
+        where.append('e.billing_date <= ?')
+        params.append(args['date_to'])
+    if args.get('q'):
+        pattern = '%' + args['q'].replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        where.append("(e.title LIKE ? ESCAPE '\\' OR e.description LIKE ? ESCAPE '\\')")
+        params += [pattern, pattern]
+    return where or ['1'], params
+
+
+def search_match(text, user_id):
+    """FTS5 MATCH expression for user text: every word, as a prefix.
+
+    The words are matched in title and description only, and the owner
+    token restricts the match to ``user_id``'s rows. Empty without words.
+    """
+    words = re.findall(r'\w+', text)
+    if not words:
+        return ''
+    return f'user_id : "{int(user_id)}" AND {{title description}} : (' + \
+        ' '.join(f'"{w}"*' for w in words) + ')'
+
+
+def highlight(snippet):
+    """HTML-escape an FTS5 snippet and turn its delimiters into <mark> tags."""
+    if snippet is None:
+        return None
+    return (html.escape(snippet)
+            .replace(MARK_OPEN, '<mark>').replace(MARK_CLOSE, '</mark>'))
+
+
+def expense_values(d):
+    """Normalise an expense payload into a tuple matching EXPENSE_COLUMNS."""
+    return (d['title'], d.get('description', ''), float(d['amount']),
+            d.get('currency', 'USD'), d.get('category_id'), d.get('payment_method_id'),
+            d['billing_date'], d.get('billing_interval', 'once'),
+            int(d.get('custom_interval_days', 0)), d.get('specific_days'),
+            int(d.get('is_active', 1)))
+
+
+def currency_context(db, uid):
+    """Return (target currency, conversion factors) for an aggregate request.
+
+    The target is the ``currency`` query argument, defaulting to the user's
+    display currency; factors come from the shared rate cache. Factors are
+    None when the argument names a currency without a rate (callers answer
+    400); a display currency without one falls back to USD.
+    """
+    s = db.execute('SELECT display_currency, currency_api_url FROM user_settings WHERE user_id=?',
+                   (uid,)).fetchone()
+    requested = request.args.get('currency', '').upper()
+    currency = requested or ((s and s['display_currency']) or 'USD').upper()
+    api_url = s['currency_api_url'] if s else DEFAULT_API_URL
+    factors = conversion_factors(app.config['DATABASE'], api_url, currency)
+    if currency not in factors:
+        if requested:
+            return currency, None
+        currency = 'USD'            # the factors are the USD table's
+    return currency, factors
+
+
+def insert_expense_batch(db, uid, batch):
+    """Insert expense_values() tuples with one executemany and commit."""
+    db.executemany(EXPENSE_INSERT, [(uid, *values) for values in batch])
+    last = db.execute('SELECT last_insert_rowid()').fetchone()[0]
+    rollups.apply(db, uid, [dict(zip(EXPENSE_COLUMNS, values)) for values in batch], 1)
+    schedule.refresh(db, uid, range(last - len(batch) + 1, last + 1))
+    bump_data_version(db, uid)
+    db.commit()
+    return len(batch)
+
+
+def calendar_expenses(db, uid, start, end):
+    """Active expenses occurring in [start, end), plus their days if materialised.
+
+    Returns ``(rows, scheduled)``. Inside the user's schedule window
+    ``scheduled`` maps expense id to its days (see schedule.py); outside it
+    is None and callers expand the recurrences themselves.
+    """
+    if schedule.advance(db, uid):
+        db.commit()
+    scheduled = schedule.lookup(db, uid, start, end)
+    if scheduled is None:
+        rows = db.execute(EXPENSE_SELECT + '''
+            WHERE e.user_id = ? AND e.is_active = 1 AND e.billing_date < ?
+              AND (e.billing_interval != 'once' OR e.billing_date >= ?)
+        ''', (uid, end.isoformat(), start.isoformat())).fetchall()
+    else:
+        rows = db.execute(EXPENSE_SELECT + '''
+            WHERE e.user_id = ? AND e.id IN (
+                SELECT expense_id FROM occurrences WHERE user_id = ? AND day >= ? AND day < ?)
+        ''', (uid, uid, start.isoformat(), end.isoformat())).fetchall()
+    return rows, scheduled
+
+
+def calendar_periods(db, uid, start, end, granularity, factors):
+    """Zero-filled converted totals per period in [start, end), oldest first."""
+    # Inside the schedule window the per-day sums come straight from SQL
+    day_rows = schedule.day_totals(db, uid, start, end)
+    if day_rows is None:
+        expenses, _ = calendar_expenses(db, uid, start, end)
+        return period_totals(expenses, start, end, granularity, factors)
+    return period_day_totals(day_rows, start, end, granularity, factors)
+
+
+def calendar_days(expenses, start, end, factors, scheduled=None):
+    """Map every day in [start, end) to the expense occurrences on it.
+
+    ``scheduled`` (expense id -> days, from schedule.lookup) replaces the
+    recurrence expansion when given.
+    """
+    cal_data = {}
+    d = start
+    while d < end:
+        cal_data[d.isoformat()] = []
+        d += timedelta(days=1)
+
+    for exp in expenses:
+        e = dict(exp)
+        converted = e['amount'] * factors.get(e['currency'], 1)
+        days = scheduled.get(e['id'], ()) if scheduled is not None else occurrences(e, start, end)
+        for day in days:
+            cal_data[day.isoformat()].append({
+                'id': e['id'], 'title': e['title'], 'amount': e['amount'],
+                'currency': e['currency'], 'converted_amount': converted,
+                'category_name': e['category_name'],
+                'category_icon': e['category_icon'],
+                'category_icon_type': e['category_icon_type'],
+                'category_color': e['category_color'],
+                'payment_method_name': e['payment_method_name'],
+                'payment_method_icon': e['payment_method_icon'],
+                'payment_method_icon_type': e['payment_method_icon_type'],
+                'billing_interval': e['billing_interval'],
+            })
+    return cal_data
+
+
+def encode_cursor(value, row_id):
+    return base64.urlsafe_b64encode(json.dumps([value, row_id]).encode()).decode()
+
+
+def decode_cursor(token):
+    try:
+        value, row_id = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except Exception:
+        raise ValueError('invalid cursor')
+    return value, int(row_id)
+
+
 def seed_defaults(user_id):
-    """Create default categories and payment methods for a new user."""
-    db = get_db()
-    db.execute('INSERT INTO user_settings (user_id) VALUES (?)', (user_id,))
-    categories = [
-        ('Housing', '🏠', '#6366f1'), ('Food & Dining', '🍔', '#f59e0b'),
-        ('Transport', '🚗', '#10b981'), ('Entertainment', '🎬', '#ec4899'),
-        ('Shopping', '🛍️', '#8b5cf6'), ('Health', '💊', '#ef4444'),
-        ('Utilities', '💡', '#06b6d4'), ('Education', '📚', '#f97316'),
-        ('Subscriptions', '🔄', '#a855f7'), ('Insurance', '🛡️', '#14b8a6'),
-        ('Savings', '🏦', '#22c55e'), ('Other', '📌', '#64748b'),
-    ]
-    for name, icon, color in categories:
-        db.execute('INSERT INTO categories (user_id,name,icon,color) VALUES (?,?,?,?)',
-                   (user_id, name, icon, color))
-    methods = [
-        ('Cash', '💵'), ('Credit Card', '💳'), ('Debit Card', '🏧'),
-        ('Bank Transfer', '🏦'), ('PayPal', '🅿️'), ('Crypto', '₿'),
-    ]
-    for name, icon in methods:
-        db.execute('INSERT INTO payment_methods (user_id,name,icon) VALUES (?,?,?)',
-                   (user_id, name, icon))
+    """Create settings and default categories/payment methods for a new user."""
+    db = get_db(user_id)
+    defaults.seed(db, user_id, shared=config.SHARED_DEFAULTS)
     db.commit()
 
 
@@ -68,9 +335,25 @@ def login():
     if request.method == 'POST':
         username = request.form.get('username', '').strip()
         password = request.form.get('password', '')
-        db = get_db()
-        user = db.execute('SELECT * FROM users WHERE username=?', (username,)).fetchone()
-        if user and check_password_hash(user['password_hash'], password):
+        if not auth.login_limiter.allow(f'ip:{request.remote_addr}', f'user:{username.lower()}'):
+            return render_template('login.html', error='Too many login attempts, try again in a minute'), 429
+        db = get_directory_db()
+        user = db.execute('SELECT id, username, password_hash FROM users WHERE username=?',
+                          (username,)).fetchone()
+        try:
+            valid = user is not None and auth.verify_password(user['password_hash'], password)
+        except (auth.AuthBusy, TimeoutError):
+            return render_template('login.html', error='Server busy, please try again'), 503
+        if valid and auth.needs_rehash(user['password_hash']):
+            # Best effort: a busy hash pool leaves the upgrade to the next login
+            try:
+                db.execute('UPDATE users SET password_hash=? WHERE id=?',
+                           (auth.hash_password(password), user['id']))
+                db.commit()
+            except (auth.AuthBusy, TimeoutError):
+                app.logger.warning('login: password rehash for user %s skipped, hash pool busy',
+                                   user['id'])
+        if valid:
             session['user_id'] = user['id']
             session['username'] = user['username']
             return redirect(url_for('dashboard'))
@@ -98,14 +381,23 @@ def register():
         if errors:
             return render_template('register.html', error='; '.join(errors))
 
-        db = get_db()
-        if db.execute('SELECT id FROM users WHERE username=?', (username,)).fetchone():
+        if not auth.login_limiter.allow(f'ip:{request.remote_addr}'):
+            return render_template('register.html', error='Too many attempts, try again in a minute'), 429
+        try:
+            password_hash = auth.hash_password(password)
+        except (auth.AuthBusy, TimeoutError):
+            return render_template('register.html', error='Server busy, please try again'), 503
+
+        db = get_directory_db()
+        try:
+            user_id = db.execute('INSERT INTO users (username, password_hash) VALUES (?,?)',
+                                 (username, password_hash)).lastrowid
+        except sqlite3.IntegrityError:
             return render_template('register.html', error='Username already taken')
-
-        db.execute('INSERT INTO users (username, password_hash) VALUES (?,?)',
-                   (username, generate_password_hash(password)))
-        user_id = db.execute('SELECT last_insert_rowid()').fetchone()[0]
+        # Unsharded this is the same connection, so one transaction; with
+        # shards the account is only committed once its data is seeded.
         seed_defaults(user_id)
+        db.commit()
         session['user_id'] = user_id
         session['username'] = username
         return redirect(url_for('dashboard'))
@@ -128,19 +420,122 @@ def dashboard():
 
 @app.route('/api/expenses', methods=['GET'])
 @login_required
+@conditional()
 def get_expenses():
+    """List expenses.
+
+    Without query parameters the full list is returned as an array. Any of
+    ``limit``, ``cursor``, ``sort`` or a filter switches to keyset pagination
+    and returns ``{'items': [...], 'next_cursor': token-or-null}``.
+    ``format=columnar`` returns either as parallel columns (see payloads.py).
+    """
     db = get_db()
-    rows = db.execute('''
+    args = request.args
+    fmt = args.get('format', 'json')
+    if fmt not in payloads.FORMATS:
+        return jsonify({'error': 'Invalid format'}), 400
+    if not any(k in args for k in PAGINATION_PARAMS):
+        cursor = db.execute(EXPENSE_SELECT + '''
+            WHERE e.user_id = ? ORDER BY e.billing_date DESC
+        ''', (session['user_id'],))
+        rows = cursor.fetchall()
+        if fmt == 'columnar':
+            return jsonify(payloads.expense_columns(rows, [d[0] for d in cursor.description]))
+        return jsonify([dict(r) for r in rows])
+
+    sort = args.get('sort', 'date-desc')
+    if sort not in EXPENSE_SORTS:
+        return jsonify({'error': 'Invalid sort'}), 400
+    column, direction = EXPENSE_SORTS[sort]
+    try:
+        limit = min(max(int(args.get('limit', 100)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+
+    where, params = expense_filters(args)
+    if args.get('cursor'):
+        try:
+            value, last_id = decode_cursor(args['cursor'])
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        op = '<' if direction == 'DESC' else '>'
+        where.append(f'({column}, e.id) {op} (?, ?)')
+        params += [value, last_id]
+
+    cursor = db.execute(
+        EXPENSE_SELECT + f'''
+        WHERE e.user_id = ? AND {' AND '.join(where)}
+        ORDER BY {column} {direction}, e.id {direction} LIMIT ?
+        ''', [session['user_id'], *params, limit + 1])
+    rows = cursor.fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(last[EXPENSE_SORT_KEYS[sort]], last['id'])
+    if fmt == 'columnar':
+        return jsonify({**payloads.expense_columns(rows[:limit], [d[0] for d in cursor.description]),
+                        'next_cursor': next_cursor})
+    return jsonify({'items': [dict(r) for r in rows[:limit]], 'next_cursor': next_cursor})
+
+
+@app.route('/api/expenses/search')
+@login_required
+@conditional()
+def search_expenses():
+    """Full-text search over expense titles and descriptions.
+
+    Every word of ``q`` matches as a prefix; results are ranked by BM25 and
+    carry ``title_snippet``/``description_snippet`` with ``<mark>`` around
+    the hits. The expense list filters (``category_id``, ``payment_method_id``,
+    ``interval``, ``active``, ``date_from``, ``date_to``) narrow the same
+    query. Returns ``{'items': [...]}`` with at most ``limit`` rows.
+    """
+    db = get_db()
+    args = request.args
+    match = search_match(args.get('q', ''), session['user_id'])
+    if not match:
+        return jsonify({'error': 'q is required'}), 400
+    try:
+        limit = min(max(int(args.get('limit', SEARCH_LIMIT)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    where, params = expense_filters({k: v for k, v in args.items() if k != 'q'})
+
+    if not db.execute("SELECT 1 FROM sqlite_master WHERE name='expenses_fts'").fetchone():
+        # SQLite without FTS5: substring match, newest first
+        where, params = expense_filters(args)
+        rows = db.execute(EXPENSE_SELECT + f'''
+            WHERE e.user_id = ? AND {' AND '.join(where)}
+            ORDER BY e.billing_date DESC, e.id DESC LIMIT ?
+        ''', [session['user_id'], *params, limit]).fetchall()
+        return jsonify({'items': [dict(r, rank=None, title_snippet=None, description_snippet=None)
+                                  for r in rows]})
+
+    rows = db.execute(f'''
         SELECT e.*, c.name as category_name, c.icon as category_icon,
                c.icon_type as category_icon_type, c.color as category_color,
                p.name as payment_method_name, p.icon as payment_method_icon,
-               p.icon_type as payment_method_icon_type
-        FROM expenses e
+               p.icon_type as payment_method_icon_type,
+               bm25(expenses_fts, ?, ?, ?) AS rank,
+               snippet(expenses_fts, 0, ?, ?, '…', 12) AS title_snippet,
+               snippet(expenses_fts, 1, ?, ?, '…', 16) AS description_snippet
+        FROM expenses_fts
+        JOIN expenses e ON e.id = expenses_fts.rowid
         LEFT JOIN categories c ON e.category_id = c.id
         LEFT JOIN payment_methods p ON e.payment_method_id = p.id
-        WHERE e.user_id = ? ORDER BY e.billing_date DESC
-    ''', (session['user_id'],)).fetchall()
-    return jsonify([dict(r) for r in rows])
+        WHERE expenses_fts MATCH ? AND e.user_id = ? AND {' AND '.join(where)}
+        ORDER BY rank LIMIT ?
+    ''', [*SEARCH_WEIGHTS, MARK_OPEN, MARK_CLOSE, MARK_OPEN, MARK_CLOSE,
+          match, session['user_id'], *params, limit]).fetchall()
+    items = []
+    for r in rows:
+        item = dict(r)
+        item['title_snippet'] = highlight(item['title_snippet'])
+        item['description_snippet'] = highlight(item['description_snippet']) \
+            if item['description'] else None
+        items.append(item)
+    return jsonify({'items': items})
 
 
 @app.route('/api/expenses', methods=['POST'])
@@ -148,20 +543,12 @@ def get_expenses():
 def create_expense():
     d = request.get_json()
     db = get_db()
-    db.execute('''
-        INSERT INTO expenses
-        (user_id, title, description, amount, currency, category_id, payment_method_id,
-         billing_date, billing_interval, custom_interval_days, specific_days, is_active)
-        VALUES (?,?,?,?,?,?,?,?,?,?,?,?)
-    ''', (session['user_id'], d['title'], d.get('description', ''),
-          float(d['amount']), d.get('currency', 'USD'),
-          d.get('category_id'), d.get('payment_method_id'),
-          d['billing_date'], d.get('billing_interval', 'once'),
-          int(d.get('custom_interval_days', 0)),
-          d.get('specific_days'),
-          int(d.get('is_active', 1))))
+    values = expense_values(d)
+    eid = db.execute(EXPENSE_INSERT, (session['user_id'], *values)).lastrowid
+    rollups.apply(db, session['user_id'], [dict(zip(EXPENSE_COLUMNS, values))], 1)
+    schedule.refresh(db, session['user_id'], [eid])
+    bump_data_version(db, session['user_id'])
     db.commit()
-    eid = db.execute('SELECT last_insert_rowid()').fetchone()[0]
     return jsonify({'status': 'ok', 'id': eid})
 
 
@@ -170,18 +557,15 @@ def create_expense():
 def update_expense(eid):
     d = request.get_json()
     db = get_db()
-    db.execute('''
-        UPDATE expenses SET title=?, description=?, amount=?, currency=?, category_id=?,
-        payment_method_id=?, billing_date=?, billing_interval=?, custom_interval_days=?,
-        specific_days=?, is_active=?, updated_at=CURRENT_TIMESTAMP 
-        WHERE id=? AND user_id=?
-    ''', (d['title'], d.get('description', ''), float(d['amount']),
-          d.get('currency', 'USD'), d.get('category_id'),
-          d.get('payment_method_id'), d['billing_date'],
-          d.get('billing_interval', 'once'),
-          int(d.get('custom_interval_days', 0)),
-          d.get('specific_days'),
-          int(d.get('is_active', 1)), eid, session['user_id']))
+    uid = session['user_id']
+    values = expense_values(d)
+    old = db.execute('SELECT * FROM expenses WHERE id=? AND user_id=?', (eid, uid)).fetchone()
+    db.execute(EXPENSE_UPDATE, (*values, eid, uid))
+    if old:
+        rollups.apply(db, uid, [old], -1)
+        rollups.apply(db, uid, [dict(zip(EXPENSE_COLUMNS, values))], 1)
+        schedule.refresh(db, uid, [eid])
+    bump_data_version(db, uid)
     db.commit()
     return jsonify({'status': 'ok'})
 
@@ -190,20 +574,222 @@ def update_expense(eid):
 @login_required
 def delete_expense(eid):
     db = get_db()
-    db.execute('DELETE FROM expenses WHERE id=? AND user_id=?', (eid, session['user_id']))
+    uid = session['user_id']
+    old = db.execute('SELECT * FROM expenses WHERE id=? AND user_id=?', (eid, uid)).fetchone()
+    db.execute('DELETE FROM expenses WHERE id=? AND user_id=?', (eid, uid))
+    if old:
+        rollups.apply(db, uid, [old], -1)
+    bump_data_version(db, uid)
     db.commit()
     return jsonify({'status': 'ok'})
 
 
+@app.route('/api/expenses/batch', methods=['POST'])
+@login_required
+def batch_expenses():
+    """Apply a list of create/update/delete operations in one transaction.
+
+    Body: ``[{"op": "create", "data": {...}}, {"op": "update", "id": 1,
+    "data": {...}}, {"op": "delete", "id": 2}, ...]`` (or ``{"ops": [...]}``).
+    Either every operation is applied or none is: an id the user does not
+    have, or that an earlier operation deletes, fails the batch with 404,
+    and a category or payment method they cannot see with 400.
+    """
+    d = request.get_json()
+    ops = d.get('ops') if isinstance(d, dict) else d
+    if not isinstance(ops, list) or not ops:
+        return jsonify({'error': 'ops must be a non-empty list'}), 400
+    if len(ops) > MAX_BATCH_OPS:
+        return jsonify({'error': f'At most {MAX_BATCH_OPS} operations per batch'}), 400
+
+    db = get_db()
+    uid = session['user_id']
+    category_ids = method_ids = None
+    # Validate everything before touching the database
+    prepared = []
+    for i, op in enumerate(ops):
+        try:
+            kind = op['op']
+            if kind in ('create', 'update'):
+                values = expense_values(op['data'])
+                if values[4] is not None:
+                    if category_ids is None:
+                        category_ids = defaults.visible_ids(db, uid, 'category')
+                    if int(values[4]) not in category_ids:
+                        raise ValueError('unknown category_id')
+                if values[5] is not None:
+                    if method_ids is None:
+                        method_ids = defaults.visible_ids(db, uid, 'payment_method')
+                    if int(values[5]) not in method_ids:
+                        raise ValueError('unknown payment_method_id')
+            if kind == 'create':
+                prepared.append((kind, None, (uid, *values)))
+            elif kind == 'update':
+                eid = int(op['id'])
+                prepared.append((kind, eid, (*values, eid, uid)))
+            elif kind == 'delete':
+                eid = int(op['id'])
+                prepared.append((kind, eid, (eid, uid)))
+            else:
+                raise ValueError(f'unknown op {kind!r}')
+        except KeyError as e:
+            return jsonify({'error': f'missing {e.args[0]}', 'index': i}), 400
+        except (ValueError, TypeError) as e:
+            return jsonify({'error': str(e), 'index': i}), 400
+
+    targets = {eid for _, eid, _ in prepared if eid is not None}
+    old_rows = {}
+    if targets:
+        marks = ','.join('?' * len(targets))
+        old_rows = {r['id']: r for r in db.execute(
+            f'SELECT * FROM expenses WHERE user_id=? AND id IN ({marks})', (uid, *targets))}
+        # An id deleted earlier in the batch is as missing as an unknown one
+        missing, deleted = set(targets - set(old_rows)), set()
+        for kind, eid, _ in prepared:
+            if eid in deleted:
+                missing.add(eid)
+            if kind == 'delete':
+                deleted.add(eid)
+        if missing:
+            return jsonify({'error': 'Expense not found', 'ids': sorted(missing)}), 404
+
+    # Final state of every touched row, for the rollup delta
+    final = dict(old_rows)
+    created = []
+    for kind, eid, params in prepared:
+        if kind == 'create':
+            created.append(dict(zip(EXPENSE_COLUMNS, params[1:])))
+        elif kind == 'update':
+            final[eid] = dict(zip(EXPENSE_COLUMNS, params[:-2]))
+        elif kind == 'delete':
+            final[eid] = None
+
+    statements = {'create': EXPENSE_INSERT, 'update': EXPENSE_UPDATE,
+                  'delete': 'DELETE FROM expenses WHERE id=? AND user_id=?'}
+    results, created_ids = [], []
+    try:
+        db.execute('BEGIN IMMEDIATE')
+        # Consecutive operations of the same kind go through one executemany
+        for kind, run in groupby(prepared, key=lambda p: p[0]):
+            run = list(run)
+            db.executemany(statements[kind], [p[2] for p in run])
+            if kind == 'create':
+                # AUTOINCREMENT ids are consecutive while we hold the write lock
+                last = db.execute('SELECT last_insert_rowid()').fetchone()[0]
+                ids = range(last - len(run) + 1, last + 1)
+                created_ids += ids
+            else:
+                ids = [p[1] for p in run]
+            results += [{'op': kind, 'id': eid, 'status': 'ok'} for eid in ids]
+        rollups.apply(db, uid, old_rows.values(), -1)
+        rollups.apply(db, uid, [*created, *(r for r in final.values() if r)], 1)
+        # Deleted rows lose their occurrences through the foreign key
+        schedule.refresh(db, uid, [*created_ids, *(i for i, r in final.items() if r)])
+        bump_data_version(db, uid)
+        db.commit()
+    except sqlite3.Error as e:
+        db.rollback()
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'status': 'ok', 'results': results})
+
+
+@app.route('/api/expenses/export')
+@login_required
+def export_expenses():
+    """Stream the user's expenses as NDJSON (default) or CSV."""
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({'error': 'Invalid format'}), 400
+    uid = session['user_id']
+    path = db_path(uid)
+
+    def generate():
+        # The request connection is released at teardown, before the body is
+        # streamed, so the generator checks out its own connection.
+        with pooled(path) as db:
+            cursor = db.execute(
+                f"SELECT {', '.join(EXPENSE_COLUMNS)} FROM expenses WHERE user_id=? ORDER BY id",
+                (uid,))
+            if fmt == 'csv':
+                buf = io.StringIO()
+                writer = csv.writer(buf)
+                writer.writerow(EXPENSE_COLUMNS)
+                for row in cursor:
+                    writer.writerow(row)
+                    yield buf.getvalue()
+                    buf.seek(0)
+                    buf.truncate()
+            else:
+                for row in cursor:
+                    yield json.dumps(dict(row), ensure_ascii=False) + '\n'
+
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(generate()), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=expenses.{fmt}'})
+
+
+@app.route('/api/expenses/import', methods=['POST'])
+@login_required
+def import_expenses():
+    """Import expenses from an uploaded NDJSON or CSV file.
+
+    Valid rows are inserted in batches of IMPORT_BATCH_SIZE; invalid rows are
+    skipped and reported as ``{'row': n, 'error': ...}`` (1-based).
+    """
+    upload = request.files.get('file')
+    stream = upload.stream if upload else request.stream
+    filename = upload.filename if upload else ''
+    fmt = request.args.get('format') or ('csv' if filename.lower().endswith('.csv') else 'ndjson')
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({'error': 'Invalid format'}), 400
+
+    db = get_db()
+    uid = session['user_id']
+    category_ids = defaults.visible_ids(db, uid, 'category')
+    method_ids = defaults.visible_ids(db, uid, 'payment_method')
+
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        records = csv.DictReader(text)
+    else:
+        records = (line for line in text if line.strip())
+
+    imported, errors, batch = 0, [], []
+    for n, record in enumerate(records, 1):
+        try:
+            d = json.loads(record) if fmt == 'ndjson' else record
+            d = {k: v for k, v in d.items() if v not in ('', None)}
+            values = expense_values(d)
+            if not str(values[0]).strip():
+                raise ValueError('title is required')
+            datetime.strptime(values[6], '%Y-%m-%d')
+            if values[4] is not None and int(values[4]) not in category_ids:
+                raise ValueError('unknown category_id')
+            if values[5] is not None and int(values[5]) not in method_ids:
+                raise ValueError('unknown payment_method_id')
+        except KeyError as e:
+            errors.append({'row': n, 'error': f'missing {e.args[0]}'})
+            continue
+        except (ValueError, TypeError, AttributeError) as e:
+            errors.append({'row': n, 'error': str(e)})
+            continue
+        batch.append(values)
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            imported += insert_expense_batch(db, uid, batch)
+            batch = []
+    if batch:
+        imported += insert_expense_batch(db, uid, batch)
+    return jsonify({'status': 'ok', 'imported': imported, 'errors': errors})
+
+
 # ─── Categories API ─────────────────────────────────────────────────────────────
 
 @app.route('/api/categories', methods=['GET'])
 @login_required
+@conditional()
 def get_categories():
     db = get_db()
-    return jsonify([dict(r) for r in db.execute(
-        'SELECT * FROM categories WHERE user_id=? ORDER BY name',
-        (session['user_id'],)).fetchall()])
+    return jsonify([dict(r) for r in defaults.visible(db, session['user_id'], 'category')])
 
 
 @app.route('/api/categories', methods=['POST'])
@@ -211,9 +797,12 @@ def get_categories():
 def create_category():
     d = request.get_json()
     db = get_db()
+    icon, icon_type, icon_data = icons.externalize(
+        db, session['user_id'], d.get('icon', '📁'), d.get('icon_data'))
     db.execute('INSERT INTO categories (user_id,name,icon,icon_type,icon_data,color) VALUES (?,?,?,?,?,?)',
-               (session['user_id'], d['name'], d.get('icon', '📁'), d.get('icon_type', 'emoji'),
-                d.get('icon_data'), d.get('color', '#6366f1')))
+               (session['user_id'], d['name'], icon, icon_type or d.get('icon_type', 'emoji'),
+                icon_data, d.get('color', '#6366f1')))
+    bump_data_version(db, session['user_id'])
     db.commit()
     return jsonify({'status': 'ok', 'id': db.execute('SELECT last_insert_rowid()').fetchone()[0]})
 
@@ -223,9 +812,14 @@ def create_category():
 def update_category(cid):
     d = request.get_json()
     db = get_db()
+    icon, icon_type, icon_data = icons.externalize(
+        db, session['user_id'], d.get('icon', '📁'), d.get('icon_data'))
+    # Editing a shared default gives the user their own copy first
+    cid = defaults.materialise(db, session['user_id'], 'category', cid) or cid
     db.execute('UPDATE categories SET name=?,icon=?,icon_type=?,icon_data=?,color=? WHERE id=? AND user_id=?',
-               (d['name'], d.get('icon', '📁'), d.get('icon_type', 'emoji'),
-                d.get('icon_data'), d.get('color', '#6366f1'), cid, session['user_id']))
+               (d['name'], icon, icon_type or d.get('icon_type', 'emoji'),
+                icon_data, d.get('color', '#6366f1'), cid, session['user_id']))
+    bump_data_version(db, session['user_id'])
     db.commit()
     return jsonify({'status': 'ok'})
 
@@ -234,7 +828,12 @@ def update_category(cid):
 @login_required
 def delete_category(cid):
     db = get_db()
-    db.execute('DELETE FROM categories WHERE id=? AND user_id=?', (cid, session['user_id']))
+    if db.execute('DELETE FROM categories WHERE id=? AND user_id=?',
+                  (cid, session['user_id'])).rowcount:
+        rollups.reassign(db, session['user_id'], 'category_id', cid)
+    else:
+        defaults.hide(db, session['user_id'], 'category', cid)
+    bump_data_version(db, session['user_id'])
     db.commit()
     return jsonify({'status': 'ok'})
 
@@ -243,11 +842,10 @@ def delete_category(cid):
 
 @app.route('/api/payment-methods', methods=['GET'])
 @login_required
+@conditional()
 def get_payment_methods():
     db = get_db()
-    return jsonify([dict(r) for r in db.execute(
-        'SELECT * FROM payment_methods WHERE user_id=? ORDER BY name',
-        (session['user_id'],)).fetchall()])
+    return jsonify([dict(r) for r in defaults.visible(db, session['user_id'], 'payment_method')])
 
 
 @app.route('/api/payment-methods', methods=['POST'])
@@ -255,9 +853,12 @@ def get_payment_methods():
 def create_payment_method():
     d = request.get_json()
     db = get_db()
+    icon, icon_type, icon_data = icons.externalize(
+        db, session['user_id'], d.get('icon', '💳'), d.get('icon_data'))
     db.execute('INSERT INTO payment_methods (user_id,name,icon,icon_type,icon_data) VALUES (?,?,?,?,?)',
-               (session['user_id'], d['name'], d.get('icon', '💳'), d.get('icon_type', 'emoji'),
-                d.get('icon_data')))
+               (session['user_id'], d['name'], icon, icon_type or d.get('icon_type', 'emoji'),
+                icon_data))
+    bump_data_version(db, session['user_id'])
     db.commit()
     return jsonify({'status': 'ok', 'id': db.execute('SELECT last_insert_rowid()').fetchone()[0]})
 
@@ -266,16 +867,87 @@ def create_payment_method():
 @login_required
 def delete_payment_method(pid):
     db = get_db()
-    db.execute('DELETE FROM payment_methods WHERE id=? AND user_id=?',
-               (pid, session['user_id']))
+    if db.execute('DELETE FROM payment_methods WHERE id=? AND user_id=?',
+                  (pid, session['user_id'])).rowcount:
+        rollups.reassign(db, session['user_id'], 'payment_method_id', pid)
+    else:
+        defaults.hide(db, session['user_id'], 'payment_method', pid)
+    bump_data_version(db, session['user_id'])
     db.commit()
     return jsonify({'status': 'ok'})
 
 
+# ─── Diagnostics ────────────────────────────────────────────────────────────────
+
+@app.route('/api/db/pool')
+@metrics_token_required
+def get_pool_stats():
+    return jsonify(pool_stats())
+
+
+@app.route('/metrics')
+@metrics_token_required
+def prometheus_metrics():
+    """Prometheus text endpoint."""
+    return Response(metrics.render(pool_stats(), resultcache.stats()),
+                    mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/api/cache/stats')
+@metrics_token_required
+def get_cache_stats():
+    return jsonify(resultcache.stats())
+
+
+# ─── Icons API ──────────────────────────────────────────────────────────────────
+
+@app.route('/api/icons', methods=['POST'])
+@login_required
+def upload_icon():
+    f = request.files.get('file')
+    if f is None:
+        return jsonify({'error': 'No file uploaded'}), 400
+    mime = (f.mimetype or '').lower()
+    if mime not in icons.ALLOWED_TYPES:
+        return jsonify({'error': 'Invalid file type. Use PNG, JPG, WebP, or SVG'}), 400
+    data = f.read(icons.MAX_ICON_BYTES + 1)
+    if not data or len(data) > icons.MAX_ICON_BYTES:
+        return jsonify({'error': 'File too large (max 512KB)'}), 400
+    db = get_db()
+    digest = icons.store(db, session['user_id'], data, mime, f.filename or 'icon')
+    db.commit()
+    return jsonify({'status': 'ok', 'hash': digest, 'url': icons.icon_url(digest)})
+
+
+@app.route('/api/icons/<digest>')
+@login_required
+def get_icon(digest):
+    headers = {
+        'ETag': f'"{digest}"',
+        # Content-addressed: the bytes behind a hash never change
+        'Cache-Control': 'private, max-age=31536000, immutable',
+    }
+    db = get_db()
+    # Icons are per user: only the owner's validator earns a 304
+    key = (session['user_id'], digest)
+    if digest in request.if_none_match and db.execute(
+            'SELECT 1 FROM icon_uploads WHERE user_id=? AND content_hash=?', key).fetchone():
+        return Response(status=304, headers=headers)
+    row = db.execute('SELECT data, mime_type FROM icon_uploads WHERE user_id=? AND content_hash=?',
+                     key).fetchone()
+    if not row:
+        return jsonify({'error': 'Icon not found'}), 404
+    headers['X-Content-Type-Options'] = 'nosniff'
+    # SVGs opened directly must not run scripts
+    headers['Content-Security-Policy'] = "default-src 'none'; style-src 'unsafe-inline'"
+    return Response(row['data'], mimetype=row['mime_type'], headers=headers)
+
+
 # ─── Settings API ───────────────────────────────────────────────────────────────
 
 @app.route('/api/settings', methods=['GET'])
 @login_required
+@conditional()
 def get_settings():
     db = get_db()
     s = db.execute('SELECT * FROM user_settings WHERE user_id=?',
@@ -303,130 +975,190 @@ def update_settings():
           d.get('custom_colors', '{}'),
           d.get('date_format', 'YYYY-MM-DD'),
           session['user_id']))
+    bump_data_version(db, session['user_id'])
     db.commit()
     return jsonify({'status': 'ok'})
 
 
+# ─── Sync API ───────────────────────────────────────────────────────────────────
+
+@app.route('/api/sync')
+@login_required
+@conditional()
+def get_sync():
+    """Expenses, categories, payment methods and settings changed since a token.
+
+    Without ``since`` (or with a token that is too old) everything is sent
+    with ``full: true``. Otherwise only rows created or updated after the
+    token are sent, and ``deleted`` lists the ids removed since. Either way
+    ``token`` is the value to send as ``since`` next time; see sync.py.
+    Expense rows carry only their own columns: the client joins them to the
+    categories and payment methods it holds, so a renamed category is one
+    changed row rather than a stale field on every expense.
+    """
+    try:
+        since = int(request.args['since']) if request.args.get('since') else None
+    except ValueError:
+        return jsonify({'error': 'Invalid since token'}), 400
+    db = get_db()
+    uid = session['user_id']
+    # Read the token before the rows: a concurrent write is sent twice, never missed
+    token = data_version(db, uid)
+    if sync.needs_snapshot(db, uid, since, token):
+        expenses = db.execute('SELECT * FROM expenses WHERE user_id = ? ORDER BY billing_date DESC',
+                              (uid,))
+        categories = defaults.visible(db, uid, 'category')
+        methods = defaults.visible(db, uid, 'payment_method')
+        settings = db.execute('SELECT * FROM user_settings WHERE user_id=?', (uid,)).fetchone()
+        deleted = None
+    else:
+        expenses = db.execute(f'''
+            SELECT * FROM expenses WHERE user_id = ? AND id IN ({sync.CHANGED})
+            ORDER BY billing_date DESC
+        ''', (uid, uid, 'expense', since))
+        categories = db.execute(f'SELECT * FROM categories WHERE user_id=? AND id IN ({sync.CHANGED})',
+                                (uid, uid, 'category', since))
+        methods = db.execute(f'SELECT * FROM payment_methods WHERE user_id=? AND id IN ({sync.CHANGED})',
+                             (uid, uid, 'payment_method', since))
+        settings = db.execute(f'SELECT * FROM user_settings WHERE user_id=? AND user_id IN ({sync.CHANGED})',
+                              (uid, uid, 'settings', since)).fetchone()
+        deleted = sync.tombstones(db, uid, since)
+    return jsonify({
+        'token': token,
+        'full': deleted is None,
+        'expenses': [dict(r) for r in expenses],
+        'categories': [dict(r) for r in categories],
+        'payment_methods': [dict(r) for r in methods],
+        'settings': dict(settings) if settings else None,
+        'deleted': deleted or {'expenses': [], 'categories': [], 'payment_methods': []},
+    })
+
+
 # ─── Currency API ────────────────────────────────────────────────────────────────
 
 @app.route('/api/currency/rates')
 @login_required
 def get_currency_rates():
-    base = request.args.get('base', 'USD')
+    base = request.args.get('base', 'USD').upper()
     db = get_db()
     s = db.execute('SELECT currency_api_url FROM user_settings WHERE user_id=?',
                    (session['user_id'],)).fetchone()
-    api_url = s['currency_api_url'] if s else 'https://api.exchangerate-api.com/v4/latest/'
-
-    # Try primary API
-    try:
-        resp = http_requests.get(f'{api_url}{base}', timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
-        return jsonify(data.get('rates', {}))
-    except Exception:
-        pass
-
-    # Try fallback API (Fawazahmed0)
-    try:
-        fallback_url = f'https://cdn.jsdelivr.net/npm/@fawazahmed0/currency-api@latest/v1/currencies/{base.lower()}.json'
-        resp = http_requests.get(fallback_url, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
-        rates_raw = data.get(base.lower(), {})
-        # Convert keys to uppercase to match expected format
-        rates = {k.upper(): v for k, v in rates_raw.items() if isinstance(v, (int, float))}
-        if rates:
-            return jsonify(rates)
-    except Exception:
-        pass
-
-    # Hardcoded fallback rates (approximate, base USD)
-    fallback = {
-        'USD': 1, 'EUR': 0.92, 'GBP': 0.79, 'JPY': 149.5, 'CNY': 7.24,
-        'CAD': 1.36, 'AUD': 1.53, 'CHF': 0.88, 'KRW': 1320, 'INR': 83.1,
-        'SGD': 1.34, 'HKD': 7.82, 'TWD': 31.5, 'MXN': 17.1, 'BRL': 4.97,
-        'SEK': 10.4, 'NOK': 10.5, 'DKK': 6.87, 'NZD': 1.63, 'THB': 35.2,
-        'RUB': 91.5, 'ZAR': 18.9, 'PHP': 56.2, 'MYR': 4.72, 'IDR': 15600,
-    }
-    if base != 'USD' and base in fallback:
-        rate = fallback[base]
-        return jsonify({k: round(v / rate, 6) for k, v in fallback.items()})
-    return jsonify(fallback)
+    api_url = s['currency_api_url'] if s else DEFAULT_API_URL
+    return jsonify(get_rates(app.config['DATABASE'], api_url, base))
 
 
 # ─── Statistics API ──────────────────────────────────────────────────────────────
 
 @app.route('/api/stats/summary')
 @login_required
+@conditional(rates_dependent=True, cache=True)
 def get_stats_summary():
     db = get_db()
     uid = session['user_id']
     now = datetime.now()
-    month_start = now.replace(day=1).strftime('%Y-%m-%d')
-    next_month = (now.replace(day=1) + timedelta(days=32)).replace(day=1).strftime('%Y-%m-%d')
-
-    # This month's one-time expenses
-    month_total = db.execute('''
-        SELECT COALESCE(SUM(amount),0) as total FROM expenses
-        WHERE user_id=? AND billing_date >= ? AND billing_date < ?
-    ''', (uid, month_start, next_month)).fetchone()['total']
-
-    # Active recurring expenses
-    recurring = db.execute('''
-        SELECT COUNT(*) as count, COALESCE(SUM(amount),0) as total FROM expenses
-        WHERE user_id=? AND billing_interval != 'once' AND is_active=1
-    ''', (uid,)).fetchone()
-
-    # Category breakdown for current month
+    months = month_span(now.year, now.month, 12)
+    month_key = f'{now.year}-{now.month:02d}'
+    month_start, next_month = month_window(now.year, now.month)
+
+    currency, factors = currency_context(db, uid)
+    if factors is None:
+        return jsonify({'error': f'Unknown currency {currency}'}), 400
+    if rollups.ensure(db, uid, now.year, now.month):
+        db.commit()
+
+    # Overall counts and active recurring expenses, per currency
+    counts = db.execute('''
+        SELECT currency, COUNT(*) as total_count,
+               COALESCE(SUM(billing_interval != 'once' AND is_active=1),0) as recurring_count,
+               COALESCE(SUM(CASE WHEN billing_interval != 'once' AND is_active=1
+                            THEN amount END),0) as recurring_total
+        FROM expenses WHERE user_id=? GROUP BY currency
+    ''', (uid,)).fetchall()
+
+    # Month totals for the window, straight from the rollups
+    monthly = db.execute('''
+        SELECT month, currency, SUM(total) as total FROM monthly_rollups
+        WHERE user_id=? AND month >= ? AND month <= ?
+        GROUP BY month, currency
+    ''', (uid, f'{months[0][0]}-{months[0][1]:02d}', month_key)).fetchall()
+
+    # Category and payment method breakdowns for the current month
     categories = db.execute('''
-        SELECT c.name, c.icon, c.icon_type, c.color, COALESCE(SUM(e.amount),0) as total
-        FROM expenses e LEFT JOIN categories c ON e.category_id=c.id
-        WHERE e.user_id=? AND e.billing_date >= ? AND e.billing_date < ?
-        GROUP BY e.category_id ORDER BY total DESC
-    ''', (uid, month_start, next_month)).fetchall()
-
-    # Monthly totals for past 12 months
-    monthly = []
-    for i in range(11, -1, -1):
-        dt = now - timedelta(days=i * 30)
-        ms = dt.replace(day=1).strftime('%Y-%m-%d')
-        me = (dt.replace(day=1) + timedelta(days=32)).replace(day=1).strftime('%Y-%m-%d')
-        t = db.execute(
-            'SELECT COALESCE(SUM(amount),0) as t FROM expenses WHERE user_id=? AND billing_date>=? AND billing_date<?',
-            (uid, ms, me)).fetchone()['t']
-        monthly.append({'month': dt.strftime('%Y-%m'), 'total': round(t, 2)})
-
-    # Total expenses count
-    total_count = db.execute(
-        'SELECT COUNT(*) as c FROM expenses WHERE user_id=?', (uid,)).fetchone()['c']
-
-    # Top expenses this month
-    top_expenses = db.execute('''
-        SELECT e.title, e.amount, e.currency, c.icon as category_icon,
-               c.icon_type as category_icon_type, c.color as category_color
-        FROM expenses e LEFT JOIN categories c ON e.category_id=c.id
-        WHERE e.user_id=? AND e.billing_date >= ? AND e.billing_date < ?
-        ORDER BY e.amount DESC LIMIT 5
-    ''', (uid, month_start, next_month)).fetchall()
-
-    # Payment method breakdown
-    payment_breakdown = db.execute('''
-        SELECT p.name, p.icon, p.icon_type, COALESCE(SUM(e.amount),0) as total
-        FROM expenses e LEFT JOIN payment_methods p ON e.payment_method_id=p.id
-        WHERE e.user_id=? AND e.billing_date >= ? AND e.billing_date < ?
-        GROUP BY e.payment_method_id ORDER BY total DESC
-    ''', (uid, month_start, next_month)).fetchall()
+        SELECT r.category_id as id, r.currency, SUM(r.total) as total,
+               c.name, c.icon, c.icon_type, c.color
+        FROM monthly_rollups r LEFT JOIN categories c ON r.category_id=c.id
+        WHERE r.user_id=? AND r.month=? GROUP BY r.category_id, r.currency
+    ''', (uid, month_key)).fetchall()
+    payments = db.execute('''
+        SELECT r.payment_method_id as id, r.currency, SUM(r.total) as total,
+               p.name, p.icon, p.icon_type
+        FROM monthly_rollups r LEFT JOIN payment_methods p ON r.payment_method_id=p.id
+        WHERE r.user_id=? AND r.month=? GROUP BY r.payment_method_id, r.currency
+    ''', (uid, month_key)).fetchall()
+
+    # Top expenses this month: walk rows by converted amount until N occur
+    currencies = [c['currency'] for c in counts if c['currency'] in factors]
+    factor_sql = ''.join(' WHEN ? THEN ?' for _ in currencies)
+    factor_expr = f'(CASE e.currency{factor_sql} ELSE 1 END)' if currencies else '1'
+    factor_params = [v for cur in currencies for v in (cur, factors[cur])]
+    candidates = db.execute(EXPENSE_SELECT + f'''
+        WHERE e.user_id = ? AND e.billing_date < ? AND (
+            (e.billing_interval = 'once' AND e.billing_date >= ?)
+            OR (e.billing_interval != 'once' AND e.is_active = 1))
+        ORDER BY e.amount * {factor_expr} DESC
+    ''', (uid, next_month.isoformat(), month_start.isoformat(), *factor_params))
+
+    monthly_list = monthly_totals(months, monthly, factors)
+    return jsonify({
+        'currency': currency,
+        'month_total': monthly_list[-1]['total'],
+        'recurring_count': sum(c['recurring_count'] for c in counts),
+        'recurring_total': round(convert_sums(
+            {c['currency']: c['recurring_total'] for c in counts}, factors), 2),
+        'total_count': sum(c['total_count'] for c in counts),
+        'categories': breakdown(categories, ('name', 'icon', 'icon_type', 'color'), factors),
+        'monthly_totals': monthly_list,
+        'top_expenses': top_occurring(candidates, month_start, next_month, factors),
+        'payment_breakdown': breakdown(payments, ('name', 'icon', 'icon_type'), factors),
+    })
+
+
+@app.route('/api/stats/analytics')
+@login_required
+@conditional(rates_dependent=True, cache=True)
+def get_stats_analytics():
+    """Monthly trends, rolling averages, category forecasts and month-to-date pace.
+
+    Covers the last ``months`` months (default 24) through the current one;
+    see analytics.py.
+    """
+    try:
+        months = int(request.args.get('months', ANALYTICS_MONTHS))
+    except ValueError:
+        return jsonify({'error': 'Invalid months'}), 400
+    if not 1 <= months <= MAX_ANALYTICS_MONTHS:
+        return jsonify({'error': f'months must be 1 to {MAX_ANALYTICS_MONTHS}'}), 400
+
+    db = get_db()
+    uid = session['user_id']
+    currency, factors = currency_context(db, uid)
+    if factors is None:
+        return jsonify({'error': f'Unknown currency {currency}'}), 400
+    today = date.today()
+    changed = rollups.ensure(db, uid, today.year, today.month)
+    if schedule.advance(db, uid) or changed:
+        db.commit()
 
+    first, end = analytics.span(today, months)
+    columns = analytics.load(db, uid, first, end)
+    # Day totals for last month and this one, as the calendar shows them
+    daily = [p['total'] for p in calendar_periods(db, uid, *analytics.daily_span(today),
+                                                  'day', factors)]
     return jsonify({
-        'month_total': round(month_total, 2),
-        'recurring_count': recurring['count'],
-        'recurring_total': round(recurring['total'], 2),
-        'total_count': total_count,
-        'categories': [dict(c) for c in categories],
-        'monthly_totals': monthly,
-        'top_expenses': [dict(e) for e in top_expenses],
-        'payment_breakdown': [dict(p) for p in payment_breakdown],
+        'currency': currency,
+        'months': months,
+        **analytics.summarise(columns, daily, factors, first, months, today,
+                              analytics.category_fields(db, columns[1])),
     })
 
 
@@ -434,150 +1166,96 @@ def get_stats_summary():
 
 @app.route('/api/calendar')
 @login_required
+@conditional(rates_dependent=True, cache=True)
 def get_calendar_data():
-    """Get expense occurrences for a given month."""
+    """Get expense occurrences for a given month (``format=columnar`` for the compact form)."""
     year = int(request.args.get('year', datetime.now().year))
     month = int(request.args.get('month', datetime.now().month))
     db = get_db()
     uid = session['user_id']
+    currency, factors = currency_context(db, uid)
+    if factors is None:
+        return jsonify({'error': f'Unknown currency {currency}'}), 400
 
-    expenses = db.execute('''
-        SELECT e.*, c.name as category_name, c.icon as category_icon,
-               c.icon_type as category_icon_type, c.color as category_color,
-               p.name as payment_method_name, p.icon as payment_method_icon,
-               p.icon_type as payment_method_icon_type
-        FROM expenses e
-        LEFT JOIN categories c ON e.category_id = c.id
-        LEFT JOIN payment_methods p ON e.payment_method_id = p.id
-        WHERE e.user_id = ? AND e.is_active = 1
-    ''', (uid,)).fetchall()
+    start, end = month_window(year, month)
+    expenses, scheduled = calendar_expenses(db, uid, start, end)
+    if request.args.get('format') == 'columnar':
+        return jsonify(payloads.calendar_columns(expenses, start, end, factors, scheduled))
+    return jsonify(calendar_days(expenses, start, end, factors, scheduled))
 
-    # Build day-by-day data
-    import calendar
-    days_in_month = calendar.monthrange(year, month)[1]
-    cal_data = {}
 
-    for day in range(1, days_in_month + 1):
-        date_str = f'{year}-{month:02d}-{day:02d}'
-        cal_data[date_str] = []
+@app.route('/api/calendar/range')
+@login_required
+@conditional(rates_dependent=True, cache=True)
+def get_calendar_range():
+    """Expand occurrences from ``start`` to ``end`` (inclusive) in one pass.
+
+    Returns the same per-day lists as /api/calendar (or their
+    ``format=columnar`` form), or zero-filled ``granularity=day|week|month``
+    totals for long ranges.
+    """
+    try:
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d').date()
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d').date() + timedelta(days=1)
+    except (KeyError, ValueError):
+        return jsonify({'error': 'start and end must be YYYY-MM-DD dates'}), 400
+    if not 0 < (end - start).days <= MAX_RANGE_DAYS:
+        return jsonify({'error': f'Range must be 1 to {MAX_RANGE_DAYS} days'}), 400
+    granularity = request.args.get('granularity')
+    if granularity is not None and granularity not in GRANULARITIES:
+        return jsonify({'error': 'Invalid granularity'}), 400
+
+    db = get_db()
+    uid = session['user_id']
+    currency, factors = currency_context(db, uid)
+    if factors is None:
+        return jsonify({'error': f'Unknown currency {currency}'}), 400
+
+    if granularity is None:
+        expenses, scheduled = calendar_expenses(db, uid, start, end)
+        if request.args.get('format') == 'columnar':
+            return jsonify(payloads.calendar_columns(expenses, start, end, factors, scheduled))
+        return jsonify(calendar_days(expenses, start, end, factors, scheduled))
+
+    if schedule.advance(db, uid):
+        db.commit()
+    return jsonify({
+        'currency': currency,
+        'granularity': granularity,
+        'periods': calendar_periods(db, uid, start, end, granularity, factors),
+    })
 
-    for exp in expenses:
-        e = dict(exp)
-        billing = datetime.strptime(e['billing_date'], '%Y-%m-%d')
-        interval = e['billing_interval']
-
-        occurrences = []
-        if interval == 'once':
-            if billing.year == year and billing.month == month:
-                occurrences.append(billing.day)
-        elif interval == 'daily':
-            for d in range(1, days_in_month + 1):
-                dt = datetime(year, month, d)
-                if dt >= billing:
-                    occurrences.append(d)
-        elif interval == 'weekdays':
-            # Monday-Friday only (weekday() returns 0-6, 0=Monday, 6=Sunday)
-            for d in range(1, days_in_month + 1):
-                dt = datetime(year, month, d)
-                if dt >= billing and dt.weekday() < 5:  # 0-4 = Mon-Fri
-                    occurrences.append(d)
-        elif interval == 'weekends':
-            # Saturday-Sunday only
-            for d in range(1, days_in_month + 1):
-                dt = datetime(year, month, d)
-                if dt >= billing and dt.weekday() >= 5:  # 5-6 = Sat-Sun
-                    occurrences.append(d)
-        elif interval == 'weekly':
-            dt = billing
-            while dt.year < year or (dt.year == year and dt.month < month):
-                dt += timedelta(days=7)
-            while dt.month == month and dt.year == year:
-                if dt >= billing:
-                    occurrences.append(dt.day)
-                dt += timedelta(days=7)
-        elif interval == 'biweekly':
-            dt = billing
-            while dt.year < year or (dt.year == year and dt.month < month):
-                dt += timedelta(days=14)
-            while dt.month == month and dt.year == year:
-                if dt >= billing:
-                    occurrences.append(dt.day)
-                dt += timedelta(days=14)
-        elif interval == 'monthly':
-            target_day = min(billing.day, days_in_month)
-            dt = datetime(year, month, target_day)
-            if dt >= billing:
-                occurrences.append(target_day)
-        elif interval == 'quarterly':
-            dt = billing
-            while dt < datetime(year, month, 1):
-                m = dt.month + 3
-                y = dt.year + (m - 1) // 12
-                m = ((m - 1) % 12) + 1
-                target_day = min(dt.day, calendar.monthrange(y, m)[1])
-                dt = datetime(y, m, target_day)
-            if dt.year == year and dt.month == month:
-                occurrences.append(dt.day)
-        elif interval == 'yearly':
-            if billing.month == month:
-                target_day = min(billing.day, days_in_month)
-                dt = datetime(year, month, target_day)
-                if dt >= billing:
-                    occurrences.append(target_day)
-        elif interval == 'custom' and e['custom_interval_days'] > 0:
-            dt = billing
-            interval_days = e['custom_interval_days']
-            while dt.year < year or (dt.year == year and dt.month < month):
-                dt += timedelta(days=interval_days)
-            while dt.month == month and dt.year == year:
-                if dt >= billing:
-                    occurrences.append(dt.day)
-                dt += timedelta(days=interval_days)
-        elif interval == 'specific_days' and e.get('specific_days'):
-            # specific_days is comma-separated weekday numbers (0=Mon, 6=Sun)
-            selected_days = [int(x.strip()) for x in e['specific_days'].split(',') if x.strip().isdigit()]
-            for d in range(1, days_in_month + 1):
-                dt = datetime(year, month, d)
-                if dt >= billing and dt.weekday() in selected_days:
-                    occurrences.append(d)
-        elif interval == 'bimonthly':
-            dt = billing
-            while dt < datetime(year, month, 1):
-                m = dt.month + 2
-                y = dt.year + (m - 1) // 12
-                m = ((m - 1) % 12) + 1
-                target_day = min(dt.day, calendar.monthrange(y, m)[1])
-                dt = datetime(y, m, target_day)
-            if dt.year == year and dt.month == month:
-                occurrences.append(dt.day)
-        elif interval == 'semiannually':
-            dt = billing
-            while dt < datetime(year, month, 1):
-                m = dt.month + 6
-                y = dt.year + (m - 1) // 12
-                m = ((m - 1) % 12) + 1
-                target_day = min(dt.day, calendar.monthrange(y, m)[1])
-                dt = datetime(y, m, target_day)
-            if dt.year == year and dt.month == month:
-                occurrences.append(dt.day)
-
-        for day in occurrences:
-            date_str = f'{year}-{month:02d}-{day:02d}'
-            if date_str in cal_data:
-                cal_data[date_str].append({
-                    'id': e['id'], 'title': e['title'], 'amount': e['amount'],
-                    'currency': e['currency'], 'category_name': e['category_name'],
-                    'category_icon': e['category_icon'],
-                    'category_icon_type': e['category_icon_type'],
-                    'category_color': e['category_color'],
-                    'payment_method_name': e['payment_method_name'],
-                    'payment_method_icon': e['payment_method_icon'],
-                    'payment_method_icon_type': e['payment_method_icon_type'],
-                    'billing_interval': e['billing_interval'],
-                })
-
-    return jsonify(cal_data)
 
+@app.route('/api/upcoming')
+@login_required
+@conditional(rates_dependent=True, cache=True)
+def get_upcoming():
+    """Occurrences due from today through ``days`` days ahead (default 30), by date."""
+    try:
+        days = int(request.args.get('days', UPCOMING_DAYS))
+    except ValueError:
+        return jsonify({'error': 'Invalid days'}), 400
+    if not 0 < days <= MAX_RANGE_DAYS:
+        return jsonify({'error': f'days must be 1 to {MAX_RANGE_DAYS}'}), 400
+
+    db = get_db()
+    uid = session['user_id']
+    currency, factors = currency_context(db, uid)
+    if factors is None:
+        return jsonify({'error': f'Unknown currency {currency}'}), 400
+    start = date.today()
+    end = start + timedelta(days=days)
+    expenses, scheduled = calendar_expenses(db, uid, start, end)
+    items = [dict(item, date=day)
+             for day, occurring in calendar_days(expenses, start, end, factors, scheduled).items()
+             for item in occurring]
+    return jsonify({
+        'currency': currency,
+        'start': start.isoformat(),
+        'end': (end - timedelta(days=1)).isoformat(),
+        'total': round(sum(i['converted_amount'] for i in items), 2),
+        'items': items,
+    })
 
 if __name__ == '__main__':
     app.run(debug=config.DEBUG, host='0.0.0.0', port=5000)
@@ -0,0 +1,110 @@
+"""Password hashing off the request threads, plus login rate limiting.
+
+Hashes are computed in a small per-worker process pool (``HASH_WORKERS``)
+so a burst of logins cannot starve API requests of CPU; at most
+``HASH_MAX_PENDING`` hashes may be queued before callers get
+:class:`AuthBusy`. ``PASSWORD_HASH_METHOD`` sets the werkzeug hash
+parameters, and stored hashes using older parameters are upgraded on the
+next successful login (:func:`needs_rehash`) when the pool has room; a busy
+pool skips the upgrade rather than failing the login.
+
+:class:`RateLimiter` is an in-process token bucket keyed by client IP and
+username.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+import config
+
+
+class AuthBusy(Exception):
+    """Too many password hashes are already queued."""
+
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_pending = threading.BoundedSemaphore(config.HASH_MAX_PENDING)
+
+
+def _pool():
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ProcessPoolExecutor(max_workers=config.HASH_WORKERS)
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _run(fn, *args):
+    if config.HASH_WORKERS <= 0:
+        return fn(*args)
+    if not _pending.acquire(blocking=False):
+        raise AuthBusy()
+    try:
+        return _pool().submit(fn, *args).result(timeout=config.HASH_TIMEOUT)
+    finally:
+        _pending.release()
+
+
+def hash_password(password):
+    return _run(generate_password_hash, password, config.PASSWORD_HASH_METHOD,
+                config.PASSWORD_SALT_LENGTH)
+
+
+def verify_password(password_hash, password):
+    return _run(check_password_hash, password_hash, password)
+
+
+@lru_cache(maxsize=None)
+def _method_prefix(method):
+    # werkzeug expands defaults ('scrypt' -> 'scrypt:32768:8:1'), so ask it
+    return generate_password_hash('', method, 1).split('$', 1)[0]
+
+
+def needs_rehash(password_hash):
+    """True if the stored hash was made with other parameters than configured."""
+    return password_hash.split('$', 1)[0] != _method_prefix(config.PASSWORD_HASH_METHOD)
+
+
+class RateLimiter:
+    """Token buckets: ``burst`` attempts, refilled at ``per_minute``."""
+
+    MAX_KEYS = 10000
+
+    def __init__(self, per_minute, burst):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self._buckets = {}          # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def allow(self, *keys):
+        """Take one token from every key's bucket, or none if any is empty."""
+        now = time.monotonic()
+        with self._lock:
+            if len(self._buckets) > self.MAX_KEYS:
+                self._prune(now)
+            levels = {}
+            for key in keys:
+                tokens, updated = self._buckets.get(key, (self.burst, now))
+                levels[key] = min(self.burst, tokens + (now - updated) * self.rate)
+            if any(level < 1 for level in levels.values()):
+                return False
+            for key, level in levels.items():
+                self._buckets[key] = (level - 1, now)
+            return True
+
+    def _prune(self, now):
+        # Buckets that have refilled completely carry no state
+        full = [k for k, (tokens, updated) in self._buckets.items()
+                if tokens + (now - updated) * self.rate >= self.burst]
+        for key in full:
+            del self._buckets[key]
+
+
+login_limiter = RateLimiter(config.LOGIN_RATE_PER_MINUTE, config.LOGIN_BURST)
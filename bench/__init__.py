@@ -0,0 +1,9 @@
+"""Benchmarks for the expense tracker.
+
+* ``python -m bench.generate`` fills a database with a deterministic
+  multi-tenant dataset;
+* ``python -m bench.run`` times the main routes through the Flask test
+  client and writes p50/p95/p99 latency, queries per request and peak RSS
+  to ``bench/results/<commit>.json``;
+* ``python -m bench.compare OLD.json NEW.json`` prints the difference.
+"""
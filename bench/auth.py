@@ -0,0 +1,118 @@
+"""Login throughput and its effect on API latency.
+
+Usage::
+
+    python -m bench.auth [--threads T] [--seconds S] [--hash-workers W] [--out FILE]
+
+``T`` threads log in as fast as they can for ``S`` seconds while another
+thread times ``GET /api/expenses?limit=50``; the API latency is also
+measured without login load as a baseline. Run it with ``--hash-workers 0``
+(inline hashing) and the default to compare. Rate limiting is disabled for
+the run. Results go to ``bench/results/auth-<commit>.json``.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from bench.run import RESULTS_DIR, _git_commit, _percentiles
+
+
+def _api_latency(client, stop, samples):
+    while not stop.is_set():
+        started = time.perf_counter()
+        client.get('/api/expenses?limit=50')
+        samples.append((time.perf_counter() - started) * 1000)
+
+
+def run(db_path, threads, seconds, hash_workers):
+    import config
+    config.DATABASE = db_path
+    config.HASH_WORKERS = hash_workers
+    config.LOGIN_RATE_PER_MINUTE = config.LOGIN_BURST = 10 ** 9
+    from app import app
+    from bench.generate import BENCH_PASSWORD
+
+    def api_client():
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = 1
+        return client
+
+    # Baseline API latency without login load
+    stop, baseline = threading.Event(), []
+    timer = threading.Thread(target=_api_latency, args=(api_client(), stop, baseline))
+    timer.start()
+    time.sleep(min(seconds, 3))
+    stop.set()
+    timer.join()
+
+    logins, errors = [0], [0]
+    lock = threading.Lock()
+    stop, loaded = threading.Event(), []
+
+    def login_loop(n):
+        client = app.test_client()
+        while not stop.is_set():
+            resp = client.post('/login', data={'username': f'bench{n % 10}',
+                                               'password': BENCH_PASSWORD})
+            with client.session_transaction() as sess:
+                sess.clear()
+            with lock:
+                if resp.status_code == 302:
+                    logins[0] += 1
+                else:
+                    errors[0] += 1
+
+    workers = [threading.Thread(target=login_loop, args=(n,)) for n in range(threads)]
+    workers.append(threading.Thread(target=_api_latency, args=(api_client(), stop, loaded)))
+    started = time.perf_counter()
+    for w in workers:
+        w.start()
+    time.sleep(seconds)
+    stop.set()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - started
+
+    def summary(samples):
+        return {k: round(v, 3) for k, v in _percentiles(samples).items()} | {'requests': len(samples)}
+
+    return {
+        'logins_per_second': round(logins[0] / elapsed, 2),
+        'login_errors': errors[0],
+        'api_baseline_ms': summary(baseline),
+        'api_under_login_load_ms': summary(loaded),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark login throughput.')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--hash-workers', type=int, default=2)
+    parser.add_argument('--out', help='result file (default: bench/results/auth-<commit>.json)')
+    args = parser.parse_args(argv)
+
+    from bench.generate import generate
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        generate(db_path, users=10, expenses=200)
+        result = run(db_path, args.threads, args.seconds, args.hash_workers)
+
+    commit = _git_commit()
+    report = {'commit': commit, 'threads': args.threads, 'seconds': args.seconds,
+              'hash_workers': args.hash_workers, **result}
+    print(json.dumps(report, indent=2))
+    out = args.out or os.path.join(RESULTS_DIR, f'auth-{commit}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,45 @@
+"""Compare two ``bench.run`` result files.
+
+Usage::
+
+    python -m bench.compare OLD.json NEW.json
+"""
+import json
+import sys
+
+METRICS = ('p50', 'p95', 'p99', 'queries_per_request')
+
+
+def _change(old, new):
+    if not old:
+        return '    n/a'
+    return f'{(new - old) / old * 100:+6.1f}%'
+
+
+def compare(old, new):
+    """Return printable lines comparing the scenarios both reports share."""
+    lines = [f"{old['commit']} -> {new['commit']}   "
+             f"peak RSS {old['peak_rss_mb']} -> {new['peak_rss_mb']} MB"]
+    for name in old['scenarios']:
+        if name not in new['scenarios']:
+            continue
+        a, b = old['scenarios'][name], new['scenarios'][name]
+        cells = [f'{m} {a[m]:.2f}->{b[m]:.2f} ({_change(a[m], b[m])})' for m in METRICS]
+        lines.append(f'{name:28} ' + '   '.join(cells))
+    return lines
+
+
+def main(argv):
+    if len(argv) != 3:
+        print(__doc__.strip().split('Usage::')[1])
+        return 2
+    with open(argv[1]) as f:
+        old = json.load(f)
+    with open(argv[2]) as f:
+        new = json.load(f)
+    print('\n'.join(compare(old, new)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
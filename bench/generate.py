@@ -0,0 +1,108 @@
+"""Deterministic synthetic dataset: N users x M expenses.
+
+Usage::
+
+    python -m bench.generate PATH [--users N] [--expenses M] [--seed S]
+
+Every user gets the default categories and payment methods, a settings row
+and ``M`` expenses with a realistic mix of billing intervals, currencies
+and backdated billing dates. All users share the password
+``BENCH_PASSWORD`` and are named ``bench0``, ``bench1``, ...
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+from werkzeug.security import generate_password_hash
+
+import defaults
+from database import SCHEMA, connect, migrate_db
+from rates import DEFAULT_API_URL, FALLBACK_RATES
+
+BENCH_PASSWORD = 'bench-password'
+
+# (value, weight): roughly what a household tracker accumulates
+INTERVALS = [
+    ('once', 40), ('monthly', 20), ('weekly', 8), ('yearly', 6), ('biweekly', 4),
+    ('quarterly', 4), ('custom', 4), ('daily', 3), ('bimonthly', 2), ('semiannually', 2),
+    ('weekdays', 2), ('weekends', 2), ('specific_days', 3),
+]
+CURRENCIES = [('USD', 60), ('EUR', 15), ('GBP', 10), ('JPY', 5), ('CAD', 5), ('CHF', 3), ('AUD', 2)]
+TITLES = ['Rent', 'Groceries', 'Netflix', 'Gym', 'Fuel', 'Coffee', 'Insurance',
+          'Phone', 'Internet', 'Dinner', 'Books', 'Parking', 'Electricity', 'Gift']
+
+
+def _pick(rng, weighted):
+    return rng.choices([v for v, _ in weighted], weights=[w for _, w in weighted])[0]
+
+
+def _expense(rng, user_id, categories, methods, today):
+    interval = _pick(rng, INTERVALS)
+    currency = _pick(rng, CURRENCIES)
+    # Mostly backdated up to three years, some scheduled in the next two months
+    billing = today - timedelta(days=rng.randint(-60, 3 * 365))
+    amount = round(rng.lognormvariate(3.5, 1.0) * (100 if currency == 'JPY' else 1), 2)
+    return (
+        user_id, f'{rng.choice(TITLES)} #{rng.randint(1, 999)}', '', amount, currency,
+        rng.choice(categories) if rng.random() < 0.9 else None,
+        rng.choice(methods) if rng.random() < 0.7 else None,
+        billing.isoformat(), interval,
+        rng.randint(2, 45) if interval == 'custom' else 0,
+        ','.join(str(d) for d in sorted(rng.sample(range(7), rng.randint(1, 3))))
+        if interval == 'specific_days' else None,
+        1 if rng.random() < 0.9 else 0,
+    )
+
+
+def generate(path, users=10, expenses=1000, seed=42, today=None):
+    """Create (or extend) the database at ``path``; returns the new user ids."""
+    rng = random.Random(seed)
+    today = today or date.today()
+    db = connect(path)
+    db.executescript(SCHEMA)
+    migrate_db(db)
+    password_hash = generate_password_hash(BENCH_PASSWORD)
+    first = db.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+    user_ids = []
+    for n in range(first, first + users):
+        uid = db.execute('INSERT INTO users (username, password_hash) VALUES (?,?)',
+                         (f'bench{n}', password_hash)).lastrowid
+        user_ids.append(uid)
+        defaults.seed(db, uid)
+        categories = [r[0] for r in db.execute('SELECT id FROM categories WHERE user_id=?', (uid,))]
+        methods = [r[0] for r in db.execute('SELECT id FROM payment_methods WHERE user_id=?', (uid,))]
+        db.executemany('''
+            INSERT INTO expenses (user_id,title,description,amount,currency,category_id,
+                payment_method_id,billing_date,billing_interval,custom_interval_days,
+                specific_days,is_active)
+            VALUES (?,?,?,?,?,?,?,?,?,?,?,?)
+        ''', [_expense(rng, uid, categories, methods, today) for _ in range(expenses)])
+    # A current rate snapshot keeps benchmark runs off the network
+    db.execute('''
+        INSERT INTO rate_snapshots (api_url, rates, fetched_at, refresh_until) VALUES (?,?,?,0)
+        ON CONFLICT(api_url) DO UPDATE SET rates=excluded.rates, fetched_at=excluded.fetched_at
+    ''', (DEFAULT_API_URL, json.dumps(FALLBACK_RATES), time.time()))
+    db.commit()
+    db.close()
+    return user_ids
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate a synthetic benchmark database.')
+    parser.add_argument('path')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--expenses', type=int, default=1000, help='expenses per user')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+    started = time.perf_counter()
+    ids = generate(os.path.abspath(args.path), args.users, args.expenses, args.seed)
+    print(f'{len(ids)} users x {args.expenses} expenses in {time.perf_counter() - started:.1f}s')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""Time the main routes through the Flask test client.
+
+Usage::
+
+    python -m bench.run [--users N] [--expenses M] [--iterations K] [--out FILE]
+
+A fresh database is generated in a temporary directory (or ``--db`` is
+reused as is) and each scenario runs ``K`` times after one warm-up call.
+Per scenario the report has p50/p95/p99/mean latency in milliseconds and
+the mean number of SQL statements per request; the run records peak RSS.
+Results go to ``bench/results/<commit>.json`` unless ``--out`` is given.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+_queries = [0]
+
+
+def _count_statements(db):
+    db.set_trace_callback(lambda _sql: _queries.__setitem__(0, _queries[0] + 1))
+    return db
+
+
+def _percentiles(samples):
+    ordered = sorted(samples)
+    if len(ordered) < 2:
+        return {'p50': ordered[0], 'p95': ordered[0], 'p99': ordered[0]}
+    cuts = statistics.quantiles(ordered, n=100, method='inclusive')
+    return {'p50': cuts[49], 'p95': cuts[94], 'p99': cuts[98]}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True, cwd=os.path.dirname(RESULTS_DIR)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def _scenarios(client, uid, invalidate):
+    """Return ``[(name, setup, request)]``; setup runs untimed before each request."""
+    today = date.today()
+    months = iter(range(10 ** 9))
+
+    def next_month():
+        i = next(months)
+        return f'/api/calendar?year={today.year - i // 12 % 3}&month={i % 12 + 1}'
+
+    def batch():
+        return client.post('/api/expenses/batch', json=[
+            {'op': 'create', 'data': {'title': f'Bulk {i}', 'amount': 9.5,
+                                      'billing_date': today.isoformat(),
+                                      'billing_interval': 'monthly'}}
+            for i in range(100)])
+
+    def login():
+        from bench.generate import BENCH_PASSWORD
+        with client.session_transaction() as sess:
+            sess.clear()
+        resp = client.post('/login', data={'username': 'bench0', 'password': BENCH_PASSWORD})
+        with client.session_transaction() as sess:
+            sess['user_id'] = uid
+        return resp
+
+    def cold():
+        # Measure the compute path, not the result cache
+        invalidate(uid)
+
+    return [
+        ('get_expenses', cold, lambda: client.get('/api/expenses')),
+        ('get_expenses_page', cold, lambda: client.get('/api/expenses?limit=100&sort=date-desc')),
+        ('get_stats_summary', cold, lambda: client.get('/api/stats/summary')),
+        ('get_stats_summary_cached', None, lambda: client.get('/api/stats/summary')),
+        ('get_stats_analytics', cold, lambda: client.get('/api/stats/analytics')),
+        ('get_calendar_data', cold, lambda: client.get(next_month())),
+        ('get_calendar_range_year', cold, lambda: client.get(
+            f'/api/calendar/range?start={today.year}-01-01&end={today.year}-12-31&granularity=month')),
+        ('get_upcoming_30d', cold, lambda: client.get('/api/upcoming?days=30')),
+        ('login', None, login),
+        ('bulk_write_100', None, batch),
+    ]
+
+
+def run(db_path, iterations):
+    import config
+    config.DATABASE = db_path
+    config.LOGIN_RATE_PER_MINUTE = config.LOGIN_BURST = 10 ** 9
+    # Imported late: app.py opens config.DATABASE at import time
+    import database
+    open_connection = database.connect
+    database.connect = lambda path: _count_statements(open_connection(path))
+    import resultcache
+    from app import app
+
+    client = app.test_client()
+    uid = database.connect(db_path).execute(
+        "SELECT id FROM users WHERE username='bench0'").fetchone()[0]
+    with client.session_transaction() as sess:
+        sess['user_id'] = uid
+        sess['username'] = 'bench0'
+
+    results = {}
+    for name, setup, call in _scenarios(client, uid, resultcache._cache.invalidate):
+        if setup:
+            setup()
+        call()   # warm-up: pool connections, rates snapshot, rollups
+        samples, queries, statuses = [], [], set()
+        for _ in range(iterations):
+            if setup:
+                setup()
+            _queries[0] = 0
+            started = time.perf_counter()
+            resp = call()
+            samples.append((time.perf_counter() - started) * 1000)
+            queries.append(_queries[0])
+            statuses.add(resp.status_code)
+        results[name] = {
+            **{k: round(v, 3) for k, v in _percentiles(samples).items()},
+            'mean': round(statistics.fmean(samples), 3),
+            'min': round(min(samples), 3),
+            'max': round(max(samples), 3),
+            'queries_per_request': round(statistics.fmean(queries), 2),
+            'statuses': sorted(statuses),
+        }
+        print(f"{name:28} p50 {results[name]['p50']:9.2f} ms   p95 {results[name]['p95']:9.2f} ms"
+              f"   p99 {results[name]['p99']:9.2f} ms   {results[name]['queries_per_request']:6.1f} q/req")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the main API routes.')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--expenses', type=int, default=1000, help='expenses per user')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--db', help='reuse an existing generated database')
+    parser.add_argument('--out', help='result file (default: bench/results/<commit>.json)')
+    args = parser.parse_args(argv)
+
+    from bench.generate import generate
+    tmp = None
+    db_path = os.path.abspath(args.db) if args.db else None
+    if db_path is None:
+        tmp = tempfile.TemporaryDirectory()
+        db_path = os.path.join(tmp.name, 'bench.db')
+        generate(db_path, args.users, args.expenses, args.seed)
+    try:
+        scenarios = run(db_path, args.iterations)
+    finally:
+        if tmp:
+            tmp.cleanup()
+
+    commit = _git_commit()
+    report = {
+        'commit': commit,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'users': args.users,
+        'expenses_per_user': args.expenses,
+        'iterations': args.iterations,
+        'seed': args.seed,
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                             / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1),
+        'scenarios': scenarios,
+    }
+    out = args.out or os.path.join(RESULTS_DIR, f'{commit}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"peak RSS {report['peak_rss_mb']} MB -> {out}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""Search latency as the database grows around one user.
+
+Usage::
+
+    python -m bench.search [--users 1,50,200] [--expenses N] [--iterations K] [--out FILE]
+
+For each user count a database with that many users of ``--expenses``
+expenses each is generated, and user 1's ``/api/expenses/search`` (FTS5) is
+timed against the LIKE filter of ``/api/expenses?q=`` for a rare term (a
+title number) and a common one (a title word). Both return at most 50 rows.
+The caller's own data is the same in every run, so the latency should not
+follow ``total_rows``. Results go to ``bench/results/search-<commit>.json``.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+from bench.run import RESULTS_DIR, _git_commit, _percentiles
+
+QUERIES = {'rare': '41', 'common': 'netflix'}
+ROUTES = {
+    'fts': '/api/expenses/search?q={q}&limit=50',
+    'like': '/api/expenses?q={q}&limit=50&sort=date-desc',
+}
+
+
+def run(paths, iterations):
+    import config
+    config.DATABASE = paths[0][1]
+    from app import app
+
+    report = {}
+    for users, path in paths:
+        app.config['DATABASE'] = path
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = 1
+        db = sqlite3.connect(path)
+        report[users] = {'total_rows': db.execute('SELECT COUNT(*) FROM expenses').fetchone()[0]}
+        db.close()
+        for term, q in QUERIES.items():
+            for route, url in ROUTES.items():
+                url = url.format(q=q)
+                hits = len(client.get(url).get_json()['items'])     # warm-up
+                samples = []
+                for _ in range(iterations):
+                    started = time.perf_counter()
+                    client.get(url)
+                    samples.append((time.perf_counter() - started) * 1000)
+                report[users][f'{route}_{term}'] = {
+                    **{k: round(v, 3) for k, v in _percentiles(samples).items()}, 'hits': hits}
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark full-text search.')
+    parser.add_argument('--users', default='1,50,200',
+                        help='comma-separated user counts')
+    parser.add_argument('--expenses', type=int, default=500, help='expenses per user')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--out', help='result file (default: bench/results/search-<commit>.json)')
+    args = parser.parse_args(argv)
+    counts = [int(s) for s in args.users.split(',')]
+
+    from bench.generate import generate
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for users in counts:
+            path = os.path.join(tmp, f'search-{users}.db')
+            generate(path, users=users, expenses=args.expenses)
+            paths.append((users, path))
+        result = run(paths, args.iterations)
+
+    commit = _git_commit()
+    report = {'commit': commit, 'iterations': args.iterations,
+              'expenses_per_user': args.expenses, 'users': result}
+    print(json.dumps(report, indent=2))
+    out = args.out or os.path.join(RESULTS_DIR, f'search-{commit}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,3 +4,67 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 SECRET_KEY = os.environ.get('SECRET_KEY', 'dev-expense-tracker-secret-key-change-in-production')
 DATABASE = os.path.join(BASE_DIR, os.environ.get('DATABASE', 'expense_tracker.db'))
 DEBUG = os.environ.get('FLASK_DEBUG', 'True').lower() == 'true'
+
+# Exchange-rate cache (seconds)
+RATES_TTL = int(os.environ.get('RATES_TTL', 6 * 60 * 60))
+RATES_LEASE = int(os.environ.get('RATES_LEASE', 30))
+RATES_LEASE_POLL = float(os.environ.get('RATES_LEASE_POLL', 0.25))
+RATES_TIMEOUT = float(os.environ.get('RATES_TIMEOUT', 10))
+RATES_BREAKER_FAILURES = int(os.environ.get('RATES_BREAKER_FAILURES', 3))
+RATES_BREAKER_RESET = int(os.environ.get('RATES_BREAKER_RESET', 60))
+
+# New users read a shared set of default categories/payment methods and get
+# private copies only when they edit one (see defaults.py)
+SHARED_DEFAULTS = os.environ.get('SHARED_DEFAULTS', 'False').lower() == 'true'
+
+# Months of future occurrences kept in monthly_rollups
+ROLLUP_AHEAD_MONTHS = int(os.environ.get('ROLLUP_AHEAD_MONTHS', 12))
+
+# Window of materialised occurrences (schedule.py), in months around today
+SCHEDULE_PAST_MONTHS = int(os.environ.get('SCHEDULE_PAST_MONTHS', 3))
+SCHEDULE_AHEAD_MONTHS = int(os.environ.get('SCHEDULE_AHEAD_MONTHS', 18))
+
+# Tombstones of deleted rows kept for /api/sync delta clients (sync.py prune)
+SYNC_TOMBSTONE_DAYS = int(os.environ.get('SYNC_TOMBSTONE_DAYS', 90))
+
+# Optional per-tenant storage: 'off', 'user' (one file per user) or 'bucket'
+# (DB_SHARD_BUCKETS files, by user id). DATABASE then only holds accounts.
+DB_SHARDING = os.environ.get('DB_SHARDING', 'off').lower()
+DB_SHARD_BUCKETS = int(os.environ.get('DB_SHARD_BUCKETS', 16))
+DB_SHARD_DIR = os.environ.get('DB_SHARD_DIR', '')       # default: shards/ next to DATABASE
+DB_OPEN_SHARDS = int(os.environ.get('DB_OPEN_SHARDS', 64))  # shard pools kept open per worker
+
+# SQLite connections (per worker pool; pragmas applied once per connection)
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+DB_JOURNAL_MODE = os.environ.get('DB_JOURNAL_MODE', 'WAL')
+DB_SYNCHRONOUS = os.environ.get('DB_SYNCHRONOUS', 'NORMAL')
+DB_BUSY_TIMEOUT = int(os.environ.get('DB_BUSY_TIMEOUT', 5000))          # ms
+DB_CACHE_SIZE = int(os.environ.get('DB_CACHE_SIZE', -16000))            # negative = KiB
+DB_MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE', 128 * 1024 * 1024))   # bytes
+
+# Cached calendar/stats responses (per worker; optional shared SQLite tier)
+RESULT_CACHE_ENTRIES = int(os.environ.get('RESULT_CACHE_ENTRIES', 512))
+RESULT_CACHE_BYTES = int(os.environ.get('RESULT_CACHE_BYTES', 32 * 1024 * 1024))
+RESULT_CACHE_TTL = int(os.environ.get('RESULT_CACHE_TTL', 300))
+RESULT_CACHE_SHARED = os.environ.get('RESULT_CACHE_SHARED', 'False').lower() == 'true'
+
+# Instrumentation (see metrics.py); counters are per worker process
+SERVER_TIMING = os.environ.get('SERVER_TIMING', 'False').lower() == 'true'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')  # Bearer token for /metrics, /api/db/pool; unset = off
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))   # 0 = off
+PROFILE_THRESHOLD_MS = float(os.environ.get('PROFILE_THRESHOLD_MS', 500))
+PROFILE_DIR = os.path.join(BASE_DIR, os.environ.get('PROFILE_DIR', 'profiles'))
+
+# Response compression (gzip, or brotli when installed)
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 5))
+
+# Password hashing (werkzeug method string) and login rate limiting
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+PASSWORD_SALT_LENGTH = int(os.environ.get('PASSWORD_SALT_LENGTH', 16))
+HASH_WORKERS = int(os.environ.get('HASH_WORKERS', 2))          # 0 = hash inline
+HASH_MAX_PENDING = int(os.environ.get('HASH_MAX_PENDING', 16))
+HASH_TIMEOUT = float(os.environ.get('HASH_TIMEOUT', 10))
+LOGIN_RATE_PER_MINUTE = float(os.environ.get('LOGIN_RATE_PER_MINUTE', 10))
+LOGIN_BURST = int(os.environ.get('LOGIN_BURST', 5))
@@ -1,21 +1,308 @@
+import glob
+import logging
+import os
+import queue
 import sqlite3
-from flask import g, current_app
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from flask import g, current_app, session
 
+import config
+import resultcache
+from icons import migrate_inline_icons
+from metrics import InstrumentedConnection
 
-def get_db():
-    """Get database connection for the current request context."""
-    if '_database' not in g:
-        g._database = sqlite3.connect(current_app.config['DATABASE'])
-        g._database.row_factory = sqlite3.Row
-        g._database.execute("PRAGMA foreign_keys = ON")
-    return g._database
+# Applied once per connection, when it is opened
+PRAGMAS = (
+    ('foreign_keys', 'ON'),
+    ('synchronous', config.DB_SYNCHRONOUS),
+    ('busy_timeout', config.DB_BUSY_TIMEOUT),
+    ('cache_size', config.DB_CACHE_SIZE),
+    ('mmap_size', config.DB_MMAP_SIZE),
+)
+
+
+def connect(path):
+    """Open a configured connection outside the request-scoped one."""
+    db = sqlite3.connect(path, check_same_thread=False, factory=InstrumentedConnection)
+    db.row_factory = sqlite3.Row
+    for name, value in PRAGMAS:
+        db.execute(f"PRAGMA {name} = {value}")
+    return db
+
+
+class ConnectionPool:
+    """A per-process pool of configured connections to one database file.
+
+    Connections are opened lazily up to ``size``; when all are checked out,
+    callers wait up to ``timeout`` seconds. Connections are returned with
+    any open transaction rolled back.
+    """
+
+    def __init__(self, path, size, timeout):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._checked_out = {}      # id(conn) -> checkout time
+        self.metrics = {
+            'checkouts': 0, 'waits': 0, 'wait_seconds': 0.0, 'timeouts': 0,
+            'opened': 0, 'discarded': 0, 'held_seconds': 0.0, 'max_in_use': 0,
+        }
+
+    def acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._open_or_wait()
+        with self._lock:
+            self._checked_out[id(conn)] = time.perf_counter()
+            self.metrics['checkouts'] += 1
+            self.metrics['max_in_use'] = max(self.metrics['max_in_use'], len(self._checked_out))
+        return conn
+
+    def _open_or_wait(self):
+        with self._lock:
+            can_open = self._opened < self.size
+            if can_open:
+                self._opened += 1
+                self.metrics['opened'] += 1
+        if can_open:
+            try:
+                return connect(self.path)
+            except sqlite3.Error:
+                with self._lock:
+                    self._opened -= 1
+                raise
+        started = time.perf_counter()
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            with self._lock:
+                self.metrics['timeouts'] += 1
+            raise sqlite3.OperationalError('database connection pool exhausted')
+        finally:
+            with self._lock:
+                self.metrics['waits'] += 1
+                self.metrics['wait_seconds'] += time.perf_counter() - started
+
+    def release(self, conn):
+        with self._lock:
+            started = self._checked_out.pop(id(conn), None)
+            if started is not None:
+                self.metrics['held_seconds'] += time.perf_counter() - started
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # Broken connection: drop it so a fresh one can be opened
+            with self._lock:
+                self._opened -= 1
+                self.metrics['discarded'] += 1
+            conn.close()
+            return
+        self._idle.put(conn)
+
+    def stats(self):
+        with self._lock:
+            return {**self.metrics, 'size': self.size, 'open': self._opened,
+                    'in_use': len(self._checked_out), 'idle': self._idle.qsize()}
+
+    def close_idle(self):
+        """Close the idle connections; returns False if any are checked out."""
+        with self._lock:
+            if self._checked_out:
+                return False
+            while True:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    return True
+                self._opened -= 1
+                conn.close()
+
+
+_pools = OrderedDict()          # path -> pool, least recently used first
+_pools_lock = threading.Lock()
+_pools_pid = os.getpid()
+
+
+def get_pool(path):
+    """Return this process's pool for ``path`` (pools never cross a fork).
+
+    At most ``DB_OPEN_SHARDS`` shard pools are kept; the least recently
+    used idle ones are closed beyond that.
+    """
+    global _pools_pid
+    with _pools_lock:
+        if _pools_pid != os.getpid():
+            _pools.clear()
+            _pools_pid = os.getpid()
+        pool = _pools.get(path)
+        if pool is None:
+            pool = _pools[path] = ConnectionPool(path, config.DB_POOL_SIZE, config.DB_POOL_TIMEOUT)
+            if config.DB_SHARDING != 'off':
+                _evict_shard_pools()
+        _pools.move_to_end(path)
+        return pool
+
+
+def _evict_shard_pools():
+    shard_pools = [p for p in _pools if _is_shard(p)]
+    for path in shard_pools[:max(0, len(shard_pools) - config.DB_OPEN_SHARDS)]:
+        if _pools[path].close_idle():
+            del _pools[path]
+
+
+def pool_stats():
+    """Metrics for every pool in this process, keyed by database path."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {p.path: p.stats() for p in pools}
+
+
+@contextmanager
+def pooled(path):
+    """Check a connection out of the pool for code outside a request."""
+    pool = get_pool(path)
+    db = pool.acquire()
+    try:
+        yield db
+    finally:
+        pool.release(db)
+
+
+# ─── Sharding ─────────────────────────────────────────────────────────────────
+# With DB_SHARDING=user or bucket, per-user data lives in shard files under
+# DB_SHARD_DIR and config.DATABASE is only the directory (accounts, rate
+# snapshots). Shards carry the full schema, including a stub users row per
+# user so foreign keys hold; their ids are the directory's user ids.
+
+# Per-user tables, in an order that satisfies foreign keys when copying
+USER_TABLES = ('user_settings', 'categories', 'payment_methods', 'icon_uploads', 'expenses',
+               'monthly_rollups', 'rollup_horizons', 'occurrences', 'schedule_windows',
+               'data_versions', 'template_overrides', 'sync_floors', 'sync_log')
+
+_prepared = set()               # (shard path, user id) known to exist in this process
+_prepare_lock = threading.Lock()
+
+
+def shard_dir(directory):
+    return config.DB_SHARD_DIR or os.path.join(os.path.dirname(os.path.abspath(directory)), 'shards')
+
+
+def _is_shard(path):
+    return os.path.basename(path).startswith(('shard-', 'user-'))
+
+
+def db_path(user_id=None, directory=None):
+    """The database file holding ``user_id``'s data.
+
+    That is the directory file itself (``directory``, default the app's
+    DATABASE) when sharding is off or there is no user.
+    """
+    directory = directory or current_app.config['DATABASE']
+    if config.DB_SHARDING == 'off' or user_id is None:
+        return directory
+    if config.DB_SHARDING == 'user':
+        name = f'user-{user_id}.db'
+    else:
+        name = f'shard-{user_id % config.DB_SHARD_BUCKETS:03d}.db'
+    return os.path.join(shard_dir(directory), name)
+
+
+def data_paths(directory):
+    """Every database file that holds user data."""
+    if config.DB_SHARDING == 'off':
+        return [directory]
+    return sorted(glob.glob(os.path.join(shard_dir(directory), '*.db')))
+
+
+def user_databases(directory, user_id=None):
+    """Yield ``(connection, user ids)`` per file holding user data; for CLIs."""
+    paths = [db_path(user_id, directory)] if user_id is not None else data_paths(directory)
+    for path in paths:
+        db = connect(path)
+        try:
+            if user_id is not None:
+                yield db, [user_id]
+            else:
+                yield db, [r[0] for r in db.execute('SELECT id FROM users ORDER BY id')]
+        finally:
+            db.close()
+
+
+def prepare_shard(path, user_id=None, username=None):
+    """Create/migrate a shard on first use in this process and add the user's stub row."""
+    if (path, user_id) in _prepared:
+        return
+    with _prepare_lock:
+        if (path, user_id) in _prepared:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with pooled(path) as db:
+            if (path, None) not in _prepared:
+                db.execute(f"PRAGMA journal_mode = {config.DB_JOURNAL_MODE}")
+                db.executescript(SCHEMA)
+                migrate_db(db)
+                _prepared.add((path, None))
+            if user_id is not None:
+                # Accounts live in the directory; '!' never verifies as a password
+                db.execute("INSERT OR IGNORE INTO users (id, username, password_hash) "
+                           "VALUES (?, ?, '!')", (user_id, username or f' user {user_id}'))
+                db.commit()
+                _prepared.add((path, user_id))
+
+
+def _request_connection(path):
+    conns = g.setdefault('_databases', {})
+    if path not in conns:
+        conns[path] = get_pool(path).acquire()
+    return conns[path]
+
+
+def get_db(user_id=None):
+    """Connection for the current request to ``user_id``'s database.
+
+    ``user_id`` defaults to the signed-in user. Without sharding every user
+    maps to the main database file, so this is one connection per request.
+    """
+    if user_id is None:
+        user_id = session.get('user_id')
+    path = db_path(user_id)
+    if path != current_app.config['DATABASE']:
+        prepare_shard(path, user_id)
+    return _request_connection(path)
+
+
+def get_directory_db():
+    """Connection for the current request to the accounts directory (``users``)."""
+    return _request_connection(current_app.config['DATABASE'])
 
 
 def close_db(e=None):
-    """Close database connection at end of request."""
-    db = g.pop('_database', None)
-    if db is not None:
-        db.close()
+    """Return the request's connections to their pools at end of request."""
+    for path, db in g.pop('_databases', {}).items():
+        get_pool(path).release(db)
+
+
+def data_version(db, user_id):
+    """Return the user's data version (0 until their first write)."""
+    row = db.execute('SELECT version FROM data_versions WHERE user_id=?', (user_id,)).fetchone()
+    return row[0] if row else 0
+
+
+def bump_data_version(db, user_id):
+    """Mark the user's data as changed; call inside the writing transaction."""
+    db.execute('''
+        INSERT INTO data_versions (user_id, version) VALUES (?, 1)
+        ON CONFLICT(user_id) DO UPDATE SET version = version + 1
+    ''', (user_id,))
+    resultcache.invalidate(db, user_id)
 
 
 def migrate_db(db):
@@ -46,6 +333,10 @@ def migrate_db(db):
     if 'specific_days' not in expenses_cols:
         db.execute("ALTER TABLE expenses ADD COLUMN specific_days TEXT")
 
+    cursor.execute("PRAGMA table_info(user_settings)")
+    if 'uses_templates' not in {row[1] for row in cursor.fetchall()}:
+        db.execute("ALTER TABLE user_settings ADD COLUMN uses_templates INTEGER DEFAULT 0")
+
     # Drop legacy consumption_items table if it exists
     db.execute("DROP TABLE IF EXISTS consumption_items")
     
@@ -61,20 +352,97 @@ def migrate_db(db):
             FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
         )
     """)
-    
+    cursor.execute("PRAGMA table_info(icon_uploads)")
+    if 'content_hash' not in {row[1] for row in cursor.fetchall()}:
+        db.execute("ALTER TABLE icon_uploads ADD COLUMN content_hash TEXT")
+
+    # Uploaded icons are stored once by content hash, not inline in rows
+    migrate_inline_icons(db)
+
+    # Per-user indexes so queries only touch the current user's rows
+    for name, table, columns in INDEXES:
+        db.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+
+    migrate_search_index(db)
+
     db.commit()
 
 
+def migrate_search_index(db):
+    """Create the expenses_fts full-text index and the triggers that sync it.
+
+    The index stores only tokens (``content='expenses'``); a newly created
+    index is filled from the existing rows. Its last column holds the owner's
+    ``user_id`` as a token, so a search MATCHes on it and never ranks other
+    tenants' rows. An index from before that column is rebuilt. Without FTS5
+    in the SQLite build nothing is created and search falls back to LIKE.
+    """
+    if db.execute("SELECT 1 FROM sqlite_master WHERE name='expenses_fts'").fetchone():
+        if 'user_id' in [r[1] for r in db.execute('PRAGMA table_info(expenses_fts)')]:
+            return True
+        db.executescript("""
+            DROP TRIGGER IF EXISTS expenses_fts_insert;
+            DROP TRIGGER IF EXISTS expenses_fts_delete;
+            DROP TRIGGER IF EXISTS expenses_fts_update;
+            DROP TABLE expenses_fts;
+        """)
+    try:
+        db.execute("""
+            CREATE VIRTUAL TABLE expenses_fts USING fts5(
+                title, description, user_id, content='expenses', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3')
+        """)
+    except sqlite3.OperationalError as e:
+        logging.getLogger(__name__).warning('full-text search disabled: %s', e)
+        return False
+    db.executescript("""
+        CREATE TRIGGER IF NOT EXISTS expenses_fts_insert AFTER INSERT ON expenses BEGIN
+            INSERT INTO expenses_fts (rowid, title, description, user_id)
+            VALUES (new.id, new.title, new.description, new.user_id);
+        END;
+        CREATE TRIGGER IF NOT EXISTS expenses_fts_delete AFTER DELETE ON expenses BEGIN
+            INSERT INTO expenses_fts (expenses_fts, rowid, title, description, user_id)
+            VALUES ('delete', old.id, old.title, old.description, old.user_id);
+        END;
+        CREATE TRIGGER IF NOT EXISTS expenses_fts_update AFTER UPDATE OF title, description, user_id
+        ON expenses BEGIN
+            INSERT INTO expenses_fts (expenses_fts, rowid, title, description, user_id)
+            VALUES ('delete', old.id, old.title, old.description, old.user_id);
+            INSERT INTO expenses_fts (rowid, title, description, user_id)
+            VALUES (new.id, new.title, new.description, new.user_id);
+        END;
+    """)
+    db.execute("INSERT INTO expenses_fts (expenses_fts) VALUES ('rebuild')")
+    return True
+
+
 def init_db(app):
     """Initialize database with schema."""
     app.teardown_appcontext(close_db)
     with app.app_context():
-        db = get_db()
+        db = get_directory_db()
+        # Persistent per database file: readers no longer block on writers
+        db.execute(f"PRAGMA journal_mode = {config.DB_JOURNAL_MODE}")
         db.executescript(SCHEMA)
         migrate_db(db)
         db.commit()
 
 
+INDEXES = [
+    ('idx_expenses_user_date', 'expenses', 'user_id, billing_date'),
+    ('idx_expenses_user_active_interval', 'expenses', 'user_id, is_active, billing_interval'),
+    ('idx_expenses_user_category', 'expenses', 'user_id, category_id'),
+    # Used by the ON DELETE SET NULL actions when a category/method is removed
+    ('idx_expenses_category', 'expenses', 'category_id'),
+    ('idx_expenses_payment_method', 'expenses', 'payment_method_id'),
+    ('idx_categories_user', 'categories', 'user_id, name'),
+    ('idx_payment_methods_user', 'payment_methods', 'user_id, name'),
+    ('idx_icon_uploads_user', 'icon_uploads', 'user_id'),
+    # Per-expense regeneration and the ON DELETE CASCADE from expenses
+    ('idx_occurrences_expense', 'occurrences', 'expense_id'),
+]
+
+
 SCHEMA = """
 CREATE TABLE IF NOT EXISTS users (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -92,6 +460,7 @@ CREATE TABLE IF NOT EXISTS user_settings (
     color_scheme TEXT DEFAULT 'ocean',
     custom_colors TEXT DEFAULT '{}',
     date_format TEXT DEFAULT 'YYYY-MM-DD',
+    uses_templates INTEGER DEFAULT 0,
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
 );
 
@@ -116,6 +485,14 @@ CREATE TABLE IF NOT EXISTS payment_methods (
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
 );
 
+CREATE TABLE IF NOT EXISTS template_overrides (
+    user_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    template_id INTEGER NOT NULL,
+    PRIMARY KEY (user_id, kind, template_id),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
 CREATE TABLE IF NOT EXISTS expenses (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     user_id INTEGER NOT NULL,
@@ -143,7 +520,116 @@ CREATE TABLE IF NOT EXISTS icon_uploads (
     filename TEXT NOT NULL,
     data BLOB NOT NULL,
     mime_type TEXT DEFAULT 'image/png',
+    content_hash TEXT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
 );
+
+CREATE TABLE IF NOT EXISTS monthly_rollups (
+    user_id INTEGER NOT NULL,
+    month TEXT NOT NULL,
+    category_id INTEGER NOT NULL DEFAULT 0,
+    payment_method_id INTEGER NOT NULL DEFAULT 0,
+    currency TEXT NOT NULL,
+    total REAL DEFAULT 0,
+    count INTEGER DEFAULT 0,
+    PRIMARY KEY (user_id, month, category_id, payment_method_id, currency),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS rollup_horizons (
+    user_id INTEGER PRIMARY KEY,
+    horizon TEXT NOT NULL,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS occurrences (
+    user_id INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    expense_id INTEGER NOT NULL,
+    PRIMARY KEY (user_id, day, expense_id),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    FOREIGN KEY (expense_id) REFERENCES expenses(id) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS schedule_windows (
+    user_id INTEGER PRIMARY KEY,
+    start TEXT NOT NULL,
+    end TEXT NOT NULL,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS data_versions (
+    user_id INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS result_cache (
+    user_id INTEGER NOT NULL,
+    tag TEXT NOT NULL,
+    body BLOB NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (user_id, tag),
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS rate_snapshots (
+    api_url TEXT PRIMARY KEY,
+    rates TEXT,
+    fetched_at REAL DEFAULT 0,
+    refresh_until REAL DEFAULT 0
+);
+
+-- No foreign key: delete triggers write here while a user's rows cascade away
+CREATE TABLE IF NOT EXISTS sync_log (
+    user_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    row_id INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, kind, row_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_sync_log_version ON sync_log (user_id, version);
+
+CREATE TABLE IF NOT EXISTS sync_floors (
+    user_id INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+
+-- Hiding a shared default row is a delete as far as the user can tell
+CREATE TRIGGER IF NOT EXISTS template_overrides_sync AFTER INSERT ON template_overrides BEGIN
+    INSERT INTO sync_log (user_id, kind, row_id, version, deleted)
+    VALUES (new.user_id, new.kind, new.template_id,
+            COALESCE((SELECT version FROM data_versions WHERE user_id = new.user_id), 0) + 1, 1)
+    ON CONFLICT(user_id, kind, row_id) DO UPDATE SET
+        version = excluded.version, deleted = 1, changed_at = CURRENT_TIMESTAMP;
+END;
 """
+
+# kind -> (table, key column) of the rows /api/sync replicates (see sync.py)
+SYNC_KINDS = {
+    'expense': ('expenses', 'id'),
+    'category': ('categories', 'id'),
+    'payment_method': ('payment_methods', 'id'),
+    'settings': ('user_settings', 'user_id'),
+}
+
+# Each write is logged under the version the writing transaction's
+# bump_data_version() will set; deletes leave a tombstone. An upsert, not
+# INSERT OR REPLACE: inside the triggers that ON DELETE SET NULL fires, the
+# outer statement's ABORT would override REPLACE.
+SCHEMA += ''.join(f'''
+CREATE TRIGGER IF NOT EXISTS {table}_sync_{event.lower()} AFTER {event} ON {table} BEGIN
+    INSERT INTO sync_log (user_id, kind, row_id, version, deleted)
+    VALUES ({row}.user_id, '{kind}', {row}.{key},
+            COALESCE((SELECT version FROM data_versions WHERE user_id = {row}.user_id), 0) + 1,
+            {int(event == 'DELETE')})
+    ON CONFLICT(user_id, kind, row_id) DO UPDATE SET
+        version = excluded.version, deleted = excluded.deleted, changed_at = CURRENT_TIMESTAMP;
+END;
+''' for kind, (table, key) in SYNC_KINDS.items()
+    for event, row in (('INSERT', 'new'), ('UPDATE', 'new'), ('DELETE', 'old')))
@@ -0,0 +1,148 @@
+"""Default categories and payment methods for new users.
+
+:func:`seed` gives a new user their settings row and, normally, private
+copies of the defaults, using one ``executemany`` per table inside the
+caller's transaction.
+
+With ``SHARED_DEFAULTS`` on, new users get no copies. Instead they see a
+single shared template set, owned by the system user ``TEMPLATE_USERNAME``,
+merged into their own rows (:func:`visible`). The first time a user edits a
+template row, :func:`materialise` gives them a private copy and moves their
+expenses and rollups over to it. Deleting a template row (:func:`hide`)
+only records that this user no longer sees it. Either way the
+``template_overrides`` table records that the template row is hidden for
+that user.
+"""
+import rollups
+
+DEFAULT_CATEGORIES = [
+    ('Housing', '🏠', '#6366f1'), ('Food & Dining', '🍔', '#f59e0b'),
+    ('Transport', '🚗', '#10b981'), ('Entertainment', '🎬', '#ec4899'),
+    ('Shopping', '🛍️', '#8b5cf6'), ('Health', '💊', '#ef4444'),
+    ('Utilities', '💡', '#06b6d4'), ('Education', '📚', '#f97316'),
+    ('Subscriptions', '🔄', '#a855f7'), ('Insurance', '🛡️', '#14b8a6'),
+    ('Savings', '🏦', '#22c55e'), ('Other', '📌', '#64748b'),
+]
+DEFAULT_PAYMENT_METHODS = [
+    ('Cash', '💵'), ('Credit Card', '💳'), ('Debit Card', '🏧'),
+    ('Bank Transfer', '🏦'), ('PayPal', '🅿️'), ('Crypto', '₿'),
+]
+
+# Login and registration strip usernames, so nobody can sign in as this user
+TEMPLATE_USERNAME = ' templates'
+# Below every real id, so it cannot collide with user stubs in shard files
+TEMPLATE_USER_ID = -1
+
+# kind -> (table, expenses column)
+KINDS = {
+    'category': ('categories', 'category_id'),
+    'payment_method': ('payment_methods', 'payment_method_id'),
+}
+
+
+def _insert_defaults(db, user_id):
+    db.executemany('INSERT INTO categories (user_id,name,icon,color) VALUES (?,?,?,?)',
+                   [(user_id, *c) for c in DEFAULT_CATEGORIES])
+    db.executemany('INSERT INTO payment_methods (user_id,name,icon) VALUES (?,?,?)',
+                   [(user_id, *m) for m in DEFAULT_PAYMENT_METHODS])
+
+
+def seed(db, user_id, shared=False):
+    """Settings plus default categories/payment methods; the caller commits."""
+    db.execute('INSERT INTO user_settings (user_id, uses_templates) VALUES (?,?)',
+               (user_id, int(shared)))
+    if shared:
+        ensure_templates(db)
+    else:
+        _insert_defaults(db, user_id)
+
+
+def ensure_templates(db):
+    """Create the template user and its rows if missing; returns its id."""
+    row = db.execute('SELECT id FROM users WHERE username=?', (TEMPLATE_USERNAME,)).fetchone()
+    if row:
+        return row[0]
+    # '!' is not a valid werkzeug hash, so password checks always fail
+    db.execute("INSERT INTO users (id, username, password_hash) VALUES (?, ?, '!')",
+               (TEMPLATE_USER_ID, TEMPLATE_USERNAME))
+    _insert_defaults(db, TEMPLATE_USER_ID)
+    return TEMPLATE_USER_ID
+
+
+def _template_user(db, user_id):
+    """The template owner's id if ``user_id`` reads the shared set, else None."""
+    row = db.execute('''
+        SELECT t.id FROM user_settings s JOIN users t ON t.username=?
+        WHERE s.user_id=? AND s.uses_templates
+    ''', (TEMPLATE_USERNAME, user_id)).fetchone()
+    return row[0] if row else None
+
+
+def visible(db, user_id, kind):
+    """The user's own rows plus the template rows they have not overridden."""
+    table = KINDS[kind][0]
+    template_user = _template_user(db, user_id)
+    if template_user is None:
+        return db.execute(f'SELECT * FROM {table} WHERE user_id=? ORDER BY name',
+                          (user_id,)).fetchall()
+    return db.execute(f'''
+        SELECT * FROM {table} WHERE user_id=?
+        UNION ALL
+        SELECT * FROM {table} WHERE user_id=? AND id NOT IN (
+            SELECT template_id FROM template_overrides WHERE user_id=? AND kind=?)
+        ORDER BY name
+    ''', (user_id, template_user, user_id, kind)).fetchall()
+
+
+def visible_ids(db, user_id, kind):
+    return {r['id'] for r in visible(db, user_id, kind)}
+
+
+def _visible_template(db, user_id, kind, row_id):
+    """The template row ``row_id`` if this user currently sees it."""
+    template_user = _template_user(db, user_id)
+    if template_user is None:
+        return None
+    table = KINDS[kind][0]
+    return db.execute(f'''
+        SELECT * FROM {table} WHERE id=? AND user_id=? AND id NOT IN (
+            SELECT template_id FROM template_overrides WHERE user_id=? AND kind=?)
+    ''', (row_id, template_user, user_id, kind)).fetchone()
+
+
+def _override(db, user_id, kind, template_id):
+    db.execute('INSERT OR IGNORE INTO template_overrides (user_id, kind, template_id) '
+               'VALUES (?,?,?)', (user_id, kind, template_id))
+
+
+def materialise(db, user_id, kind, row_id):
+    """Copy-on-write: give the user their own copy of template row ``row_id``.
+
+    Returns the id of the copy, or None if ``row_id`` is not a template row
+    this user sees (e.g. it is already one of their own rows).
+    """
+    template = _visible_template(db, user_id, kind, row_id)
+    if template is None:
+        return None
+    table, column = KINDS[kind]
+    fields = [k for k in template.keys() if k not in ('id', 'user_id')]
+    new_id = db.execute(
+        f'INSERT INTO {table} (user_id,{",".join(fields)}) VALUES (?{",?" * len(fields)})',
+        (user_id, *(template[k] for k in fields))).lastrowid
+    _override(db, user_id, kind, row_id)
+    db.execute(f'UPDATE expenses SET {column}=? WHERE user_id=? AND {column}=?',
+               (new_id, user_id, row_id))
+    rollups.reassign(db, user_id, column, row_id, new_id)
+    return new_id
+
+
+def hide(db, user_id, kind, row_id):
+    """Delete a template row for this user only; returns False if not one."""
+    if _visible_template(db, user_id, kind, row_id) is None:
+        return False
+    column = KINDS[kind][1]
+    _override(db, user_id, kind, row_id)
+    db.execute(f'UPDATE expenses SET {column}=NULL WHERE user_id=? AND {column}=?',
+               (user_id, row_id))
+    rollups.reassign(db, user_id, column, row_id)
+    return True
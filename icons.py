@@ -0,0 +1,81 @@
+"""Content-addressed storage for uploaded category/payment icons.
+
+Image bytes live once per user in ``icon_uploads`` keyed by their SHA-256
+(per user so an account deletion never takes another user's icon); category
+and payment-method rows only carry the ``/api/icons/<hash>`` URL in their
+``icon`` column, so list endpoints stay small and browsers can cache the
+image forever.
+"""
+import base64
+import binascii
+import hashlib
+
+ALLOWED_TYPES = {'image/png', 'image/jpeg', 'image/webp', 'image/svg+xml'}
+MAX_ICON_BYTES = 512 * 1024
+URL_PREFIX = '/api/icons/'
+
+
+def icon_url(digest):
+    return URL_PREFIX + digest
+
+
+def parse_data_url(value):
+    """Return (bytes, mime_type) for a base64 image data-URL, else None."""
+    if not isinstance(value, str) or not value.startswith('data:'):
+        return None
+    header, _, payload = value.partition(',')
+    mime = header[5:].split(';')[0].lower()
+    if ';base64' not in header or mime not in ALLOWED_TYPES:
+        return None
+    try:
+        return base64.b64decode(payload, validate=True), mime
+    except (binascii.Error, ValueError):
+        return None
+
+
+def store(db, user_id, data, mime_type, filename='icon'):
+    """Store image bytes once and return their content hash."""
+    digest = hashlib.sha256(data).hexdigest()
+    db.execute('''
+        INSERT OR IGNORE INTO icon_uploads (user_id, filename, data, mime_type, content_hash)
+        VALUES (?,?,?,?,?)
+    ''', (user_id, filename, data, mime_type, digest))
+    return digest
+
+
+def externalize(db, user_id, icon, icon_data=None):
+    """Move an inline data-URL icon into ``icon_uploads``.
+
+    Returns the (icon, icon_type, icon_data) to store on the row; values
+    that are not data-URLs are returned unchanged.
+    """
+    for value in (icon_data, icon):
+        parsed = parse_data_url(value)
+        if parsed and len(parsed[0]) <= MAX_ICON_BYTES:
+            return icon_url(store(db, user_id, *parsed)), 'upload', None
+    return icon, None, icon_data
+
+
+def migrate_inline_icons(db):
+    """Backfill content hashes and move data-URLs out of existing rows."""
+    for row in db.execute(
+            'SELECT id, user_id, data FROM icon_uploads WHERE content_hash IS NULL').fetchall():
+        digest = hashlib.sha256(row['data']).hexdigest()
+        if db.execute('SELECT 1 FROM icon_uploads WHERE user_id=? AND content_hash=?',
+                      (row['user_id'], digest)).fetchone():
+            db.execute('DELETE FROM icon_uploads WHERE id=?', (row['id'],))
+        else:
+            db.execute('UPDATE icon_uploads SET content_hash=? WHERE id=?', (digest, row['id']))
+    db.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_icon_uploads_user_hash ON icon_uploads (user_id, content_hash)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_icon_uploads_content ON icon_uploads (content_hash)')
+
+    for table in ('categories', 'payment_methods'):
+        rows = db.execute(f'''
+            SELECT id, user_id, icon, icon_data FROM {table}
+            WHERE icon LIKE 'data:%' OR icon_data LIKE 'data:%'
+        ''').fetchall()
+        for row in rows:
+            icon, icon_type, icon_data = externalize(db, row['user_id'], row['icon'], row['icon_data'])
+            if icon_type:
+                db.execute(f'UPDATE {table} SET icon=?, icon_type=?, icon_data=? WHERE id=?',
+                           (icon, icon_type, icon_data, row['id']))
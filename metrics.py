@@ -0,0 +1,217 @@
+"""Request and SQL instrumentation.
+
+Connections opened by ``database.connect`` are :class:`InstrumentedConnection`
+objects. While a request is active they time every ``execute`` /
+``executemany`` into that request's :class:`RequestStats` (statement time up
+to the first row; iterating the cursor is not included).
+
+:func:`init_app` adds the Flask hooks that:
+
+* add a ``Server-Timing`` header (``app``, ``db`` with the query count, and
+  the slowest statement's :func:`statement_id`) when ``SERVER_TIMING`` is on;
+* record per-route histograms of wall time and queries per request, which
+  :func:`render` formats for Prometheus (``/metrics``);
+* with ``PROFILE_SAMPLE_RATE`` > 0, run cProfile on a sample of requests and
+  dump the ones slower than ``PROFILE_THRESHOLD_MS`` into ``PROFILE_DIR``.
+
+All numbers are per worker process.
+"""
+import contextvars
+import cProfile
+import hashlib
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+
+from flask import current_app, g, request
+
+import config
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+
+_current = contextvars.ContextVar('request_stats', default=None)
+_lock = threading.Lock()
+_profiling = threading.Lock()    # one cProfile session at a time
+_durations = {}                  # (route, method) -> Histogram
+_query_counts = {}               # (route, method) -> Histogram
+_sql_seconds = {}                # (route, method) -> float
+_requests = {}                   # (route, method, status) -> int
+
+
+class RequestStats:
+    """SQL statements seen during one request."""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.slowest = ('', 0.0)
+
+    def add(self, sql, seconds):
+        self.queries += 1
+        self.sql_seconds += seconds
+        if seconds > self.slowest[1]:
+            self.slowest = (sql, seconds)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3 connection that reports statement timings to the current request."""
+
+    def execute(self, sql, parameters=()):
+        stats = _current.get()
+        if stats is None:
+            return super().execute(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            stats.add(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        stats = _current.get()
+        if stats is None:
+            return super().executemany(sql, seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            stats.add(sql, time.perf_counter() - started)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _before_request():
+    g._metrics_start = time.perf_counter()
+    g._metrics_token = _current.set(RequestStats())
+    g._profiler = None
+    if config.PROFILE_SAMPLE_RATE > 0 and random.random() < config.PROFILE_SAMPLE_RATE \
+            and _profiling.acquire(blocking=False):
+        g._profiler = cProfile.Profile()
+        g._profiler.enable()
+
+
+def _after_request(response):
+    started = g.pop('_metrics_start', None)
+    stats = _current.get()
+    if started is None or stats is None:
+        return response
+    wall = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    key = (route, request.method)
+
+    profiler = g.pop('_profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        _profiling.release()
+        if wall * 1000 >= config.PROFILE_THRESHOLD_MS:
+            _dump_profile(profiler, route, wall, stats)
+
+    with _lock:
+        _durations.setdefault(key, Histogram(DURATION_BUCKETS)).observe(wall)
+        _query_counts.setdefault(key, Histogram(QUERY_BUCKETS)).observe(stats.queries)
+        _sql_seconds[key] = _sql_seconds.get(key, 0.0) + stats.sql_seconds
+        status_key = (route, request.method, str(response.status_code))
+        _requests[status_key] = _requests.get(status_key, 0) + 1
+
+    if config.SERVER_TIMING:
+        timings = [
+            f'app;dur={(wall - stats.sql_seconds) * 1000:.2f}',
+            f'db;dur={stats.sql_seconds * 1000:.2f};desc="{stats.queries} queries"',
+        ]
+        if stats.queries:
+            timings.append(f'db-slowest;dur={stats.slowest[1] * 1000:.2f};'
+                           f'desc="{statement_id(stats.slowest[0])}"')
+        response.headers.add('Server-Timing', ', '.join(timings))
+    return response
+
+
+def _teardown_request(exc=None):
+    token = g.pop('_metrics_token', None)
+    if token is not None:
+        _current.reset(token)
+    profiler = g.pop('_profiler', None)
+    if profiler is not None:
+        # The request failed before after_request ran
+        profiler.disable()
+        _profiling.release()
+
+
+def statement_id(sql):
+    """Short hash of a statement, so headers name it without exposing the SQL.
+
+    Whitespace is normalised first; ``statement_id(sql)`` in a shell maps a
+    header value back to the query in the source.
+    """
+    return hashlib.sha1(' '.join(sql.split()).encode()).hexdigest()[:12]
+
+
+def _dump_profile(profiler, route, wall, stats):
+    os.makedirs(config.PROFILE_DIR, exist_ok=True)
+    name = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+    path = os.path.join(config.PROFILE_DIR,
+                        f'{time.strftime("%Y%m%d-%H%M%S")}-{name}-{int(wall * 1000)}ms.prof')
+    profiler.dump_stats(path)
+    current_app.logger.warning('profile: %s %s %.0f ms, %d queries -> %s', request.method,
+                               request.full_path, wall * 1000, stats.queries, path)
+
+
+def init_app(app):
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+
+
+def _labels(**labels):
+    return ','.join(f'{k}="{v}"' for k, v in labels.items())
+
+
+def _histogram_lines(name, histograms):
+    lines = [f'# TYPE {name} histogram']
+    for (route, method), h in sorted(histograms.items()):
+        labels = _labels(route=route, method=method)
+        for bound, count in zip(h.buckets, h.counts):
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {h.count}')
+        lines.append(f'{name}_sum{{{labels}}} {h.sum:.6f}')
+        lines.append(f'{name}_count{{{labels}}} {h.count}')
+    return lines
+
+
+def render(pools, cache):
+    """Prometheus text exposition of this process's metrics.
+
+    ``pools`` is ``database.pool_stats()`` and ``cache`` is
+    ``resultcache.stats()``; their counters are exported as gauges.
+    """
+    with _lock:
+        lines = _histogram_lines('http_request_duration_seconds', _durations)
+        lines += _histogram_lines('db_queries_per_request', _query_counts)
+        lines.append('# TYPE db_query_seconds_total counter')
+        lines += [f'db_query_seconds_total{{{_labels(route=r, method=m)}}} {v:.6f}'
+                  for (r, m), v in sorted(_sql_seconds.items())]
+        lines.append('# TYPE http_requests_total counter')
+        lines += [f'http_requests_total{{{_labels(route=r, method=m, status=s)}}} {v}'
+                  for (r, m, s), v in sorted(_requests.items())]
+    for path, stats in sorted(pools.items()):
+        for field, value in sorted(stats.items()):
+            lines.append(f'db_pool_{field}{{{_labels(database=os.path.basename(path))}}} {value}')
+    for field, value in sorted(cache.items()):
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            lines.append(f'result_cache_{field} {value}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,130 @@
+"""Compact response encodings for large list endpoints.
+
+``?format=columnar`` on /api/expenses and the calendar routes returns
+columns as parallel arrays, with categories and payment methods sent once
+as lookup tables keyed by id. Calendar occurrences become
+``[expense_id, day_offset]`` pairs counted from ``start``.
+
+:class:`FastJSONProvider` serialises with orjson when it is installed
+(stdlib json otherwise), and :func:`compress` gzip/brotli-encodes large
+JSON bodies for clients that accept it.
+"""
+import gzip
+from datetime import timedelta
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+import config
+from recurrence import occurrences
+
+try:
+    import orjson
+except ImportError:          # optional: stdlib json is used instead
+    orjson = None
+
+try:
+    import brotli
+except ImportError:          # optional: gzip only
+    brotli = None
+
+FORMATS = ('json', 'columnar')
+CATEGORY_FIELDS = {'category_name': 'name', 'category_icon': 'icon',
+                   'category_icon_type': 'icon_type', 'category_color': 'color'}
+PAYMENT_FIELDS = {'payment_method_name': 'name', 'payment_method_icon': 'icon',
+                  'payment_method_icon_type': 'icon_type'}
+CALENDAR_COLUMNS = ('id', 'title', 'amount', 'currency', 'converted_amount',
+                    'billing_interval', 'category_id', 'payment_method_id')
+COMPRESSIBLE = ('application/json', 'application/x-ndjson', 'text/csv')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, backed by orjson when available."""
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs.get('indent'):
+            return super().dumps(obj, **kwargs)
+        # Dates go through Flask's default hook so output matches stdlib mode
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_SORT_KEYS
+                            | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME).decode()
+
+
+def _lookups(rows):
+    """Category and payment-method tables for the ids referenced by ``rows``."""
+    categories, methods = {}, {}
+    for r in rows:
+        if r['category_id'] is not None and r['category_id'] not in categories:
+            categories[r['category_id']] = {v: r[k] for k, v in CATEGORY_FIELDS.items()}
+        if r['payment_method_id'] is not None and r['payment_method_id'] not in methods:
+            methods[r['payment_method_id']] = {v: r[k] for k, v in PAYMENT_FIELDS.items()}
+    return categories, methods
+
+
+def expense_columns(rows, keys):
+    """Columnar form of EXPENSE_SELECT rows; ``keys`` are the cursor's column names."""
+    transposed = list(zip(*rows)) or [()] * len(keys)
+    categories, methods = _lookups(rows)
+    return {
+        'format': 'columnar',
+        'columns': {k: list(col) for k, col in zip(keys, transposed)
+                    if k not in CATEGORY_FIELDS and k not in PAYMENT_FIELDS},
+        'categories': categories,
+        'payment_methods': methods,
+    }
+
+
+def calendar_columns(expenses, start, end, factors, scheduled=None):
+    """Columnar calendar for [start, end): each expense once, plus occurrence pairs.
+
+    ``scheduled`` is as for ``app.calendar_days``.
+    """
+    used, pairs = [], []
+    for e in expenses:
+        days = scheduled.get(e['id']) if scheduled is not None else occurrences(e, start, end)
+        if days:
+            used.append(e)
+            pairs += [[e['id'], (d - start).days] for d in days]
+    pairs.sort(key=lambda p: p[1])
+    categories, methods = _lookups(used)
+    columns = {k: [e[k] for e in used] for k in CALENDAR_COLUMNS if k != 'converted_amount'}
+    columns['converted_amount'] = [e['amount'] * factors.get(e['currency'], 1) for e in used]
+    return {
+        'format': 'columnar',
+        'start': start.isoformat(),
+        'end': (end - timedelta(days=1)).isoformat(),
+        'expenses': columns,
+        'categories': categories,
+        'payment_methods': methods,
+        'occurrences': pairs,
+    }
+
+
+def etag_variants(etag):
+    """The tag as sent for each content encoding :func:`compress` may apply."""
+    return (etag, f'{etag}-gzip', f'{etag}-br')
+
+
+def compress(response):
+    """after_request hook: encode large JSON/CSV bodies with br or gzip."""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE
+            or (response.content_length or 0) < config.COMPRESS_MIN_BYTES):
+        return response
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        encoding = 'br'
+        data = brotli.compress(response.get_data(), quality=config.COMPRESS_LEVEL)
+    elif accepted['gzip']:
+        encoding = 'gzip'
+        data = gzip.compress(response.get_data(), compresslevel=config.COMPRESS_LEVEL)
+    else:
+        return response
+    response.set_data(data)
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    etag, weak = response.get_etag()
+    if etag:
+        # A different byte stream needs a different validator
+        response.set_etag(f'{etag}-{encoding}', weak)
+    return response
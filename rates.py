@@ -0,0 +1,298 @@
+"""Shared exchange-rate cache.
+
+Rates are always fetched as a single USD table per API URL and rebased
+locally for other base currencies. The table is persisted to the
+``rate_snapshots`` table so every worker can reuse the last good copy, and
+parsed copies are kept in process memory until a newer snapshot is stored:
+
+* fresh entries are served directly;
+* stale entries are served immediately while one background refresh runs;
+* misses block on a single upstream fetch (single-flight), both within a
+  process (per-URL lock) and across workers (a lease row in SQLite); a
+  worker that loses the lease polls for the winner's snapshot and fetches
+  itself only if the winner fails or its lease expires;
+* ``FALLBACK_RATES`` is only used when no snapshot has ever been stored.
+
+Upstream fetches race the primary API against the CDN fallback on a small
+thread pool with keep-alive sessions, and a per-upstream circuit breaker
+skips sources that keep failing.
+"""
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests as http_requests
+
+import config
+from database import pooled
+
+# Hardcoded fallback rates (approximate, base USD)
+FALLBACK_RATES = {
+    'USD': 1, 'EUR': 0.92, 'GBP': 0.79, 'JPY': 149.5, 'CNY': 7.24,
+    'CAD': 1.36, 'AUD': 1.53, 'CHF': 0.88, 'KRW': 1320, 'INR': 83.1,
+    'SGD': 1.34, 'HKD': 7.82, 'TWD': 31.5, 'MXN': 17.1, 'BRL': 4.97,
+    'SEK': 10.4, 'NOK': 10.5, 'DKK': 6.87, 'NZD': 1.63, 'THB': 35.2,
+    'RUB': 91.5, 'ZAR': 18.9, 'PHP': 56.2, 'MYR': 4.72, 'IDR': 15600,
+}
+
+DEFAULT_API_URL = 'https://api.exchangerate-api.com/v4/latest/'
+FALLBACK_URL = 'https://cdn.jsdelivr.net/npm/@fawazahmed0/currency-api@latest/v1/currencies/usd.json'
+
+_memory = {}            # api_url -> (usd_rates, fetched_at)
+_locks = {}             # api_url -> threading.Lock
+_locks_guard = threading.Lock()
+_refreshing = set()     # api_urls with a background refresh in flight
+
+
+def get_rates(db_path, api_url, base='USD'):
+    """Return the rate table for ``base`` using the cache described above."""
+    usd, fetched_at = _lookup(db_path, api_url)
+    if usd is None:
+        usd = _refresh(db_path, api_url)
+    elif time.time() - fetched_at > config.RATES_TTL:
+        _refresh_in_background(db_path, api_url)
+    return rebase(usd or FALLBACK_RATES, base)
+
+
+def rates_generation(db_path):
+    """Identify the stored rate snapshots (for ETags); the same in every worker."""
+    with pooled(db_path) as db:
+        return db.execute('SELECT MAX(fetched_at) FROM rate_snapshots').fetchone()[0] or 0
+
+
+def conversion_factors(db_path, api_url, target):
+    """Return ``{currency: multiplier}`` converting amounts into ``target``."""
+    table = get_rates(db_path, api_url, target)
+    return {cur: 1 / rate for cur, rate in table.items() if rate}
+
+
+def rebase(usd, base):
+    """Derive the table for ``base`` from a USD table."""
+    if base == 'USD' or not usd.get(base):
+        return dict(usd)
+    rate = usd[base]
+    return {k: round(v / rate, 6) for k, v in usd.items()}
+
+
+def _lock_for(api_url):
+    with _locks_guard:
+        return _locks.setdefault(api_url, threading.Lock())
+
+
+def _lookup(db_path, api_url):
+    """Return (usd_rates, fetched_at) of the stored snapshot.
+
+    The parsed table comes from memory unless another worker has stored a
+    newer one, so every worker converts with the snapshot
+    :func:`rates_generation` names.
+    """
+    usd, fetched_at = _memory.get(api_url, (None, 0))
+    with pooled(db_path) as db:
+        row = db.execute('SELECT fetched_at FROM rate_snapshots WHERE api_url=?',
+                         (api_url,)).fetchone()
+        if row and row['fetched_at'] > fetched_at:
+            row = db.execute('SELECT rates, fetched_at FROM rate_snapshots WHERE api_url=?',
+                             (api_url,)).fetchone()
+            if row['rates']:
+                usd, fetched_at = json.loads(row['rates']), row['fetched_at']
+                _memory[api_url] = (usd, fetched_at)
+    return usd, fetched_at
+
+
+def _refresh(db_path, api_url):
+    """Fetch and store a new USD table; concurrent callers share one fetch."""
+    with _lock_for(api_url):
+        usd, fetched_at = _lookup(db_path, api_url)
+        if usd is not None and time.time() - fetched_at <= config.RATES_TTL:
+            return usd
+        if not _acquire_lease(db_path, api_url):
+            if usd is not None:
+                # Another worker is already fetching; keep serving what we have
+                return usd
+            # Nothing to serve yet: wait for that worker's snapshot
+            usd = _await_snapshot(db_path, api_url)
+            if usd is not None:
+                return usd
+        fresh = _fetch_usd(api_url)
+        if fresh is None:
+            _release_lease(db_path, api_url)
+            return usd
+        now = time.time()
+        _memory[api_url] = (fresh, now)
+        with pooled(db_path) as db:
+            db.execute('''
+                INSERT INTO rate_snapshots (api_url, rates, fetched_at, refresh_until)
+                VALUES (?,?,?,0)
+                ON CONFLICT(api_url) DO UPDATE SET rates=excluded.rates,
+                    fetched_at=excluded.fetched_at, refresh_until=0
+            ''', (api_url, json.dumps(fresh), now))
+            db.commit()
+        return fresh
+
+
+def _refresh_in_background(db_path, api_url):
+    with _locks_guard:
+        if api_url in _refreshing:
+            return
+        _refreshing.add(api_url)
+
+    def run():
+        try:
+            _refresh(db_path, api_url)
+        finally:
+            with _locks_guard:
+                _refreshing.discard(api_url)
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def _acquire_lease(db_path, api_url):
+    """Claim the cross-worker right to refresh ``api_url`` for a short while."""
+    now = time.time()
+    with pooled(db_path) as db:
+        cur = db.execute('''
+            INSERT INTO rate_snapshots (api_url, rates, fetched_at, refresh_until)
+            VALUES (?, NULL, 0, ?)
+            ON CONFLICT(api_url) DO UPDATE SET refresh_until=excluded.refresh_until
+            WHERE refresh_until < ?
+        ''', (api_url, now + config.RATES_LEASE, now))
+        db.commit()
+        return cur.rowcount > 0
+
+
+def _await_snapshot(db_path, api_url):
+    """Poll for the lease holder's snapshot; None once the lease is ours.
+
+    The lease is only free again after its holder failed or it expired,
+    so the caller fetches upstream itself only then.
+    """
+    while True:
+        time.sleep(config.RATES_LEASE_POLL)
+        usd, _ = _lookup(db_path, api_url)
+        if usd is not None:
+            return usd
+        if _acquire_lease(db_path, api_url):
+            return None
+
+
+def _release_lease(db_path, api_url):
+    with pooled(db_path) as db:
+        db.execute('UPDATE rate_snapshots SET refresh_until=0 WHERE api_url=?', (api_url,))
+        db.commit()
+
+
+class CircuitBreaker:
+    """Skip an upstream after repeated failures, retrying it after a cool-down.
+
+    After ``threshold`` consecutive failures the breaker opens for
+    ``reset_after`` seconds; then a single trial request is let through
+    (half-open) and its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, threshold, reset_after):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.open_until = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.failures < self.threshold:
+                return True
+            if time.monotonic() < self.open_until or self._trial:
+                return False
+            self._trial = True
+            return True
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self._trial = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if self.failures >= self.threshold:
+                self.open_until = time.monotonic() + self.reset_after
+
+    def release_trial(self):
+        """Give back a trial that never ran (its request was cancelled)."""
+        with self._lock:
+            self._trial = False
+
+
+_breakers = {}          # upstream url -> CircuitBreaker
+_sessions = threading.local()
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='rates')
+
+
+def _breaker(url):
+    with _locks_guard:
+        return _breakers.setdefault(url, CircuitBreaker(config.RATES_BREAKER_FAILURES,
+                                                        config.RATES_BREAKER_RESET))
+
+
+def _session():
+    """Keep-alive session reused by each fetch thread."""
+    session = getattr(_sessions, 'session', None)
+    if session is None:
+        session = _sessions.session = http_requests.Session()
+    return session
+
+
+def _parse_primary(data):
+    return data.get('rates', {})
+
+
+def _parse_fallback(data):
+    # Convert keys to uppercase to match expected format
+    return {k.upper(): v for k, v in data.get('usd', {}).items() if isinstance(v, (int, float))}
+
+
+def _fetch_source(url, parse):
+    breaker = _breaker(url)
+    try:
+        resp = _session().get(url, timeout=config.RATES_TIMEOUT)
+        resp.raise_for_status()
+        rates = parse(resp.json())
+    except Exception:
+        rates = None
+    if rates:
+        breaker.success()
+        return rates
+    breaker.failure()
+    return None
+
+
+def _fetch_usd(api_url):
+    """Race the primary API and the Fawazahmed0 CDN for a USD table.
+
+    The first valid answer wins; upstreams whose circuit breaker is open are
+    skipped. A losing request cannot be interrupted mid-flight, so it is
+    cancelled if still queued (handing back a half-open trial it held) and
+    otherwise left to finish (bounded by ``RATES_TIMEOUT``) with its result
+    discarded.
+    """
+    sources = [(f'{api_url}USD', _parse_primary), (FALLBACK_URL, _parse_fallback)]
+    urls = {_executor.submit(_fetch_source, url, parse): url
+            for url, parse in sources if _breaker(url).allow()}
+    pending = set(urls)
+    deadline = time.monotonic() + config.RATES_TIMEOUT
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=max(deadline - time.monotonic(), 0),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                return None
+            for future in done:
+                if future.result():
+                    return future.result()
+        return None
+    finally:
+        for future in pending:
+            if future.cancel():
+                _breaker(urls[future]).release_trial()
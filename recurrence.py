@@ -0,0 +1,150 @@
+"""Closed-form expansion of recurring expenses into concrete dates.
+
+Every function here works on a half-open ``[start, end)`` window of
+``datetime.date`` objects and never steps through the periods between the
+billing date and the window, so the cost depends only on the window size.
+"""
+import calendar
+import math
+from datetime import date, datetime, timedelta
+
+# Intervals that repeat every N days from the billing date
+FIXED_DAY_INTERVALS = {'weekly': 7, 'biweekly': 14}
+
+# Intervals that repeat every N months from the billing month
+MONTHLY_INTERVALS = {
+    'monthly': 1, 'bimonthly': 2, 'quarterly': 3, 'semiannually': 6, 'yearly': 12,
+}
+
+# Multi-month intervals whose day-of-month sticks once it has been clamped
+# (Jan 31 -> Apr 30 -> Jul 30 ...), unlike monthly/yearly which always
+# re-anchor on the original billing day.
+STICKY_DAY_INTERVALS = {'bimonthly', 'quarterly', 'semiannually'}
+
+# Weekday bitmasks, bit 0 = Monday ... bit 6 = Sunday
+WEEKDAY_MASKS = {'daily': 0b1111111, 'weekdays': 0b0011111, 'weekends': 0b1100000}
+
+
+def parse_date(value):
+    """Return a ``date`` from a ``YYYY-MM-DD`` string, date or datetime."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def month_window(year, month):
+    """Return the ``[first day, first day of next month)`` window of a month."""
+    start = date(year, month, 1)
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start, end
+
+
+def weekday_mask(specific_days):
+    """Parse comma-separated weekday numbers (0=Mon, 6=Sun) into a bitmask."""
+    mask = 0
+    for part in (specific_days or '').split(','):
+        part = part.strip()
+        if part.isdigit() and int(part) < 7:
+            mask |= 1 << int(part)
+    return mask
+
+
+def _month_index(d):
+    return d.year * 12 + d.month - 1
+
+
+def _days_in(index):
+    return calendar.monthrange(index // 12, index % 12 + 1)[1]
+
+
+def _every_n_days(billing, step, start, end):
+    lo = max(start, billing)
+    if lo >= end:
+        return []
+    # First k with billing + k*step >= lo
+    k = -(-(lo - billing).days // step)
+    first = billing + timedelta(days=k * step)
+    count = max(0, -(-(end - first).days // step))
+    return [first + timedelta(days=i * step) for i in range(count)]
+
+
+def _masked_days(billing, mask, start, end):
+    lo = max(start, billing)
+    if lo >= end or not mask:
+        return []
+    result = []
+    base = lo.weekday()
+    for wd in range(7):
+        if mask & (1 << wd):
+            d = lo + timedelta(days=(wd - base) % 7)
+            while d < end:
+                result.append(d)
+                d += timedelta(days=7)
+    result.sort()
+    return result
+
+
+def _sticky_day(billing, step, k):
+    """Day-of-month of the k-th occurrence of a sticky multi-month interval.
+
+    The day is the billing day clamped by the shortest month visited so
+    far. Month lengths repeat with the month-of-year cycle, and two
+    consecutive Februaries always include a 28-day one, so looking at the
+    first two cycles is enough for any k.
+    """
+    day = billing.day
+    if day <= 28 or k == 0:
+        return day
+    cycle = 12 // math.gcd(step, 12)
+    b_idx = _month_index(billing)
+    for j in range(1, min(k, 2 * cycle) + 1):
+        day = min(day, _days_in(b_idx + j * step))
+    return day
+
+
+def _every_n_months(billing, step, sticky, start, end):
+    b_idx = _month_index(billing)
+    first_idx = max(_month_index(start), b_idx)
+    last_idx = _month_index(end - timedelta(days=1))
+    # Align to the first month index in the billing residue class
+    first_idx += (b_idx - first_idx) % step
+    result = []
+    for idx in range(first_idx, last_idx + 1, step):
+        k = (idx - b_idx) // step
+        day = _sticky_day(billing, step, k) if sticky else billing.day
+        d = date(idx // 12, idx % 12 + 1, min(day, _days_in(idx)))
+        if start <= d < end and d >= billing:
+            result.append(d)
+    return result
+
+
+def occurrences(expense, start, end):
+    """Return the sorted dates on which ``expense`` falls within ``[start, end)``.
+
+    ``expense`` is any mapping with ``billing_date``, ``billing_interval``,
+    ``custom_interval_days`` and ``specific_days`` keys (e.g. a
+    ``sqlite3.Row``). Unknown intervals produce no occurrences.
+    """
+    start, end = parse_date(start), parse_date(end)
+    if start >= end:
+        return []
+    billing = parse_date(expense['billing_date'])
+    interval = expense['billing_interval']
+
+    if interval == 'once':
+        return [billing] if start <= billing < end else []
+    if interval in WEEKDAY_MASKS:
+        return _masked_days(billing, WEEKDAY_MASKS[interval], start, end)
+    if interval == 'specific_days':
+        return _masked_days(billing, weekday_mask(expense['specific_days']), start, end)
+    if interval in FIXED_DAY_INTERVALS:
+        return _every_n_days(billing, FIXED_DAY_INTERVALS[interval], start, end)
+    if interval == 'custom':
+        step = expense['custom_interval_days'] or 0
+        return _every_n_days(billing, step, start, end) if step > 0 else []
+    if interval in MONTHLY_INTERVALS:
+        return _every_n_months(billing, MONTHLY_INTERVALS[interval],
+                               interval in STICKY_DAY_INTERVALS, start, end)
+    return []
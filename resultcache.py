@@ -0,0 +1,128 @@
+"""Per-user cache of computed API responses (calendar months, stats).
+
+Entries are keyed by the same parts as the route's ETag: user, data
+version, request path and, for converted aggregates, the day and rate
+snapshot. A write bumps the user's data version, so old entries can never
+be served again; :func:`invalidate` also drops them right away to free
+memory.
+
+The in-process tier is an LRU bounded by entry count, total body bytes and
+TTL. With ``RESULT_CACHE_SHARED`` enabled, misses fall through to the
+``result_cache`` table so gunicorn workers reuse each other's results.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import config
+
+
+class LRUCache:
+    """Thread-safe LRU of ``key -> bytes`` with count, size and TTL limits."""
+
+    def __init__(self, max_entries, max_bytes, ttl):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()    # key -> (body, expires_at)
+        self._by_user = {}               # user_id -> set of keys
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.metrics = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0,
+                        'invalidations': 0, 'shared_hits': 0, 'shared_misses': 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < time.monotonic():
+                self._drop(key)
+                self.metrics['expirations'] += 1
+                entry = None
+            if entry is None:
+                self.metrics['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.metrics['hits'] += 1
+            return entry[0]
+
+    def put(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (body, time.monotonic() + self.ttl)
+            self._by_user.setdefault(key[0], set()).add(key)
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.metrics['evictions'] += 1
+
+    def record(self, counter):
+        with self._lock:
+            self.metrics[counter] += 1
+
+    def invalidate(self, user_id):
+        with self._lock:
+            for key in list(self._by_user.get(user_id, ())):
+                self._drop(key)
+                self.metrics['invalidations'] += 1
+
+    def _drop(self, key):
+        body, _ = self._entries.pop(key)
+        self._bytes -= len(body)
+        keys = self._by_user.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[key[0]]
+
+    def stats(self):
+        with self._lock:
+            return {**self.metrics, 'entries': len(self._entries), 'bytes': self._bytes,
+                    'max_entries': self.max_entries, 'max_bytes': self.max_bytes,
+                    'ttl': self.ttl, 'shared': config.RESULT_CACHE_SHARED}
+
+
+_cache = LRUCache(config.RESULT_CACHE_ENTRIES, config.RESULT_CACHE_BYTES,
+                  config.RESULT_CACHE_TTL)
+
+
+def lookup(db, user_id, tag):
+    """Return the cached body for ``tag``, checking the shared tier on a miss."""
+    key = (user_id, tag)
+    body = _cache.get(key)
+    if body is not None or not config.RESULT_CACHE_SHARED:
+        return body
+    row = db.execute('SELECT body FROM result_cache WHERE user_id=? AND tag=? AND expires_at>?',
+                     (user_id, tag, time.time())).fetchone()
+    _cache.record('shared_hits' if row else 'shared_misses')
+    if row is None:
+        return None
+    _cache.put(key, row['body'])
+    return row['body']
+
+
+def store(db, user_id, tag, body):
+    """Cache ``body`` for ``tag`` in process and, if enabled, in the shared tier."""
+    _cache.put((user_id, tag), body)
+    if config.RESULT_CACHE_SHARED and len(body) <= _cache.max_bytes:
+        now = time.time()
+        db.execute('DELETE FROM result_cache WHERE user_id=? AND expires_at<=?', (user_id, now))
+        db.execute('''
+            INSERT INTO result_cache (user_id, tag, body, expires_at) VALUES (?,?,?,?)
+            ON CONFLICT(user_id, tag) DO UPDATE SET body=excluded.body,
+                expires_at=excluded.expires_at
+        ''', (user_id, tag, body, now + _cache.ttl))
+        db.commit()
+
+
+def invalidate(db, user_id):
+    """Drop a user's cached results; call from the writing transaction."""
+    _cache.invalidate(user_id)
+    if config.RESULT_CACHE_SHARED:
+        db.execute('DELETE FROM result_cache WHERE user_id=?', (user_id,))
+
+
+def stats():
+    return _cache.stats()
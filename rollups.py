@@ -0,0 +1,202 @@
+"""Precomputed monthly rollups of expense occurrences.
+
+``monthly_rollups`` holds, per user, the sum and count of expanded
+occurrences keyed by (month, category_id, payment_method_id, currency).
+Missing categories/payment methods are stored as 0 so the key stays unique.
+One-time expenses always count; recurring ones only while active, which
+matches what the statistics view shows. ``is_active`` is a pause switch,
+not an end date: a deactivated recurring expense drops out of past months
+as well as future ones, as it does in the calendar, and reactivating it
+brings its history back.
+
+Recurring expenses are only expanded up to a per-user horizon month
+(``rollup_horizons``); :func:`ensure` extends it lazily on read. Writers
+call :func:`apply` inside their own transaction with the old row (sign -1)
+and/or the new row (sign +1).
+
+Usage::
+
+    python rollups.py rebuild [USER_ID]
+    python rollups.py check [USER_ID]
+"""
+import sys
+from collections import defaultdict
+from datetime import date
+
+import config
+from database import user_databases
+from recurrence import occurrences
+
+UPSERT = '''
+    INSERT INTO monthly_rollups
+    (user_id, month, category_id, payment_method_id, currency, total, count)
+    VALUES (?,?,?,?,?,?,?)
+    ON CONFLICT(user_id, month, category_id, payment_method_id, currency)
+    DO UPDATE SET total = total + excluded.total, count = count + excluded.count
+'''
+
+
+def _index(year, month):
+    return year * 12 + month - 1
+
+
+def _key(index):
+    return f'{index // 12}-{index % 12 + 1:02d}'
+
+
+def _first_day(index):
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _parse_key(key):
+    return _index(int(key[:4]), int(key[5:7]))
+
+
+def contributions(expense, start, end, into=None):
+    """Add ``expense``'s occurrences in [start, end) to a rollup mapping.
+
+    Returns ``{(month, category_id, payment_method_id, currency): [total, count]}``.
+    """
+    into = into if into is not None else defaultdict(lambda: [0.0, 0])
+    if expense['billing_interval'] != 'once' and not expense['is_active']:
+        return into
+    group = (expense['category_id'] or 0, expense['payment_method_id'] or 0,
+             expense['currency'] or 'USD')
+    for d in occurrences(expense, start, end):
+        slot = into[(d.strftime('%Y-%m'), *group)]
+        slot[0] += expense['amount']
+        slot[1] += 1
+    return into
+
+
+def _write(db, user_id, rollup, sign=1):
+    db.executemany(UPSERT, [(user_id, *key, sign * total, sign * count)
+                            for key, (total, count) in rollup.items()])
+
+
+def horizon_end(db, user_id):
+    """Return the exclusive end date of the user's rollups, or None if not built."""
+    row = db.execute('SELECT horizon FROM rollup_horizons WHERE user_id=?',
+                     (user_id,)).fetchone()
+    return _first_day(_parse_key(row['horizon']) + 1) if row else None
+
+
+def apply(db, user_id, expenses, sign):
+    """Add (sign=1) or remove (sign=-1) expenses' contributions.
+
+    Does nothing until the user's rollups have been built; the first
+    :func:`ensure` will include these rows anyway.
+    """
+    end = horizon_end(db, user_id)
+    if end is None:
+        return
+    rollup = None
+    for e in expenses:
+        rollup = contributions(e, date.min, end, rollup)
+    if rollup:
+        _write(db, user_id, rollup, sign)
+        db.execute('DELETE FROM monthly_rollups WHERE user_id=? AND count<=0', (user_id,))
+
+
+def reassign(db, user_id, column, old_id, new_id=0):
+    """Fold rollups of a deleted category/payment method into ``new_id``.
+
+    The default 0 is the bucket for expenses without one.
+    """
+    keys = '?, payment_method_id' if column == 'category_id' else 'category_id, ?'
+    db.execute(f'''
+        INSERT INTO monthly_rollups
+        (user_id, month, category_id, payment_method_id, currency, total, count)
+        SELECT user_id, month, {keys}, currency, total, count
+        FROM monthly_rollups WHERE user_id=? AND {column}=?
+        ON CONFLICT(user_id, month, category_id, payment_method_id, currency)
+        DO UPDATE SET total = total + excluded.total, count = count + excluded.count
+    ''', (new_id, user_id, old_id))
+    db.execute(f'DELETE FROM monthly_rollups WHERE user_id=? AND {column}=?',
+               (user_id, old_id))
+
+
+def _expected(db, user_id, end):
+    rollup = defaultdict(lambda: [0.0, 0])
+    for e in db.execute('SELECT * FROM expenses WHERE user_id=? AND billing_date < ?',
+                        (user_id, end.isoformat())):
+        contributions(e, date.min, end, rollup)
+    return rollup
+
+
+def rebuild(db, user_id, through=None):
+    """Recompute a user's rollups from scratch up to month index ``through``."""
+    if through is None:
+        today = date.today()
+        through = _index(today.year, today.month) + config.ROLLUP_AHEAD_MONTHS
+    db.execute('DELETE FROM monthly_rollups WHERE user_id=?', (user_id,))
+    _write(db, user_id, _expected(db, user_id, _first_day(through + 1)))
+    db.execute('''
+        INSERT INTO rollup_horizons (user_id, horizon) VALUES (?,?)
+        ON CONFLICT(user_id) DO UPDATE SET horizon=excluded.horizon
+    ''', (user_id, _key(through)))
+
+
+def ensure(db, user_id, year, month):
+    """Make sure rollups cover ``year``/``month``; returns True if anything changed."""
+    needed = _index(year, month)
+    through = needed + config.ROLLUP_AHEAD_MONTHS
+    end = horizon_end(db, user_id)
+    if end is None:
+        rebuild(db, user_id, through)
+        return True
+    old = _index(end.year, end.month)
+    if old > needed:
+        return False
+    new_end = _first_day(through + 1)
+    rollup = defaultdict(lambda: [0.0, 0])
+    for e in db.execute('''
+        SELECT * FROM expenses WHERE user_id=? AND billing_date < ? AND (
+            (billing_interval = 'once' AND billing_date >= ?)
+            OR (billing_interval != 'once' AND is_active = 1))
+    ''', (user_id, new_end.isoformat(), end.isoformat())):
+        contributions(e, end, new_end, rollup)
+    _write(db, user_id, rollup)
+    db.execute('UPDATE rollup_horizons SET horizon=? WHERE user_id=?', (_key(through), user_id))
+    return True
+
+
+def check(db, user_id):
+    """Compare stored rollups with a fresh expansion; returns the mismatching keys."""
+    end = horizon_end(db, user_id)
+    if end is None:
+        return []
+    expected = _expected(db, user_id, end)
+    stored = {(r['month'], r['category_id'], r['payment_method_id'], r['currency']):
+              (r['total'], r['count'])
+              for r in db.execute('SELECT * FROM monthly_rollups WHERE user_id=?', (user_id,))}
+    problems = []
+    for key in set(expected) | set(stored):
+        want = tuple(expected.get(key, (0.0, 0)))
+        have = stored.get(key, (0.0, 0))
+        if want[1] != have[1] or abs(want[0] - have[0]) > 1e-6:
+            problems.append({'key': key, 'expected': want, 'stored': have})
+    return problems
+
+
+def main(argv):
+    if len(argv) < 2 or argv[1] not in ('rebuild', 'check'):
+        print(__doc__.strip().split('Usage::')[1])
+        return 2
+    status = 0
+    for db, users in user_databases(config.DATABASE, int(argv[2]) if len(argv) > 2 else None):
+        for uid in users:
+            if argv[1] == 'rebuild':
+                rebuild(db, uid)
+                db.commit()
+                print(f'user {uid}: rebuilt')
+            else:
+                problems = check(db, uid)
+                for p in problems:
+                    print(f'user {uid}: {p}')
+                status = status or (1 if problems else 0)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
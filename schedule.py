@@ -0,0 +1,192 @@
+"""Materialised expense occurrences for a rolling window.
+
+``occurrences`` holds one (user_id, day, expense_id) row for every day an
+active expense falls on inside the user's window (``schedule_windows``),
+which runs from ``SCHEDULE_PAST_MONTHS`` before the current month to
+``SCHEDULE_AHEAD_MONTHS`` after it. Calendar, range and upcoming-bills reads
+inside the window are range scans on the (user_id, day) primary key
+(:func:`lookup`); anything outside it is still expanded at request time.
+
+Writers call :func:`refresh` inside their own transaction with the ids of
+the expenses they created or changed; only those expenses' rows are
+regenerated (deleted expenses lose theirs through the foreign key).
+:func:`advance` moves a user's window forward as the months pass. Reads do
+this lazily, and ``python schedule.py refresh`` does it for every user, so
+a nightly cron job keeps the first request of the day cheap.
+
+Usage::
+
+    python schedule.py refresh [USER_ID]
+    python schedule.py rebuild [USER_ID]
+    python schedule.py check [USER_ID]
+"""
+import sys
+from collections import defaultdict
+from datetime import date
+
+import config
+from database import user_databases
+from recurrence import occurrences
+
+INSERT = 'INSERT OR IGNORE INTO occurrences (user_id, day, expense_id) VALUES (?,?,?)'
+
+# Active expenses that can occur in [start, end); params (user_id, end, start)
+ACTIVE_IN_RANGE = '''
+    SELECT * FROM expenses WHERE user_id=? AND is_active=1 AND billing_date < ?
+      AND (billing_interval != 'once' OR billing_date >= ?)
+'''
+
+
+def _month_start(day, offset):
+    index = day.year * 12 + day.month - 1 + offset
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def target_window(today=None):
+    """The [start, end) window a user's occurrences should cover today."""
+    today = today or date.today()
+    return (_month_start(today, -config.SCHEDULE_PAST_MONTHS),
+            _month_start(today, config.SCHEDULE_AHEAD_MONTHS + 1))
+
+
+def window(db, user_id):
+    """Return the user's materialised [start, end), or None if not built."""
+    row = db.execute('SELECT start, end FROM schedule_windows WHERE user_id=?',
+                     (user_id,)).fetchone()
+    return (date.fromisoformat(row['start']), date.fromisoformat(row['end'])) if row else None
+
+
+def _expand(expenses, start, end):
+    rows = []
+    for e in expenses:
+        if e['is_active']:
+            rows += [(e['user_id'], d.isoformat(), e['id']) for d in occurrences(e, start, end)]
+    return rows
+
+
+def _fill(db, user_id, start, end):
+    db.executemany(INSERT, _expand(
+        db.execute(ACTIVE_IN_RANGE, (user_id, end.isoformat(), start.isoformat())), start, end))
+
+
+def rebuild(db, user_id, today=None):
+    """Recompute a user's occurrences for the current target window."""
+    start, end = target_window(today)
+    db.execute('DELETE FROM occurrences WHERE user_id=?', (user_id,))
+    _fill(db, user_id, start, end)
+    db.execute('''
+        INSERT INTO schedule_windows (user_id, start, end) VALUES (?,?,?)
+        ON CONFLICT(user_id) DO UPDATE SET start=excluded.start, end=excluded.end
+    ''', (user_id, start.isoformat(), end.isoformat()))
+
+
+def advance(db, user_id, today=None):
+    """Bring the user's window up to date; returns True if anything changed."""
+    current = window(db, user_id)
+    start, end = target_window(today)
+    if current == (start, end):
+        return False
+    if current is None or start < current[0] or end < current[1] or start >= current[1]:
+        # Never built, the settings changed or it is too stale to extend
+        rebuild(db, user_id, today)
+        return True
+    _fill(db, user_id, current[1], end)
+    db.execute('DELETE FROM occurrences WHERE user_id=? AND day < ?',
+               (user_id, start.isoformat()))
+    db.execute('UPDATE schedule_windows SET start=?, end=? WHERE user_id=?',
+               (start.isoformat(), end.isoformat(), user_id))
+    return True
+
+
+def refresh(db, user_id, expense_ids):
+    """Regenerate the occurrences of just these expenses.
+
+    Does nothing until the user's window has been built; the first
+    :func:`advance` will include these rows anyway.
+    """
+    current = window(db, user_id)
+    ids = list(expense_ids)
+    if current is None or not ids:
+        return
+    marks = ','.join('?' * len(ids))
+    db.execute(f'DELETE FROM occurrences WHERE user_id=? AND expense_id IN ({marks})',
+               (user_id, *ids))
+    db.executemany(INSERT, _expand(db.execute(
+        f'SELECT * FROM expenses WHERE user_id=? AND id IN ({marks})', (user_id, *ids)),
+        *current))
+
+
+def lookup(db, user_id, start, end):
+    """Map expense id -> its days in [start, end), or None if outside the window."""
+    current = window(db, user_id)
+    if current is None or start < current[0] or end > current[1]:
+        return None
+    cursor = db.cursor()
+    cursor.row_factory = None       # plain tuples: there can be many rows
+    days, parsed = defaultdict(list), {}
+    for expense_id, day in cursor.execute('''
+        SELECT expense_id, day FROM occurrences
+        WHERE user_id=? AND day >= ? AND day < ? ORDER BY day
+    ''', (user_id, start.isoformat(), end.isoformat())):
+        if day not in parsed:
+            parsed[day] = date.fromisoformat(day)
+        days[expense_id].append(parsed[day])
+    return days
+
+
+def day_totals(db, user_id, start, end):
+    """``(day, currency, total, count)`` per day in [start, end), summed in SQL.
+
+    Returns None if the range is outside the user's window.
+    """
+    current = window(db, user_id)
+    if current is None or start < current[0] or end > current[1]:
+        return None
+    return [(date.fromisoformat(day), currency, total, count)
+            for day, currency, total, count in db.execute('''
+                SELECT o.day, e.currency, SUM(e.amount), COUNT(*)
+                FROM occurrences o JOIN expenses e ON e.id = o.expense_id
+                WHERE o.user_id=? AND o.day >= ? AND o.day < ?
+                GROUP BY o.day, e.currency
+            ''', (user_id, start.isoformat(), end.isoformat()))]
+
+
+def check(db, user_id):
+    """Compare stored occurrences with a fresh expansion; returns the differences."""
+    current = window(db, user_id)
+    if current is None:
+        return []
+    expected = set(_expand(db.execute(ACTIVE_IN_RANGE, (user_id, current[1].isoformat(),
+                                                        current[0].isoformat())), *current))
+    stored = {tuple(r) for r in db.execute(
+        'SELECT user_id, day, expense_id FROM occurrences WHERE user_id=?', (user_id,))}
+    return ([{'missing': row} for row in sorted(expected - stored)]
+            + [{'unexpected': row} for row in sorted(stored - expected)])
+
+
+def main(argv):
+    if len(argv) < 2 or argv[1] not in ('refresh', 'rebuild', 'check'):
+        print(__doc__.strip().split('Usage::')[1])
+        return 2
+    status = 0
+    for db, users in user_databases(config.DATABASE, int(argv[2]) if len(argv) > 2 else None):
+        for uid in users:
+            if argv[1] == 'refresh':
+                if advance(db, uid):
+                    db.commit()
+                    start, end = window(db, uid)
+                    print(f'user {uid}: window {start} to {end}')
+            elif argv[1] == 'rebuild':
+                rebuild(db, uid)
+                db.commit()
+                print(f'user {uid}: rebuilt')
+            else:
+                problems = check(db, uid)
+                for p in problems:
+                    print(f'user {uid}: {p}')
+                status = status or (1 if problems else 0)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,125 @@
+"""Split a single-file database into per-tenant shards (see DB_SHARDING).
+
+``split`` copies every user's rows from ``config.DATABASE`` into the shard
+file that ``DB_SHARDING``/``DB_SHARD_BUCKETS`` route them to, keeping all ids,
+so references between rows stay valid. The main file keeps the accounts
+and becomes the directory; ``--prune`` then deletes the copied rows from
+it. The sync log and data versions are copied as they are and checked
+afterwards, so clients' sync tokens stay valid. Run it with the app
+stopped and an empty shard directory, then start the app with the same
+sharding settings.
+
+Usage::
+
+    python shards.py split [--prune]
+    python shards.py list
+"""
+import os
+import sys
+from collections import Counter
+
+import config
+from database import (USER_TABLES, connect, data_paths, db_path, migrate_db, prepare_shard,
+                      shard_dir)
+from defaults import TEMPLATE_USERNAME
+
+# Sync state copied verbatim, so clients' tokens stay valid on the shard
+SYNC_TABLES = ('data_versions', 'sync_floors', 'sync_log')
+
+
+def _columns(db, schema, table):
+    return [r[1] for r in db.execute(f'PRAGMA {schema}.table_info({table})')]
+
+
+def _copy_user(db, user_id):
+    """Copy one user's rows from the attached ``src`` into ``main``."""
+    db.execute('INSERT OR IGNORE INTO main.users (id, username, password_hash, created_at) '
+               "SELECT id, username, '!', created_at FROM src.users WHERE id=?", (user_id,))
+    for table in USER_TABLES:
+        columns = [c for c in _columns(db, 'main', table) if c in _columns(db, 'src', table)]
+        names = ', '.join(columns)
+        if table in SYNC_TABLES:
+            # The sync triggers logged the inserts above under fresh versions;
+            # the source's log and version replace them
+            db.execute(f'DELETE FROM main.{table} WHERE user_id=?', (user_id,))
+        db.execute(f'INSERT OR IGNORE INTO main.{table} ({names}) '
+                   f'SELECT {names} FROM src.{table} WHERE user_id=?', (user_id,))
+
+
+def _verify(db, user_id):
+    """Fail unless ``main`` holds the same sync log and data version as ``src``."""
+    for table in SYNC_TABLES:
+        names = ', '.join(_columns(db, 'main', table))
+        differs = db.execute(f'''
+            SELECT 1 FROM (SELECT {names} FROM main.{table} WHERE user_id=?
+                           EXCEPT SELECT {names} FROM src.{table} WHERE user_id=?)
+            UNION ALL
+            SELECT 1 FROM (SELECT {names} FROM src.{table} WHERE user_id=?
+                           EXCEPT SELECT {names} FROM main.{table} WHERE user_id=?)
+            LIMIT 1
+        ''', (user_id,) * 4).fetchone()
+        if differs:
+            raise SystemExit(f'user {user_id}: {table} differs after the copy')
+
+
+def split(source, prune=False):
+    """Copy every user into their shard; returns ``{shard path: user count}``."""
+    if config.DB_SHARDING == 'off':
+        raise SystemExit('Set DB_SHARDING=user or DB_SHARDING=bucket first')
+    if data_paths(source):
+        raise SystemExit(f'{shard_dir(source)} already has shard files')
+    directory = connect(source)
+    migrate_db(directory)
+    template = directory.execute('SELECT id FROM users WHERE username=?',
+                                 (TEMPLATE_USERNAME,)).fetchone()
+    users = [r[0] for r in directory.execute('SELECT id FROM users WHERE username != ? ORDER BY id',
+                                              (TEMPLATE_USERNAME,))]
+    counts = Counter()
+    for user_id in users:
+        path = db_path(user_id, source)
+        prepare_shard(path)
+        db = connect(path)
+        db.execute('ATTACH DATABASE ? AS src', (source,))
+        if template and not counts[path]:
+            # Shared default rows keep their ids: users' expenses point at them
+            _copy_user(db, template[0])
+            _verify(db, template[0])
+        _copy_user(db, user_id)
+        _verify(db, user_id)
+        db.commit()
+        db.execute('DETACH DATABASE src')
+        db.close()
+        counts[path] += 1
+
+    if prune:
+        # Expenses first, so deleting categories has nothing to SET NULL
+        for table in ('occurrences', 'expenses', *USER_TABLES):
+            directory.execute(f'DELETE FROM {table}')
+        directory.execute("DELETE FROM users WHERE username=?", (TEMPLATE_USERNAME,))
+        directory.commit()
+        directory.execute('VACUUM')
+    directory.close()
+    return dict(counts)
+
+
+def main(argv):
+    if len(argv) < 2 or argv[1] not in ('split', 'list'):
+        print(__doc__.strip().split('Usage::')[1])
+        return 2
+    if argv[1] == 'split':
+        counts = split(config.DATABASE, prune='--prune' in argv[2:])
+        for path, n in sorted(counts.items()):
+            print(f'{path}: {n} users')
+        print(f'{sum(counts.values())} users in {len(counts)} shards')
+    else:
+        for path in data_paths(config.DATABASE):
+            db = connect(path)
+            n = db.execute('SELECT COUNT(*) FROM users WHERE username != ?',
+                           (TEMPLATE_USERNAME,)).fetchone()[0]
+            print(f'{path}: {n} users, {os.path.getsize(path) // 1024} KiB')
+            db.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -102,7 +102,7 @@ ET.App = (function () {
         // Render view-specific content
         switch (view) {
             case 'board':
-                _statsData = _statsData || await ET.Utils.api('/api/stats/summary');
+                _statsData = _statsData || await ET.Utils.api(`/api/stats/summary?currency=${ET.Utils.displayCurrency}`);
                 if (_statsData) ET.Expenses.renderSummary(_statsData);
                 ET.Expenses.populateFilters();
                 // Refresh the category filter dropdown (options may have changed)
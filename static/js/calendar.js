@@ -98,7 +98,7 @@ ET.Calendar = (function () {
     }
 
     async function load() {
-        _calData = await ET.Utils.api(`/api/calendar?year=${_year}&month=${_month}`) || {};
+        _calData = await ET.Utils.api(`/api/calendar?year=${_year}&month=${_month}&currency=${ET.Utils.displayCurrency}`) || {};
     }
 
     function render() {
@@ -142,7 +142,7 @@ ET.Calendar = (function () {
                 activeDays++;
                 totalItems += items.length;
                 items.forEach(it => {
-                    totalAmount += ET.Utils.convert(it.amount, it.currency, ET.Utils.displayCurrency);
+                    totalAmount += it.converted_amount;
                 });
             }
         });
@@ -188,7 +188,7 @@ ET.Calendar = (function () {
             const isToday = today.getFullYear() === _year && today.getMonth() + 1 === _month && today.getDate() === d;
             const isSelected = _selectedDate === dateStr;
             const total = items.reduce((sum, it) =>
-                sum + ET.Utils.convert(it.amount, it.currency, ET.Utils.displayCurrency), 0);
+                sum + it.converted_amount, 0);
 
             // Show event previews (first 2 items as text labels)
             const previews = items.slice(0, 2).map(it =>
@@ -311,7 +311,7 @@ ET.Calendar = (function () {
                 const items = _calData[date] || [];
                 items.forEach(it => {
                     count++;
-                    total += ET.Utils.convert(it.amount, it.currency, ET.Utils.displayCurrency);
+                    total += it.converted_amount;
                     expenses.push({ ...it, date });
                 });
             }
@@ -451,7 +451,7 @@ ET.Calendar = (function () {
                 const dateStr = `${d.getFullYear()}-${String(d.getMonth()+1).padStart(2,'0')}-${String(d.getDate()).padStart(2,'0')}`;
                 const items = _calData[dateStr] || [];
                 const total = items.reduce((s, it) =>
-                    s + ET.Utils.convert(it.amount, it.currency, ET.Utils.displayCurrency), 0);
+                    s + it.converted_amount, 0);
                 summaryHtml += `<div class="calendar-week-cell" onclick="ET.Calendar.showDetail('${dateStr}')">`;
                 if (label === 'Morning' && total > 0) {
                     summaryHtml += `<div class="text-xs text-[var(--accent)] font-semibold p-1">${ET.Utils.formatMoney(total)}</div>`;
@@ -495,7 +495,7 @@ ET.Calendar = (function () {
         }
 
         const total = items.reduce((s, it) =>
-            s + ET.Utils.convert(it.amount, it.currency, ET.Utils.displayCurrency), 0);
+            s + it.converted_amount, 0);
 
         itemsEl.innerHTML = `
             <div class="flex items-center justify-between mb-4 pb-3 border-b border-[var(--card-border)]">
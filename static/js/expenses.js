@@ -2,44 +2,104 @@
 window.ET = window.ET || {};
 
 ET.Expenses = (function () {
-    let _expenses = [];
     let _editingId = null;
 
+    const PAGE_SIZE = 50;
+
+    // One keyset-paged list per view. Filters and sort run on the server;
+    // the first page is fetched on render and the next one when the end of
+    // the list scrolls into view (or on "Load more").
+    const _lists = {
+        board: { key: null, params: null, items: [], cursor: null, done: false, loading: null },
+        table: { key: null, params: null, items: [], cursor: null, done: false, loading: null },
+    };
+    let _observer = null;
+
+    /**
+     * Fetch one keyset page of expenses.
+     * @param {object} params - Filters/sort (category_id, interval, q, sort, ...)
+     * @param {string|null} cursor - next_cursor from the previous page
+     * @returns {Promise<{items: Array, next_cursor: string|null}>}
+     */
+    async function fetchPage(params = {}, cursor = null) {
+        const qs = new URLSearchParams({ limit: PAGE_SIZE, ...params });
+        if (cursor) qs.set('cursor', cursor);
+        return await ET.Utils.api(`/api/expenses?${qs}`) || { items: [], next_cursor: null };
+    }
+
+    function fetchNext(list) {
+        if (!list.loading) {
+            const key = list.key;
+            list.loading = fetchPage(list.params, list.cursor).then(page => {
+                if (list.key !== key) return; // filters changed while in flight
+                list.items.push(...page.items);
+                list.cursor = page.next_cursor;
+                list.done = !page.next_cursor;
+            }).finally(() => {
+                if (list.key === key) list.loading = null;
+            });
+        }
+        return list.loading;
+    }
+
+    async function firstPage(list, params) {
+        const key = JSON.stringify(params);
+        if (list.key === key) return list.loading;
+        Object.assign(list, { key, params, items: [], cursor: null, done: false, loading: null });
+        return fetchNext(list);
+    }
+
     async function load() {
-        _expenses = await ET.Utils.api('/api/expenses') || [];
-        return _expenses;
+        // Drop the loaded pages; the next render starts from the first page
+        Object.values(_lists).forEach(list => { list.key = null; });
     }
 
-    function getAll() { return _expenses; }
+    async function loadMore(view) {
+        const list = _lists[view];
+        if (!list || list.key === null || list.done) return;
+        await fetchNext(list);
+        if (view === 'board') paintBoard();
+        else paintTable();
+    }
+
+    function watchEnd(view) {
+        const el = document.getElementById(`${view}-more`);
+        if (!el) return;
+        el.classList.toggle('hidden', _lists[view].done);
+        if (!('IntersectionObserver' in window)) return;
+        _observer = _observer || new IntersectionObserver(entries => {
+            entries.forEach(entry => {
+                if (entry.isIntersecting) loadMore(entry.target.dataset.view);
+            });
+        }, { rootMargin: '400px' });
+        // Re-observing reports the current state, so a page that still
+        // leaves the end in view fetches the next one
+        _observer.unobserve(el);
+        _observer.observe(el);
+    }
+
+    function getAll() {
+        const byId = new Map();
+        Object.values(_lists).forEach(list => list.items.forEach(e => byId.set(e.id, e)));
+        return [...byId.values()];
+    }
 
     /* ── Render Board Cards ──────────────────────────────────────────── */
-    function renderBoard() {
+    async function renderBoard() {
+        await firstPage(_lists.board, {
+            q: (document.getElementById('board-search').value || '').trim(),
+            category_id: document.getElementById('board-filter-cat').value,
+            sort: document.getElementById('board-sort').value || 'date-desc',
+        });
+        paintBoard();
+    }
+
+    function paintBoard() {
         const grid = document.getElementById('board-grid');
         const empty = document.getElementById('board-empty');
-        const search = (document.getElementById('board-search').value || '').toLowerCase();
-        const catFilter = document.getElementById('board-filter-cat').value;
-        const sort = document.getElementById('board-sort').value;
-
-        let items = [..._expenses];
-
-        // Filter
-        if (search) items = items.filter(e =>
-            e.title.toLowerCase().includes(search) ||
-            (e.description || '').toLowerCase().includes(search) ||
-            (e.category_name || '').toLowerCase().includes(search));
-        if (catFilter) items = items.filter(e => String(e.category_id) === catFilter);
-
-        // Sort
-        items.sort((a, b) => {
-            switch (sort) {
-                case 'date-asc': return a.billing_date.localeCompare(b.billing_date);
-                case 'amount-desc': return b.amount - a.amount;
-                case 'amount-asc': return a.amount - b.amount;
-                case 'title-asc': return a.title.localeCompare(b.title);
-                default: return b.billing_date.localeCompare(a.billing_date);
-            }
-        });
+        const items = _lists.board.items;
 
+        watchEnd('board');
         if (items.length === 0) {
             grid.innerHTML = '';
             empty.classList.remove('hidden');
@@ -51,7 +111,7 @@ ET.Expenses = (function () {
         grid.style.gridTemplateColumns = `repeat(${cols}, 1fr)`;
 
         grid.innerHTML = items.map((e, i) => `
-            <div class="expense-card slide-up" style="animation-delay:${i * 0.03}s">
+            <div class="expense-card slide-up" style="animation-delay:${(i % PAGE_SIZE) * 0.03}s">
                 <div class="flex items-start justify-between mb-3">
                     <div class="flex items-center gap-2.5">
                         ${renderIcon(e.category_icon_type, e.category_icon, '📌', 'lg')}
@@ -94,18 +154,19 @@ ET.Expenses = (function () {
     }
 
     /* ── Render Table ────────────────────────────────────────────────── */
-    function renderTable() {
-        const tbody = document.getElementById('expenses-table-body');
-        const intervalFilter = document.getElementById('exp-filter-interval').value;
-        const categoryFilter = document.getElementById('exp-filter-category')?.value || '';
-        const paymentFilter = document.getElementById('exp-filter-payment')?.value || '';
-        const activeOnly = document.getElementById('exp-active-only').checked;
+    async function renderTable() {
+        await firstPage(_lists.table, {
+            interval: document.getElementById('exp-filter-interval').value,
+            category_id: document.getElementById('exp-filter-category')?.value || '',
+            payment_method_id: document.getElementById('exp-filter-payment')?.value || '',
+            active: document.getElementById('exp-active-only').checked ? 1 : '',
+        });
+        paintTable();
+    }
 
-        let items = [..._expenses];
-        if (intervalFilter) items = items.filter(e => e.billing_interval === intervalFilter);
-        if (categoryFilter) items = items.filter(e => e.category_id == categoryFilter);
-        if (paymentFilter) items = items.filter(e => e.payment_method_id == paymentFilter);
-        if (activeOnly) items = items.filter(e => e.is_active);
+    function paintTable() {
+        const tbody = document.getElementById('expenses-table-body');
+        const items = _lists.table.items;
 
         tbody.innerHTML = items.map(e => `
             <tr class="table-row">
@@ -139,48 +200,33 @@ ET.Expenses = (function () {
         if (ET.Tooltip && ET.Tooltip.createTooltips) {
             ET.Tooltip.createTooltips();
         }
+        watchEnd('table');
     }
 
     /* ── Summary Cards ───────────────────────────────────────────────── */
-    function renderSummary(stats) {
+    async function renderSummary(stats) {
         const el = document.getElementById('board-summary');
         const now = new Date();
-        const year = now.getFullYear();
-        const month = now.getMonth() + 1;
-        const dim = daysInMonth(year, month);
+        // This month's occurrences come expanded (and converted) from the
+        // server, so the cards don't need every expense on the client
+        const cal = await ET.Utils.api(`/api/calendar?year=${now.getFullYear()}&month=${now.getMonth() + 1}&currency=${ET.Utils.displayCurrency}`) || {};
 
         let monthTotal = 0;
         let recurringTotal = 0;
-        let recurringCount = 0;
         let peakDayTotal = 0;
 
-        for (let d = 1; d <= dim; d++) {
-            const dt = new Date(year, month - 1, d);
+        Object.values(cal).forEach(day => {
             let dayTotal = 0;
-            _expenses.forEach(exp => {
-                if (exp.is_active === 0) return;
-                if (!occursOnDate(exp, dt)) return;
-                dayTotal += ET.Utils.convert(exp.amount, exp.currency, ET.Utils.displayCurrency);
+            day.forEach(occ => {
+                dayTotal += occ.converted_amount;
+                if ((occ.billing_interval || 'once') === 'once') monthTotal += occ.converted_amount;
+                else recurringTotal += occ.converted_amount;
             });
             if (dayTotal > peakDayTotal) peakDayTotal = dayTotal;
-        }
-
-        _expenses.forEach(exp => {
-            if (exp.is_active === 0) return;
-
-            const countInMonth = getOccurrenceCountInMonth(exp, year, month);
-            if (countInMonth <= 0) return;
-
-            const converted = ET.Utils.convert(exp.amount * countInMonth, exp.currency, ET.Utils.displayCurrency);
-            if ((exp.billing_interval || 'once') === 'once') {
-                monthTotal += converted;
-            } else {
-                recurringTotal += converted;
-            }
         });
 
-        recurringCount = _expenses.filter(e => e.is_active !== 0 && (e.billing_interval || 'once') !== 'once').length;
-        const totalCount = (_expenses && _expenses.length) || stats.total_count || 0;
+        const recurringCount = stats.recurring_count || 0;
+        const totalCount = stats.total_count || 0;
         
         el.innerHTML = `
             <div class="summary-card">
@@ -221,167 +267,6 @@ ET.Expenses = (function () {
             </div>`;
     }
 
-    function parseYmd(dateStr) {
-        const [y, m, d] = String(dateStr || '').split('-').map(Number);
-        if (!y || !m || !d) return null;
-        return new Date(y, m - 1, d);
-    }
-
-    function normalizeDate(dt) {
-        const d = new Date(dt);
-        d.setHours(0, 0, 0, 0);
-        return d;
-    }
-
-    function sameYearMonth(dt, year, month) {
-        return dt.getFullYear() === year && (dt.getMonth() + 1) === month;
-    }
-
-    function daysInMonth(year, month) {
-        return new Date(year, month, 0).getDate();
-    }
-
-    function occursOnDate(expense, targetDate) {
-        const billing = parseYmd(expense.billing_date);
-        if (!billing) return false;
-
-        const interval = expense.billing_interval || 'once';
-        const dt = normalizeDate(targetDate);
-        const b = normalizeDate(billing);
-        if (dt < b) return false;
-
-        if (interval === 'once') {
-            return dt.getTime() === b.getTime();
-        }
-
-        if (interval === 'daily') {
-            return true;
-        }
-
-        const wd = dt.getDay();
-        const mon0 = (wd + 6) % 7; // Mon=0 ... Sun=6
-
-        if (interval === 'weekdays') return mon0 <= 4;
-        if (interval === 'weekends') return mon0 >= 5;
-        if (interval === 'specific_days') {
-            const selected = String(expense.specific_days || '')
-                .split(',')
-                .map(x => parseInt(x, 10))
-                .filter(Number.isInteger);
-            return selected.includes(mon0);
-        }
-
-        const msPerDay = 24 * 60 * 60 * 1000;
-        const diffDays = Math.round((dt.getTime() - b.getTime()) / msPerDay);
-
-        if (interval === 'weekly') return diffDays % 7 === 0;
-        if (interval === 'biweekly') return diffDays % 14 === 0;
-        if (interval === 'custom') {
-            const step = parseInt(expense.custom_interval_days, 10) || 0;
-            return step > 0 && diffDays % step === 0;
-        }
-
-        const stepMonths = interval === 'monthly' ? 1
-            : interval === 'bimonthly' ? 2
-            : interval === 'quarterly' ? 3
-            : interval === 'semiannually' ? 6
-            : interval === 'yearly' ? 12
-            : 0;
-
-        if (stepMonths > 0) {
-            const monthsDiff = (dt.getFullYear() - b.getFullYear()) * 12 + (dt.getMonth() - b.getMonth());
-            if (monthsDiff < 0 || monthsDiff % stepMonths !== 0) return false;
-            const dom = Math.min(b.getDate(), daysInMonth(dt.getFullYear(), dt.getMonth() + 1));
-            return dt.getDate() === dom;
-        }
-
-        return false;
-    }
-
-    function getOccurrenceCountInMonth(expense, year, month) {
-        const billing = parseYmd(expense.billing_date);
-        if (!billing) return 0;
-
-        const interval = expense.billing_interval || 'once';
-        const dim = daysInMonth(year, month);
-        const monthStart = new Date(year, month - 1, 1);
-
-        if (interval === 'once') {
-            return sameYearMonth(billing, year, month) ? 1 : 0;
-        }
-
-        if (interval === 'daily') {
-            let count = 0;
-            for (let d = 1; d <= dim; d++) {
-                const dt = new Date(year, month - 1, d);
-                if (dt >= billing) count++;
-            }
-            return count;
-        }
-
-        if (interval === 'weekdays' || interval === 'weekends' || interval === 'specific_days') {
-            const selected = interval === 'specific_days'
-                ? String(expense.specific_days || '').split(',').map(x => parseInt(x, 10)).filter(Number.isInteger)
-                : null;
-            let count = 0;
-            for (let d = 1; d <= dim; d++) {
-                const dt = new Date(year, month - 1, d);
-                if (dt < billing) continue;
-                const wd = dt.getDay();
-                const mon0 = (wd + 6) % 7; // convert JS Sun=0..Sat=6 to Mon=0..Sun=6
-                if (interval === 'weekdays' && mon0 <= 4) count++;
-                else if (interval === 'weekends' && mon0 >= 5) count++;
-                else if (interval === 'specific_days' && selected.includes(mon0)) count++;
-            }
-            return count;
-        }
-
-        if (interval === 'weekly' || interval === 'biweekly') {
-            const step = interval === 'weekly' ? 7 : 14;
-            let dt = new Date(billing);
-            while (dt < monthStart) dt.setDate(dt.getDate() + step);
-            let count = 0;
-            while (sameYearMonth(dt, year, month)) {
-                if (dt >= billing) count++;
-                dt.setDate(dt.getDate() + step);
-            }
-            return count;
-        }
-
-        if (interval === 'custom') {
-            const step = parseInt(expense.custom_interval_days, 10) || 0;
-            if (step <= 0) return 0;
-            let dt = new Date(billing);
-            while (dt < monthStart) dt.setDate(dt.getDate() + step);
-            let count = 0;
-            while (sameYearMonth(dt, year, month)) {
-                if (dt >= billing) count++;
-                dt.setDate(dt.getDate() + step);
-            }
-            return count;
-        }
-
-        if (interval === 'monthly' || interval === 'bimonthly' || interval === 'quarterly' || interval === 'semiannually' || interval === 'yearly') {
-            const stepMonths = interval === 'monthly' ? 1
-                : interval === 'bimonthly' ? 2
-                : interval === 'quarterly' ? 3
-                : interval === 'semiannually' ? 6
-                : 12;
-
-            let dt = new Date(billing);
-            while (dt < monthStart) {
-                const m = dt.getMonth() + 1 + stepMonths;
-                const y = dt.getFullYear() + Math.floor((m - 1) / 12);
-                const nm = ((m - 1) % 12) + 1;
-                const targetDay = Math.min(dt.getDate(), new Date(y, nm, 0).getDate());
-                dt = new Date(y, nm - 1, targetDay);
-            }
-            return sameYearMonth(dt, year, month) && dt >= billing ? 1 : 0;
-        }
-
-        return 0;
-    }
-
     /* ── Populate category filter ────────────────────────────────────── */
     function populateFilters() {
         const sel = document.getElementById('board-filter-cat');
@@ -500,7 +385,7 @@ ET.Expenses = (function () {
     }
 
     function openEditModal(id) {
-        const exp = _expenses.find(e => e.id === id);
+        const exp = getAll().find(e => e.id === id);
         if (!exp) return;
         _editingId = id;
         ET.App.openModal('Edit Expense', buildForm(exp));
@@ -608,7 +493,7 @@ ET.Expenses = (function () {
     window.escAttr = escAttr;
 
     return {
-        load, getAll, renderBoard, renderTable, renderSummary,
+        load, loadMore, fetchPage, getAll, renderBoard, renderTable, renderSummary,
         populateFilters, openAddModal, openEditModal, remove,
         deleteExpense: remove,  // Alias for backward compatibility
         _toggleIntervalOptions,  // For use in inline onclick handlers
@@ -6,7 +6,7 @@ ET.IconUpload = (function () {
     const ALLOWED_TYPES = ['image/png', 'image/jpeg', 'image/webp', 'image/svg+xml'];
 
     /**
-     * Upload icon file and return base64 data
+     * Upload icon file and return its /api/icons/<hash> URL
      */
     async function uploadFile(file) {
         if (!file) return null;
@@ -22,17 +22,15 @@ ET.IconUpload = (function () {
             return null;
         }
 
-        return new Promise((resolve) => {
-            const reader = new FileReader();
-            reader.onload = (e) => {
-                resolve(e.target.result); // Base64 data URL
-            };
-            reader.onerror = () => {
-                ET.Utils.toast('Failed to read file', 'error');
-                resolve(null);
-            };
-            reader.readAsDataURL(file);
-        });
+        const form = new FormData();
+        form.append('file', file);
+        // Let the browser set the multipart Content-Type
+        const res = await ET.Utils.api('/api/icons', { method: 'POST', headers: {}, body: form });
+        if (!res || res.error) {
+            ET.Utils.toast(res?.error || 'Failed to upload file', 'error');
+            return null;
+        }
+        return res.url;
     }
 
     /**
@@ -42,7 +40,7 @@ ET.IconUpload = (function () {
     function renderIcon(iconType, iconValue, sizeClass = '') {
         sizeClass = sizeClass || '';
         const value = iconValue || '';
-        const inferredType = iconType || (typeof value === 'string' && (value.startsWith('data:image/') || value.startsWith('http'))
+        const inferredType = iconType || (typeof value === 'string' && (value.startsWith('data:image/') || value.startsWith('http') || value.startsWith('/api/icons/'))
             ? 'image'
             : 'emoji');
 
@@ -179,10 +177,10 @@ ET.IconUpload = (function () {
             const file = e.target.files[0];
             if (!file) return;
 
-            const base64 = await uploadFile(file);
-            if (base64) {
-                selectedFile = base64;
-                document.getElementById('preview-img').style.backgroundImage = `url('${base64}')`;
+            const url = await uploadFile(file);
+            if (url) {
+                selectedFile = url;
+                document.getElementById('preview-img').style.backgroundImage = `url('${url}')`;
                 document.getElementById('preview-name').textContent = file.name;
                 document.getElementById('preview-size').textContent = `${(file.size / 1024).toFixed(1)} KB`;
                 previewContainer.classList.remove('hidden');
@@ -265,7 +263,7 @@ ET.IconUpload = (function () {
         if (iconType === 'emoji') {
             return iconValue && iconValue.length > 0;
         } else if (iconType === 'image' || iconType === 'upload') {
-            return iconValue && (iconValue.startsWith('data:') || iconValue.startsWith('http'));
+            return iconValue && (iconValue.startsWith('data:') || iconValue.startsWith('http') || iconValue.startsWith('/api/icons/'));
         }
         return false;
     }
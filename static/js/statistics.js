@@ -8,7 +8,7 @@ ET.Statistics = (function () {
         // Destroy existing charts first to prevent canvas reuse issues
         destroyCharts();
 
-        const stats = await ET.Utils.api('/api/stats/summary');
+        const stats = await ET.Utils.api(`/api/stats/summary?currency=${ET.Utils.displayCurrency}`);
         if (!stats) return;
 
         renderSummaryCards(stats);
@@ -225,7 +225,7 @@ ET.Statistics = (function () {
                 </div>`;
             return;
         }
-        const maxAmount = Math.max(...top.map(e => e.amount));
+        const maxAmount = Math.max(...top.map(e => e.converted_amount));
         el.innerHTML = top.map((e, idx) => `
             <div class="flex items-center gap-3 mb-3">
                 <span class="text-xs font-bold text-[var(--text-secondary)] w-5">#${idx + 1}</span>
@@ -233,10 +233,10 @@ ET.Statistics = (function () {
                 <div class="flex-1 min-w-0">
                     <div class="flex justify-between mb-1">
                         <span class="text-sm text-[var(--text-primary)] truncate">${escHtml(e.title)}</span>
-                        <span class="amount-display text-sm text-[var(--text-primary)] ml-2">${ET.Utils.convertAndFormat(e.amount, e.currency)}</span>
+                        <span class="amount-display text-sm text-[var(--text-primary)] ml-2">${ET.Utils.formatMoney(e.converted_amount)}</span>
                     </div>
                     <div class="stat-bar">
-                        <div class="stat-bar-fill" style="width:${(e.amount / maxAmount * 100).toFixed(1)}%;background:${e.category_color || 'var(--accent)'}"></div>
+                        <div class="stat-bar-fill" style="width:${(e.converted_amount / maxAmount * 100).toFixed(1)}%;background:${e.category_color || 'var(--accent)'}"></div>
                     </div>
                 </div>
             </div>
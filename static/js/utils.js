@@ -23,11 +23,37 @@ ET.Utils = (function () {
     const RATE_LIMIT_WINDOW = 60 * 1000; // 1 minute
     const MAX_MANUAL_REFRESHES = 3;
 
+    // GET url -> { etag, body } for conditional requests, least recently
+    // used first; paging and month navigation would otherwise grow it forever
+    const _validators = new Map();
+    const MAX_VALIDATORS = 32;
+
+    function remember(url, entry) {
+        _validators.delete(url);
+        _validators.set(url, entry);
+        while (_validators.size > MAX_VALIDATORS) {
+            _validators.delete(_validators.keys().next().value);
+        }
+    }
+
     async function api(url, opts = {}) {
         const defaults = { headers: { 'Content-Type': 'application/json' } };
-        const res = await fetch(url, { ...defaults, ...opts });
+        const isGet = !opts.method || opts.method.toUpperCase() === 'GET';
+        const cached = isGet ? _validators.get(url) : null;
+        const headers = cached
+            ? { ...defaults.headers, ...opts.headers, 'If-None-Match': cached.etag }
+            : (opts.headers || defaults.headers);
+        const res = await fetch(url, { ...defaults, ...opts, headers });
         if (res.status === 401) { window.location.href = '/login'; return null; }
-        return res.json();
+        // Parse a fresh copy each time so callers can mutate the result
+        if (res.status === 304 && cached) {
+            remember(url, cached);
+            return JSON.parse(cached.body);
+        }
+        const body = await res.text();
+        const etag = res.headers.get('ETag');
+        if (isGet && etag && res.ok) remember(url, { etag, body });
+        return JSON.parse(body);
     }
 
     async function fetchRates(base, isManual = false) {
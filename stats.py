@@ -0,0 +1,113 @@
+"""Aggregation helpers for the statistics API.
+
+Month, category and payment totals come pre-summed per currency from
+``monthly_rollups`` (see rollups.py); these helpers convert each currency
+group once and shape the JSON the frontend expects.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from recurrence import occurrences
+
+
+def month_span(year, month, count):
+    """Return the ``count`` (year, month) pairs ending at year/month, oldest first."""
+    end = year * 12 + month - 1
+    return [(i // 12, i % 12 + 1) for i in range(end - count + 1, end + 1)]
+
+
+def convert_sums(by_currency, factors):
+    """Convert a ``{currency: sum}`` mapping into one total (one multiply per currency)."""
+    return sum(total * factors.get(cur, 1) for cur, total in by_currency.items())
+
+
+def monthly_totals(months, rows, factors):
+    """Build ``[{'month', 'total'}]`` from ``(month, currency, total)`` rows."""
+    totals = {f'{y}-{m:02d}': defaultdict(float) for y, m in months}
+    for month, currency, total in rows:
+        if month in totals:
+            totals[month][currency] += total
+    return [{'month': k, 'total': round(convert_sums(v, factors), 2)}
+            for k, v in totals.items()]
+
+
+def breakdown(rows, fields, factors):
+    """Merge ``(id, currency, total, *fields)`` rows into converted groups, largest first."""
+    groups = {}
+    for r in rows:
+        g = groups.get(r['id'])
+        if g is None:
+            g = groups[r['id']] = {f: r[f] for f in fields}
+            g['by_currency'] = defaultdict(float)
+        g['by_currency'][r['currency']] += r['total']
+    for g in groups.values():
+        g['total'] = round(convert_sums(g.pop('by_currency'), factors), 2)
+    return sorted(groups.values(), key=lambda g: g['total'], reverse=True)
+
+
+def top_occurring(rows, start, end, factors, n=5):
+    """Take the first ``n`` rows that occur in [start, end).
+
+    ``rows`` must already be ordered by converted amount, largest first, so
+    this usually stops after a handful of rows.
+    """
+    top = []
+    for r in rows:
+        if occurrences(r, start, end):
+            top.append({
+                'title': r['title'], 'amount': r['amount'], 'currency': r['currency'],
+                'converted_amount': round(r['amount'] * factors.get(r['currency'], 1), 2),
+                'category_icon': r['category_icon'],
+                'category_icon_type': r['category_icon_type'],
+                'category_color': r['category_color'],
+            })
+            if len(top) == n:
+                break
+    return top
+
+
+GRANULARITIES = ('day', 'week', 'month')
+
+
+def period_key(day, granularity):
+    """Bucket label for ``day``: the date, its ISO week's Monday, or YYYY-MM."""
+    if granularity == 'month':
+        return day.strftime('%Y-%m')
+    if granularity == 'week':
+        day -= timedelta(days=day.weekday())
+    return day.isoformat()
+
+
+def _empty_periods(start, end, granularity):
+    buckets = {}
+    d = start
+    while d < end:
+        buckets.setdefault(period_key(d, granularity), [defaultdict(float), 0])
+        d += timedelta(days=1)
+    return buckets
+
+
+def _converted_periods(buckets, factors):
+    return [{'period': k, 'total': round(convert_sums(by_currency, factors), 2), 'count': n}
+            for k, (by_currency, n) in buckets.items()]
+
+
+def period_totals(expenses, start, end, granularity, factors):
+    """Sum occurrences in [start, end) into zero-filled periods, oldest first."""
+    buckets = _empty_periods(start, end, granularity)
+    for e in expenses:
+        for day in occurrences(e, start, end):
+            bucket = buckets[period_key(day, granularity)]
+            bucket[0][e['currency']] += e['amount']
+            bucket[1] += 1
+    return _converted_periods(buckets, factors)
+
+
+def period_day_totals(day_rows, start, end, granularity, factors):
+    """:func:`period_totals` from pre-summed ``(day, currency, total, count)`` rows."""
+    buckets = _empty_periods(start, end, granularity)
+    for day, currency, total, count in day_rows:
+        bucket = buckets[period_key(day, granularity)]
+        bucket[0][currency] += total
+        bucket[1] += count
+    return _converted_periods(buckets, factors)
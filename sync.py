@@ -0,0 +1,90 @@
+"""Change log behind ``/api/sync``.
+
+Triggers on expenses, categories, payment methods and settings (see
+``SYNC_KINDS`` in database.py) keep one ``sync_log`` row per replicated row:
+its kind, id, whether it was deleted and the data version of the change.
+The version is the value the writing transaction's ``bump_data_version()``
+sets, so a client holding token ``T`` (the data version it last saw) needs
+exactly the rows logged after ``T``. Deletes stay hard deletes; their log
+row is the tombstone.
+
+Tombstones are the only part of the log that grows without bound.
+``python sync.py prune`` drops those older than ``SYNC_TOMBSTONE_DAYS`` and
+raises the user's floor in ``sync_floors``. Clients with a token below the
+floor get a full snapshot again.
+
+Usage::
+
+    python sync.py prune [USER_ID]
+"""
+import sys
+
+import config
+from database import SYNC_KINDS, user_databases
+
+# Ids of ``kind`` rows changed after a version; params (user_id, kind, since)
+CHANGED = 'SELECT row_id FROM sync_log WHERE user_id=? AND kind=? AND version > ? AND NOT deleted'
+
+
+def floor(db, user_id):
+    """Oldest token that can still be answered with a delta."""
+    row = db.execute('SELECT version FROM sync_floors WHERE user_id=?', (user_id,)).fetchone()
+    return row[0] if row else 0
+
+
+def needs_snapshot(db, user_id, since, version):
+    """True unless ``since`` is a token this user's log can bring up to date.
+
+    A token newer than ``version`` comes from another database (e.g. one
+    that was reset) and is not trusted either.
+    """
+    return since is None or since > version or since < floor(db, user_id)
+
+
+def tombstones(db, user_id, since):
+    """Ids deleted after ``since``, by table name."""
+    deleted = {table: [] for table, _ in SYNC_KINDS.values() if table != 'user_settings'}
+    for kind, row_id in db.execute('''
+        SELECT kind, row_id FROM sync_log
+        WHERE user_id=? AND version > ? AND deleted ORDER BY version
+    ''', (user_id, since)):
+        table = SYNC_KINDS[kind][0]
+        if table in deleted:
+            deleted[table].append(row_id)
+    return deleted
+
+
+def prune(db, user_id, days=None):
+    """Drop tombstones older than ``days``; returns how many were removed."""
+    days = config.SYNC_TOMBSTONE_DAYS if days is None else days
+    row = db.execute('''
+        SELECT MAX(version) FROM sync_log
+        WHERE user_id=? AND deleted AND changed_at < datetime('now', ?)
+    ''', (user_id, f'-{days} days')).fetchone()
+    if row[0] is None:
+        return 0
+    # Everything up to that version goes, so any token at or above it still works
+    removed = db.execute('DELETE FROM sync_log WHERE user_id=? AND deleted AND version <= ?',
+                         (user_id, row[0])).rowcount
+    db.execute('''
+        INSERT INTO sync_floors (user_id, version) VALUES (?,?)
+        ON CONFLICT(user_id) DO UPDATE SET version=MAX(version, excluded.version)
+    ''', (user_id, row[0]))
+    return removed
+
+
+def main(argv):
+    if len(argv) < 2 or argv[1] != 'prune':
+        print(__doc__.strip().split('Usage::')[1])
+        return 2
+    for db, users in user_databases(config.DATABASE, int(argv[2]) if len(argv) > 2 else None):
+        for uid in users:
+            removed = prune(db, uid)
+            db.commit()
+            if removed:
+                print(f'user {uid}: {removed} tombstones pruned, floor {floor(db, uid)}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,49 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the repository root, next to app.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    """The Flask app on a generated database (3 users x 300 expenses)."""
+    import config
+    from bench.generate import generate
+    path = str(tmp_path_factory.mktemp('db') / 'test.db')
+    generate(path, users=3, expenses=300)
+    config.DATABASE = path
+    config.HASH_WORKERS = 0
+    # Imported late: app.py opens config.DATABASE at import time
+    from app import app
+    app.config['DATABASE'] = path
+    return app
+
+
+@pytest.fixture
+def client(app):
+    """A test client signed in as user 1."""
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+    return client
+
+
+@pytest.fixture
+def fresh_user(app):
+    """A new account with default categories and no expenses: ``(user_id, client)``."""
+    import defaults
+    from database import connect
+    db = connect(app.config['DATABASE'])
+    n = db.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+    user_id = db.execute("INSERT INTO users (username, password_hash) VALUES (?, '!')",
+                         (f'test{n}',)).lastrowid
+    defaults.seed(db, user_id)
+    db.commit()
+    db.close()
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+    return user_id, client
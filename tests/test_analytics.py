@@ -0,0 +1,80 @@
+"""analytics.summarise: the NumPy and pure-Python backends agree, and match the summary."""
+from datetime import date
+
+import pytest
+
+import analytics
+import rollups
+from database import connect
+
+TODAY = date(2026, 3, 14)
+FACTORS = {'USD': 1.0, 'EUR': 1.1, 'GBP': 1.27, 'JPY': 0.0067, 'AUD': 0.66, 'CAD': 0.73, 'CHF': 1.13}
+CATEGORIES = {1: {'name': 'Rent', 'icon': '🏠', 'icon_type': 'emoji', 'color': '#fff'}}
+
+
+def daily_for(today):
+    start, end = analytics.daily_span(today)
+    return [float(d % 7) * 3.25 for d in range((end - start).days)]
+
+
+def both(columns, months, today=TODAY):
+    """summarise() with NumPy, then with the fallback; returns the two bodies."""
+    pytest.importorskip('numpy')
+    first, _ = analytics.span(today, months)
+    args = (columns, daily_for(today), FACTORS, first, months, today, CATEGORIES)
+    with_numpy = analytics.summarise(*args)
+    np, analytics.np = analytics.np, None
+    try:
+        return with_numpy, analytics.summarise(*args)
+    finally:
+        analytics.np = np
+
+
+@pytest.fixture(scope='module')
+def rows(app):
+    """User 1's rollup columns over 24 months (a few hundred generated expenses)."""
+    db = connect(app.config['DATABASE'])
+    if rollups.ensure(db, 1, TODAY.year, TODAY.month):
+        db.commit()
+    first, end = analytics.span(TODAY, 24)
+    columns = analytics.load(db, 1, first, end)
+    db.close()
+    return columns
+
+
+@pytest.mark.parametrize('months', [1, 2, 3, 13, 24])
+def test_backends_agree_on_the_same_rows(rows, months):
+    first, end = analytics.span(TODAY, months)
+    keep = [i for i, m in enumerate(rows[0])
+            if first.strftime('%Y-%m') <= m < end.strftime('%Y-%m')]
+    columns = tuple(tuple(col[i] for i in keep) for col in rows)
+    assert columns[0]
+    with_numpy, python = both(columns, months)
+    assert with_numpy == python
+
+
+def test_backends_agree_without_rows():
+    with_numpy, python = both(((), (), (), ()), 12)
+    assert with_numpy == python
+    assert python['categories'] == []
+    assert [m['total'] for m in python['monthly']] == [0] * 12
+    assert python['forecast'] == {'month': '2026-04', 'scheduled': 0, 'total': 0}
+
+
+def test_backends_agree_on_a_single_month():
+    columns = (('2026-03', '2026-03', '2026-04'), (1, 0, 1), ('EUR', 'USD', 'GBP'),
+               (100.0, 12.5, 40.0))
+    with_numpy, python = both(columns, 1)
+    assert with_numpy == python
+    assert python['monthly'] == [{'month': '2026-03', 'total': 122.5,
+                                  'rolling_average': None, 'change_year_over_year': None}]
+    rent = python['categories'][0]
+    assert (rent['name'], rent['total'], rent['scheduled_next_month']) == ('Rent', 110.0, 50.8)
+
+
+def test_monthly_totals_match_the_summary(client):
+    summary = client.get('/api/stats/summary?currency=EUR').get_json()['monthly_totals']
+    body = client.get(f'/api/stats/analytics?currency=EUR&months={len(summary)}').get_json()
+    assert [m['month'] for m in body['monthly']] == [m['month'] for m in summary]
+    for ours, theirs in zip(body['monthly'], summary):
+        assert ours['total'] == pytest.approx(theirs['total'], abs=0.011)
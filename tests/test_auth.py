@@ -0,0 +1,71 @@
+"""Login: password verification, hash upgrades and a busy hash pool."""
+import pytest
+from werkzeug.security import generate_password_hash
+
+import auth
+from database import connect
+
+OLD_METHOD = 'pbkdf2:sha256:1000'
+
+
+@pytest.fixture
+def account(app, monkeypatch):
+    """A user whose stored hash uses outdated parameters: ``(username, stored hash)``."""
+    monkeypatch.setattr(auth, 'login_limiter', auth.RateLimiter(60, 100))
+    db = connect(app.config['DATABASE'])
+    n = db.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+    username, stored = f'login{n}', generate_password_hash('hunter22', OLD_METHOD)
+    db.execute('INSERT INTO users (username, password_hash) VALUES (?, ?)', (username, stored))
+    db.commit()
+    db.close()
+    return username, stored
+
+
+def stored_hash(app, username):
+    db = connect(app.config['DATABASE'])
+    try:
+        return db.execute('SELECT password_hash FROM users WHERE username=?',
+                          (username,)).fetchone()[0]
+    finally:
+        db.close()
+
+
+def log_in(app, username, password='hunter22'):
+    return app.test_client().post('/login', data={'username': username, 'password': password})
+
+
+def busy(*args):
+    raise auth.AuthBusy()
+
+
+def test_login_upgrades_an_outdated_hash(app, account):
+    username, stored = account
+    response = log_in(app, username)
+    assert response.status_code == 302 and response.location.endswith('/dashboard')
+    assert stored_hash(app, username) != stored
+    assert not auth.needs_rehash(stored_hash(app, username))
+
+
+@pytest.mark.parametrize('error', [auth.AuthBusy, TimeoutError])
+def test_busy_rehash_still_logs_in(app, account, monkeypatch, caplog, error):
+    username, stored = account
+
+    def fail(password):
+        raise error()
+    monkeypatch.setattr(auth, 'hash_password', fail)
+    response = log_in(app, username)
+    assert response.status_code == 302 and response.location.endswith('/dashboard')
+    assert stored_hash(app, username) == stored
+    assert 'rehash' in caplog.text
+
+
+def test_busy_verification_is_a_503(app, account, monkeypatch):
+    monkeypatch.setattr(auth, 'verify_password', busy)
+    assert log_in(app, account[0]).status_code == 503
+
+
+def test_wrong_password_is_not_upgraded(app, account):
+    username, stored = account
+    response = log_in(app, username, 'wrong')
+    assert response.status_code == 200 and b'Invalid username or password' in response.data
+    assert stored_hash(app, username) == stored
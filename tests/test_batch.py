@@ -0,0 +1,41 @@
+"""Validation in /api/expenses/batch; every failing batch leaves no trace."""
+import pytest
+
+EXPENSE = {'title': 'Batch', 'amount': 5, 'currency': 'USD', 'billing_interval': 'once',
+           'billing_date': '2026-01-15'}
+
+
+@pytest.fixture
+def own_expense(client):
+    return client.get('/api/expenses?limit=1').get_json()['items'][0]['id']
+
+
+def post(client, ops):
+    return client.post('/api/expenses/batch', json=ops)
+
+
+@pytest.mark.parametrize('second', ['update', 'delete'])
+def test_op_on_an_id_deleted_earlier_in_the_batch(client, own_expense, second):
+    op = {'op': second, 'id': own_expense}
+    if second == 'update':
+        op['data'] = EXPENSE
+    response = post(client, [{'op': 'delete', 'id': own_expense}, op])
+    assert response.status_code == 404
+    assert response.get_json() == {'error': 'Expense not found', 'ids': [own_expense]}
+    assert post(client, [{'op': 'delete', 'id': 10 ** 9}]).get_json()['ids'] == [10 ** 9]
+    ids = [e['id'] for e in client.get('/api/expenses?limit=1').get_json()['items']]
+    assert ids == [own_expense]
+
+
+@pytest.mark.parametrize('field', ['category_id', 'payment_method_id'])
+@pytest.mark.parametrize('op', ['create', 'update'])
+def test_foreign_ids_must_be_visible(client, app, own_expense, field, op):
+    from database import connect
+    db = connect(app.config['DATABASE'])
+    table = 'categories' if field == 'category_id' else 'payment_methods'
+    other = db.execute(f'SELECT id FROM {table} WHERE user_id=2 LIMIT 1').fetchone()[0]
+    db.close()
+    ops = [{'op': op, 'id': own_expense, 'data': dict(EXPENSE, **{field: other})}]
+    response = post(client, ops)
+    assert response.status_code == 400
+    assert response.get_json() == {'error': f'unknown {field}', 'index': 0}
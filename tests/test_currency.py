@@ -0,0 +1,18 @@
+"""The ``currency`` argument of the converting endpoints."""
+import pytest
+
+URLS = ['/api/stats/summary', '/api/stats/analytics', '/api/calendar', '/api/upcoming',
+        '/api/calendar/range?start=2026-01-01&end=2026-02-01']
+
+
+@pytest.mark.parametrize('url', URLS)
+def test_unknown_currency_is_rejected(client, url):
+    sep = '&' if '?' in url else '?'
+    response = client.get(f'{url}{sep}currency=XYZ')
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Unknown currency XYZ'}
+    assert client.get(f'{url}{sep}currency=eur').status_code == 200
+
+
+def test_known_currency_labels_the_response(client):
+    assert client.get('/api/stats/summary?currency=eur').get_json()['currency'] == 'EUR'
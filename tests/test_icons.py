@@ -0,0 +1,68 @@
+"""Uploaded icons: content-addressed, deduplicated and private to their owner."""
+import hashlib
+import io
+
+from database import connect
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'icon-test-bytes'
+
+
+def signed_in(app, user_id):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+    return client
+
+
+def upload(client, data=PNG, mimetype='image/png'):
+    return client.post('/api/icons', data={'file': (io.BytesIO(data), 'icon.png', mimetype)},
+                       content_type='multipart/form-data')
+
+
+def stored(app, digest):
+    db = connect(app.config['DATABASE'])
+    rows = db.execute('SELECT user_id FROM icon_uploads WHERE content_hash=? ORDER BY user_id',
+                      (digest,)).fetchall()
+    db.close()
+    return [r[0] for r in rows]
+
+
+def test_upload_is_served_by_hash(client):
+    body = upload(client).get_json()
+    digest = hashlib.sha256(PNG).hexdigest()
+    assert body == {'status': 'ok', 'hash': digest, 'url': f'/api/icons/{digest}'}
+    response = client.get(body['url'])
+    assert response.status_code == 200 and response.data == PNG
+    assert response.mimetype == 'image/png'
+    assert response.headers['ETag'] == f'"{digest}"'
+    assert 'immutable' in response.headers['Cache-Control']
+
+
+def test_same_bytes_are_stored_once_per_user(app, client):
+    digest = upload(client).get_json()['hash']
+    assert upload(client).get_json()['hash'] == digest
+    assert stored(app, digest) == [1]
+
+
+def test_matching_validator_gets_304(client):
+    url = upload(client).get_json()['url']
+    digest = url.rsplit('/', 1)[1]
+    response = client.get(url, headers={'If-None-Match': f'"{digest}"'})
+    assert response.status_code == 304 and response.data == b''
+
+
+def test_other_users_icons_are_not_found(app, client):
+    url = upload(client, PNG + b'-private').get_json()['url']
+    digest = url.rsplit('/', 1)[1]
+    other = signed_in(app, 2)
+    assert other.get(url).status_code == 404
+    assert other.get(url, headers={'If-None-Match': f'"{digest}"'}).status_code == 404
+    # Uploading the same bytes gives them their own copy
+    assert upload(other, PNG + b'-private').get_json()['hash'] == digest
+    assert stored(app, digest) == [1, 2]
+    assert other.get(url).data == PNG + b'-private'
+
+
+def test_rejected_uploads(client):
+    assert upload(client, mimetype='text/html').status_code == 400
+    assert upload(client, b'').status_code == 400
@@ -0,0 +1,27 @@
+"""Diagnostics endpoints and the Server-Timing header."""
+import re
+
+import pytest
+
+import config
+import metrics
+
+
+@pytest.mark.parametrize('path', ['/metrics', '/api/db/pool', '/api/cache/stats'])
+def test_diagnostics_need_the_token(client, monkeypatch, path):
+    monkeypatch.setattr(config, 'METRICS_TOKEN', '')
+    assert client.get(path).status_code == 404
+    monkeypatch.setattr(config, 'METRICS_TOKEN', 'secret')
+    assert client.get(path).status_code == 401
+    assert client.get(path, headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.get(path, headers={'Authorization': 'Bearer secret'}).status_code == 200
+
+
+def test_server_timing_names_statements_without_sql(client, monkeypatch):
+    assert 'Server-Timing' not in client.get('/api/expenses').headers
+    monkeypatch.setattr(config, 'SERVER_TIMING', True)
+    header = client.get('/api/expenses').headers['Server-Timing']
+    slowest = header.split('db-slowest;')[1]
+    assert 'SELECT' not in slowest.upper()
+    assert re.fullmatch(r'dur=[0-9.]+;desc="[0-9a-f]{12}"', slowest)
+    assert metrics.statement_id('SELECT\n  1') == metrics.statement_id('SELECT 1')
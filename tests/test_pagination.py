@@ -0,0 +1,99 @@
+"""Keyset pagination of /api/expenses: every sort key, every filter, stable under inserts."""
+import pytest
+
+from app import EXPENSE_SORTS
+
+INTERVALS = ('once', 'monthly', 'weekly', 'yearly')
+FILTERS = [
+    ({'category_id': None}, lambda e, ids: e['category_id'] == ids['category']),
+    ({'payment_method_id': None}, lambda e, ids: e['payment_method_id'] == ids['payment']),
+    ({'interval': 'monthly'}, lambda e, ids: e['billing_interval'] == 'monthly'),
+    ({'active': '0'}, lambda e, ids: e['is_active'] == 0),
+    ({'date_from': '2026-02-10'}, lambda e, ids: e['billing_date'] >= '2026-02-10'),
+    ({'date_to': '2026-01-20'}, lambda e, ids: e['billing_date'] <= '2026-01-20'),
+    ({'q': 'gym'}, lambda e, ids: 'gym' in (e['title'] + (e['description'] or '')).lower()),
+]
+
+
+def order(items, sort):
+    """Expected order: the sort column, ties broken by id in the same direction."""
+    column, direction = EXPENSE_SORTS[sort]
+    key = column.split('.')[1]
+    return sorted(items, key=lambda e: (e[key], e['id']), reverse=direction == 'DESC')
+
+
+def walk(client, limit, **args):
+    """Follow next_cursor to the end; returns every page's items in order."""
+    items, cursor = [], None
+    while True:
+        response = client.get('/api/expenses', query_string={
+            'limit': limit, **args, **({'cursor': cursor} if cursor else {})})
+        assert response.status_code == 200
+        page = response.get_json()
+        assert len(page['items']) <= limit
+        items += page['items']
+        cursor = page['next_cursor']
+        if not cursor:
+            return items
+
+
+@pytest.fixture
+def listing(fresh_user):
+    """A new account with 40 expenses sharing dates, amounts and titles."""
+    _, client = fresh_user
+    categories = [c['id'] for c in client.get('/api/categories').get_json()]
+    payments = [p['id'] for p in client.get('/api/payment-methods').get_json()]
+    for n in range(40):
+        client.post('/api/expenses', json={
+            'title': ('Gym', 'Rent', 'Coffee', 'Books')[n % 4],
+            'description': 'gym bag' if n % 7 == 0 else '',
+            'amount': (5, 12.5, 30)[n % 3],
+            'currency': 'EUR',
+            'billing_date': f'2026-0{1 + n % 3}-{10 + n % 5}',
+            'billing_interval': INTERVALS[n % 4],
+            'category_id': categories[n % 2],
+            'payment_method_id': payments[n % 2] if n % 5 else None,
+            'is_active': 0 if n % 6 == 0 else 1,
+        })
+    ids = {'category': categories[0], 'payment': payments[0]}
+    return client, client.get('/api/expenses').get_json(), ids
+
+
+@pytest.mark.parametrize('sort', sorted(EXPENSE_SORTS))
+def test_each_sort_key_walks_every_row_once_in_order(listing, sort):
+    client, everything, _ = listing
+    items = walk(client, 7, sort=sort)
+    assert [e['id'] for e in items] == [e['id'] for e in order(everything, sort)]
+
+
+@pytest.mark.parametrize('args,keep', FILTERS, ids=[next(iter(a)) for a, _ in FILTERS])
+def test_each_filter_holds_across_pages(listing, args, keep):
+    client, everything, ids = listing
+    args = {k: ids['category' if k == 'category_id' else 'payment'] if v is None else v
+            for k, v in args.items()}
+    expected = [e for e in order(everything, 'amount-desc') if keep(e, ids)]
+    assert 4 < len(expected) < len(everything)
+    items = walk(client, 4, sort='amount-desc', **args)
+    assert [e['id'] for e in items] == [e['id'] for e in expected]
+
+
+def test_cursor_is_stable_under_inserts(listing):
+    client, everything, _ = listing
+    first = client.get('/api/expenses', query_string={'limit': 10}).get_json()
+    # New rows land both before and after the cursor position
+    for day in ('2026-01-01', '2026-02-12', '2026-12-31'):
+        client.post('/api/expenses', json={'title': 'Late', 'amount': 1, 'currency': 'EUR',
+                                           'billing_date': day})
+    rest = walk(client, 10, cursor=first['next_cursor'])
+    seen = [e['id'] for e in first['items'] + rest]
+    assert len(seen) == len(set(seen))
+    before = {e['id'] for e in everything}
+    assert [i for i in seen if i in before] == [e['id'] for e in order(everything, 'date-desc')]
+    # Only the rows sorting after the cursor show up in this walk
+    assert [e['billing_date'] for e in rest if e['id'] not in before] == ['2026-02-12', '2026-01-01']
+
+
+def test_invalid_arguments(listing):
+    client, _, _ = listing
+    for args in ({'sort': 'price'}, {'limit': 'ten'}, {'cursor': 'not-a-cursor'}):
+        assert client.get('/api/expenses', query_string=args).status_code == 400
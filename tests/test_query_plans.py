@@ -0,0 +1,64 @@
+"""The hot read paths must reach ``expenses`` through an index.
+
+Every SELECT that the list, stats, calendar and sync endpoints run is
+captured with its parameters and replayed under ``EXPLAIN QUERY PLAN``. A
+plan step that scans ``expenses`` (by name or through the ``e`` alias) fails
+the test; see ``INDEXES`` in database.py.
+"""
+import re
+from datetime import date
+
+import pytest
+
+from database import connect
+from metrics import InstrumentedConnection
+
+FULL_SCAN = re.compile(r'\bSCAN (expenses|e)\b(?!_)')
+
+today = date.today()
+ROUTES = [
+    '/api/expenses',
+    '/api/expenses?limit=50&sort=date-desc',
+    '/api/expenses?limit=50&sort=amount-desc',
+    '/api/expenses?limit=50&sort=title-asc&category_id=1',
+    '/api/expenses?limit=50&interval=monthly&active=1',
+    f'/api/expenses?limit=50&date_from={today.year}-01-01&date_to={today.year}-12-31',
+    '/api/stats/summary',
+    '/api/stats/analytics',
+    f'/api/calendar?year={today.year}&month={today.month}',
+    f'/api/calendar?year={today.year - 5}&month=1',
+    f'/api/calendar/range?start={today.year}-01-01&end={today.year}-12-31&granularity=month',
+    '/api/calendar/range?start=2010-01-01&end=2010-12-31&granularity=month',
+    '/api/upcoming',
+    '/api/sync',
+    '/api/sync?since=1',
+]
+
+
+@pytest.fixture
+def captured(monkeypatch):
+    statements = []
+    execute = InstrumentedConnection.execute
+
+    def recording(self, sql, parameters=()):
+        statements.append((sql, parameters))
+        return execute(self, sql, parameters)
+
+    monkeypatch.setattr(InstrumentedConnection, 'execute', recording)
+    return statements
+
+
+@pytest.mark.parametrize('url', ROUTES)
+def test_no_full_scan_of_expenses(app, client, captured, url):
+    assert client.get(url).status_code == 200
+    selects = [(sql, params) for sql, params in captured
+               if sql.lstrip().upper().startswith(('SELECT', 'WITH')) and 'expenses' in sql]
+    assert selects, 'no expense queries captured'
+    db = connect(app.config['DATABASE'])
+    try:
+        for sql, params in selects:
+            plan = [row[3] for row in db.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+            scans = [step for step in plan if FULL_SCAN.search(step)]
+            assert not scans, f'{url} scans expenses: {scans}\n{sql}'
+    finally:
+        db.close()
@@ -0,0 +1,244 @@
+"""Upstream rate fetching against a local stub provider.
+
+A threaded HTTP server stands in for both sources: ``/primary/USD`` for the
+configured API and ``/fallback.json`` for the CDN. Each test sets how every
+path answers (delay, status) and reads back how often it was called.
+"""
+import json
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+import config
+import rates
+
+PRIMARY = {'rates': {'USD': 1, 'EUR': 0.9}}
+FALLBACK = {'usd': {'usd': 1, 'eur': 0.8}}
+
+
+class Provider:
+    def __init__(self):
+        self.behaviour = {}         # path -> (delay seconds, status)
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def answer(self, path):
+        with self._lock:
+            self.calls[path] = self.calls.get(path, 0) + 1
+        delay, status = self.behaviour.get(path, (0, 200))
+        time.sleep(delay)
+        body = PRIMARY if path.startswith('/primary') else FALLBACK
+        return status, json.dumps(body).encode()
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    stub = Provider()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            status, body = stub.answer(self.path)
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+    monkeypatch.setenv('NO_PROXY', '127.0.0.1')
+    monkeypatch.setattr(rates, 'FALLBACK_URL', f'{base}/fallback.json')
+    monkeypatch.setattr(rates, '_breakers', {})
+    monkeypatch.setattr(config, 'RATES_TIMEOUT', 2)
+    monkeypatch.setattr(config, 'RATES_BREAKER_FAILURES', 2)
+    monkeypatch.setattr(config, 'RATES_BREAKER_RESET', 0.3)
+    stub.api_url = f'{base}/primary/'
+    yield stub
+    server.shutdown()
+    server.server_close()
+
+
+def primary_breaker(stub):
+    return rates._breaker(f'{stub.api_url}USD')
+
+
+def test_fast_source_wins_the_race(provider):
+    provider.behaviour['/primary/USD'] = (1.0, 200)
+    started = time.monotonic()
+    assert rates._fetch_usd(provider.api_url) == {'USD': 1, 'EUR': 0.8}
+    assert time.monotonic() - started < 0.8
+
+
+def test_primary_answer_is_used_when_both_are_healthy(provider):
+    provider.behaviour['/fallback.json'] = (0.5, 200)
+    assert rates._fetch_usd(provider.api_url) == PRIMARY['rates']
+
+
+def test_failures_are_counted_per_source(provider):
+    provider.behaviour['/primary/USD'] = (0, 500)
+    assert rates._fetch_usd(provider.api_url) == {'USD': 1, 'EUR': 0.8}
+    time.sleep(0.1)                 # the losing request reports after the winner
+    assert primary_breaker(provider).failures == 1
+    assert rates._breaker(rates.FALLBACK_URL).failures == 0
+    provider.behaviour['/fallback.json'] = (0, 503)
+    assert rates._fetch_usd(provider.api_url) is None
+
+
+def test_open_breaker_skips_the_source(provider):
+    provider.behaviour['/primary/USD'] = (0, 500)
+    provider.behaviour['/fallback.json'] = (0, 500)
+    for _ in range(config.RATES_BREAKER_FAILURES):
+        rates._fetch_usd(provider.api_url)
+    assert provider.calls['/primary/USD'] == 2
+    assert not primary_breaker(provider).allow()
+    assert rates._fetch_usd(provider.api_url) is None
+    assert provider.calls == {'/primary/USD': 2, '/fallback.json': 2}
+
+
+def test_half_open_lets_one_probe_through_and_reopens_on_failure(provider):
+    provider.behaviour['/primary/USD'] = (0, 500)
+    breaker = primary_breaker(provider)
+    for _ in range(config.RATES_BREAKER_FAILURES):
+        breaker.failure()
+    time.sleep(config.RATES_BREAKER_RESET + 0.05)
+    assert breaker.allow()
+    assert not breaker.allow()      # only one probe while it is in flight
+    breaker.failure()
+    assert not breaker.allow()
+    # Through _fetch_usd: the probe goes out once and fails again
+    time.sleep(config.RATES_BREAKER_RESET + 0.05)
+    rates._fetch_usd(provider.api_url)
+    time.sleep(0.1)
+    assert provider.calls['/primary/USD'] == 1
+    assert not breaker.allow()
+
+
+def test_successful_probe_closes_the_breaker(provider):
+    breaker = primary_breaker(provider)
+    for _ in range(config.RATES_BREAKER_FAILURES):
+        breaker.failure()
+    provider.behaviour['/fallback.json'] = (0, 500)
+    assert rates._fetch_usd(provider.api_url) is None
+    assert '/primary/USD' not in provider.calls
+    time.sleep(config.RATES_BREAKER_RESET + 0.05)
+    assert rates._fetch_usd(provider.api_url) == PRIMARY['rates']
+    assert breaker.failures == 0
+    assert breaker.allow() and breaker.allow()
+
+
+@pytest.fixture
+def snapshot_db(tmp_path, monkeypatch):
+    from database import SCHEMA, connect
+    path = str(tmp_path / 'rates.db')
+    db = connect(path)
+    db.executescript(SCHEMA)
+    db.close()
+    monkeypatch.setattr(rates, '_memory', {})
+    return path
+
+
+def store(path, api_url, usd, fetched_at):
+    from database import connect
+    db = connect(path)
+    db.execute('INSERT OR REPLACE INTO rate_snapshots (api_url, rates, fetched_at) VALUES (?,?,?)',
+               (api_url, json.dumps(usd), fetched_at))
+    db.commit()
+    db.close()
+
+
+def test_generation_and_rates_follow_the_stored_snapshot(snapshot_db):
+    assert rates.rates_generation(snapshot_db) == 0
+    now = time.time()
+    store(snapshot_db, 'primary', {'USD': 1, 'EUR': 0.9}, now - 10)
+    assert rates.get_rates(snapshot_db, 'primary', 'USD')['EUR'] == 0.9
+    assert rates.rates_generation(snapshot_db) == now - 10
+
+    # Another worker stores a newer snapshot while ours is still fresh
+    store(snapshot_db, 'primary', {'USD': 1, 'EUR': 0.8}, now)
+    assert rates.rates_generation(snapshot_db) == now
+    assert rates.get_rates(snapshot_db, 'primary', 'USD')['EUR'] == 0.8
+    assert rates._memory['primary'][1] == now
+
+
+
+class QueueingExecutor:
+    """Runs the primary fetch at once and leaves everything else queued."""
+
+    def __init__(self, run):
+        self.run = run
+
+    def submit(self, fn, url, parse):
+        future = Future()
+        if url.startswith(self.run):
+            future.set_result(fn(url, parse))
+        return future
+
+
+def test_cancelled_probe_hands_back_the_trial(provider, monkeypatch):
+    """A half-open probe still queued when the other source wins is cancelled
+    before it runs; the breaker must let the next probe through."""
+    monkeypatch.setattr(rates, '_executor', QueueingExecutor(provider.api_url))
+    fallback = rates._breaker(rates.FALLBACK_URL)
+    for _ in range(config.RATES_BREAKER_FAILURES):
+        fallback.failure()
+    time.sleep(config.RATES_BREAKER_RESET + 0.05)
+    assert rates._fetch_usd(provider.api_url) == PRIMARY['rates']
+    assert '/fallback.json' not in provider.calls
+    assert fallback.allow()
+
+
+def hold_lease(path, api_url, seconds):
+    """Stand in for another worker that has claimed the lease on a cold start."""
+    from database import connect
+    db = connect(path)
+    db.execute('INSERT INTO rate_snapshots (api_url, rates, fetched_at, refresh_until) '
+               'VALUES (?, NULL, 0, ?)', (api_url, time.time() + seconds))
+    db.commit()
+    db.close()
+
+
+@pytest.fixture
+def fetches(monkeypatch):
+    """Replace the upstream fetch; ``fetches.times`` records when it ran."""
+    stub = SimpleNamespace(times=[], result={'USD': 1, 'EUR': 0.7})
+
+    def fetch(api_url):
+        stub.times.append(time.time())
+        return stub.result
+    monkeypatch.setattr(rates, '_fetch_usd', fetch)
+    monkeypatch.setattr(config, 'RATES_LEASE_POLL', 0.02)
+    return stub
+
+
+def test_lease_loser_waits_for_the_winners_snapshot(snapshot_db, fetches):
+    hold_lease(snapshot_db, 'primary', 30)
+    timer = threading.Timer(0.1, store, (snapshot_db, 'primary', {'USD': 1, 'EUR': 0.9}, time.time()))
+    timer.start()
+    assert rates.get_rates(snapshot_db, 'primary', 'USD')['EUR'] == 0.9
+    timer.join()
+    assert fetches.times == []
+
+
+def test_lease_loser_fetches_once_the_lease_expires(snapshot_db, fetches):
+    hold_lease(snapshot_db, 'primary', 0.2)
+    started = time.time()
+    assert rates.get_rates(snapshot_db, 'primary', 'USD')['EUR'] == 0.7
+    assert len(fetches.times) == 1 and fetches.times[0] - started >= 0.2
+    rates._memory.clear()
+    assert rates.get_rates(snapshot_db, 'primary', 'USD')['EUR'] == 0.7
+    assert len(fetches.times) == 1
+
+
+def test_failed_fetch_hands_back_the_lease(snapshot_db, fetches):
+    fetches.result = None
+    assert rates.get_rates(snapshot_db, 'primary', 'USD') == rates.FALLBACK_RATES
+    assert rates._acquire_lease(snapshot_db, 'primary')
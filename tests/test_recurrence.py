@@ -0,0 +1,140 @@
+"""recurrence.occurrences against the per-month loops it replaced.
+
+``legacy_month_days`` is the loop from the original ``get_calendar_data``,
+kept as the oracle. Expenses, windows and billing days (weighted towards
+the 29th-31st) are drawn from seeded random generators, so every failure
+can be replayed from its seed.
+"""
+import calendar
+import random
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from recurrence import occurrences
+
+INTERVALS = ['once', 'daily', 'weekdays', 'weekends', 'weekly', 'biweekly', 'monthly',
+             'quarterly', 'yearly', 'custom', 'specific_days', 'bimonthly', 'semiannually']
+MONTH_STEPS = {'bimonthly': 2, 'quarterly': 3, 'semiannually': 6}
+
+
+def legacy_month_days(e, year, month):
+    """Day numbers on which ``e`` falls in year/month, as the old calendar loop computed them."""
+    days_in_month = calendar.monthrange(year, month)[1]
+    billing = datetime.strptime(e['billing_date'], '%Y-%m-%d')
+    interval = e['billing_interval']
+    result = []
+    if interval == 'once':
+        if billing.year == year and billing.month == month:
+            result.append(billing.day)
+    elif interval in ('daily', 'weekdays', 'weekends'):
+        for d in range(1, days_in_month + 1):
+            dt = datetime(year, month, d)
+            if dt >= billing and (interval == 'daily' or (dt.weekday() < 5) == (interval == 'weekdays')):
+                result.append(d)
+    elif interval in ('weekly', 'biweekly') or (interval == 'custom' and e['custom_interval_days'] > 0):
+        step = {'weekly': 7, 'biweekly': 14}.get(interval) or e['custom_interval_days']
+        dt = billing
+        while dt.year < year or (dt.year == year and dt.month < month):
+            dt += timedelta(days=step)
+        while dt.month == month and dt.year == year:
+            if dt >= billing:
+                result.append(dt.day)
+            dt += timedelta(days=step)
+    elif interval == 'monthly':
+        target_day = min(billing.day, days_in_month)
+        if datetime(year, month, target_day) >= billing:
+            result.append(target_day)
+    elif interval in MONTH_STEPS:
+        dt = billing
+        while dt < datetime(year, month, 1):
+            m = dt.month + MONTH_STEPS[interval]
+            y = dt.year + (m - 1) // 12
+            m = ((m - 1) % 12) + 1
+            dt = datetime(y, m, min(dt.day, calendar.monthrange(y, m)[1]))
+        if dt.year == year and dt.month == month:
+            result.append(dt.day)
+    elif interval == 'yearly':
+        if billing.month == month:
+            target_day = min(billing.day, days_in_month)
+            if datetime(year, month, target_day) >= billing:
+                result.append(target_day)
+    elif interval == 'specific_days' and e.get('specific_days'):
+        selected = [int(x.strip()) for x in e['specific_days'].split(',') if x.strip().isdigit()]
+        for d in range(1, days_in_month + 1):
+            dt = datetime(year, month, d)
+            if dt >= billing and dt.weekday() in selected:
+                result.append(d)
+    return result
+
+
+def legacy_window(e, start, end):
+    """The oracle over any [start, end): run it per month and clip."""
+    days = []
+    y, m = start.year, start.month
+    while date(y, m, 1) < end:
+        days += [date(y, m, d) for d in legacy_month_days(e, y, m)]
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+    return sorted(d for d in days if start <= d < end)
+
+
+def random_expense(rng, interval=None):
+    year, month = rng.randint(2015, 2030), rng.randint(1, 12)
+    last = calendar.monthrange(year, month)[1]
+    # Half the billing dates sit on the month-end days where clamping happens
+    day = rng.choice([d for d in (29, 30, 31) if d <= last] or [last]) if rng.random() < 0.5 \
+        else rng.randint(1, last)
+    return {
+        'billing_date': date(year, month, day).isoformat(),
+        'billing_interval': interval or rng.choice(INTERVALS),
+        'custom_interval_days': rng.randint(1, 120),
+        'specific_days': ','.join(str(d) for d in rng.sample(range(7), rng.randint(1, 4))),
+    }
+
+
+def random_window(rng, expense):
+    billing = date.fromisoformat(expense['billing_date'])
+    # Before, around and long after the billing date
+    start = billing + timedelta(days=rng.randint(-400, 6 * 365))
+    return start, start + timedelta(days=rng.randint(1, 500))
+
+
+@pytest.mark.parametrize('interval', INTERVALS)
+@pytest.mark.parametrize('seed', range(20))
+def test_matches_legacy_over_random_windows(interval, seed):
+    rng = random.Random(f'{interval}-{seed}')
+    for _ in range(25):
+        e = random_expense(rng, interval)
+        start, end = random_window(rng, e)
+        assert occurrences(e, start, end) == legacy_window(e, start, end), (e, start, end)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_matches_legacy_per_calendar_month(seed):
+    rng = random.Random(seed)
+    for _ in range(200):
+        e = random_expense(rng)
+        year, month = rng.randint(2015, 2036), rng.randint(1, 12)
+        start = date(year, month, 1)
+        end = date(year + month // 12, month % 12 + 1, 1)
+        expected = [date(year, month, d) for d in legacy_month_days(e, year, month)]
+        assert occurrences(e, start, end) == expected, (e, year, month)
+
+
+@pytest.mark.parametrize('interval', sorted(MONTH_STEPS) + ['monthly', 'yearly'])
+@pytest.mark.parametrize('day', [29, 30, 31])
+def test_month_end_clamping_over_ten_years(interval, day):
+    for month in range(1, 13):
+        if day > calendar.monthrange(2020, month)[1]:
+            continue
+        e = {'billing_date': date(2020, month, day).isoformat(), 'billing_interval': interval,
+             'custom_interval_days': 0, 'specific_days': None}
+        start, end = date(2020, 1, 1), date(2030, 1, 1)
+        assert occurrences(e, start, end) == legacy_window(e, start, end), e
+
+
+def test_window_is_half_open():
+    e = {'billing_date': '2024-01-01', 'billing_interval': 'daily',
+         'custom_interval_days': 0, 'specific_days': None}
+    assert occurrences(e, date(2024, 1, 1), date(2024, 1, 3)) == [date(2024, 1, 1), date(2024, 1, 2)]
+    assert occurrences(e, date(2024, 1, 3), date(2024, 1, 3)) == []
@@ -0,0 +1,117 @@
+"""The result cache: LRU limits, TTL, invalidation and the shared tier."""
+import pytest
+
+import config
+import resultcache
+from database import SCHEMA, bump_data_version, connect
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resultcache.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_entry_limit_evicts_least_recently_used():
+    cache = resultcache.LRUCache(max_entries=2, max_bytes=1000, ttl=60)
+    cache.put((1, 'a'), b'a')
+    cache.put((1, 'b'), b'b')
+    assert cache.get((1, 'a')) == b'a'          # now b is the oldest
+    cache.put((1, 'c'), b'c')
+    assert cache.get((1, 'b')) is None
+    assert cache.get((1, 'a')) == b'a' and cache.get((1, 'c')) == b'c'
+    assert cache.stats()['evictions'] == 1 and cache.stats()['entries'] == 2
+
+
+def test_byte_limit_evicts_and_skips_oversized_bodies():
+    cache = resultcache.LRUCache(max_entries=10, max_bytes=10, ttl=60)
+    cache.put((1, 'a'), b'x' * 6)
+    cache.put((2, 'b'), b'y' * 6)
+    assert cache.get((1, 'a')) is None and cache.stats()['bytes'] == 6
+    cache.put((1, 'big'), b'z' * 11)
+    assert cache.get((1, 'big')) is None and cache.get((2, 'b')) == b'y' * 6
+    cache.put((2, 'b'), b'w' * 2)               # replacing an entry frees its bytes
+    assert cache.stats()['bytes'] == 2
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = resultcache.LRUCache(max_entries=10, max_bytes=100, ttl=30)
+    cache.put((1, 'a'), b'a')
+    clock[0] += 30
+    assert cache.get((1, 'a')) == b'a'
+    clock[0] += 0.1
+    assert cache.get((1, 'a')) is None
+    stats = cache.stats()
+    assert (stats['expirations'], stats['entries'], stats['bytes']) == (1, 0, 0)
+
+
+def test_invalidate_drops_only_that_user():
+    cache = resultcache.LRUCache(max_entries=10, max_bytes=100, ttl=60)
+    cache.put((1, 'a'), b'a')
+    cache.put((1, 'b'), b'b')
+    cache.put((2, 'a'), b'c')
+    cache.invalidate(1)
+    assert cache.get((1, 'a')) is None and cache.get((1, 'b')) is None
+    assert cache.get((2, 'a')) == b'c'
+    assert cache.stats()['invalidations'] == 2
+
+
+@pytest.fixture
+def shared(tmp_path, monkeypatch):
+    """Two workers' caches over one shared ``result_cache`` table."""
+    db = connect(str(tmp_path / 'cache.db'))
+    db.executescript(SCHEMA)
+    for uid in (1, 2):
+        db.execute("INSERT INTO users (id, username, password_hash) VALUES (?, ?, '!')",
+                   (uid, f'u{uid}'))
+    db.commit()
+    monkeypatch.setattr(config, 'RESULT_CACHE_SHARED', True)
+    workers = [resultcache.LRUCache(10, 1000, 60) for _ in range(2)]
+    monkeypatch.setattr(resultcache, '_cache', workers[0])
+    yield db, workers, lambda n: monkeypatch.setattr(resultcache, '_cache', workers[n])
+    db.close()
+
+
+def test_misses_fall_through_to_the_shared_tier(shared):
+    db, workers, use = shared
+    resultcache.store(db, 1, 'tag', b'body')
+    use(1)
+    assert resultcache.lookup(db, 1, 'tag') == b'body'
+    assert workers[1].stats()['shared_hits'] == 1
+    assert workers[1].get((1, 'tag')) == b'body'    # promoted into this worker's LRU
+    assert resultcache.lookup(db, 1, 'other') is None
+    assert resultcache.lookup(db, 2, 'tag') is None
+    assert workers[1].stats()['shared_misses'] == 2
+
+
+def test_expired_shared_rows_are_not_served(shared, monkeypatch):
+    db, workers, use = shared
+    resultcache.store(db, 1, 'tag', b'body')
+    db.execute('UPDATE result_cache SET expires_at = 0')
+    use(1)
+    assert resultcache.lookup(db, 1, 'tag') is None
+
+
+def test_data_version_bump_invalidates_both_tiers(shared):
+    db, workers, use = shared
+    resultcache.store(db, 1, 'tag', b'body')
+    resultcache.store(db, 2, 'tag', b'other')
+    bump_data_version(db, 1)
+    db.commit()
+    assert workers[0].get((1, 'tag')) is None
+    use(1)
+    assert resultcache.lookup(db, 1, 'tag') is None
+    assert resultcache.lookup(db, 2, 'tag') == b'other'
+
+
+def test_routes_serve_cached_bodies_until_a_write(client, monkeypatch):
+    monkeypatch.setattr(resultcache, '_cache', resultcache.LRUCache(10, 10 ** 7, 60))
+    first = client.get('/api/stats/summary')
+    assert resultcache.stats()['entries'] == 1
+    second = client.get('/api/stats/summary')
+    assert second.data == first.data and resultcache.stats()['hits'] == 1
+    expense = client.get('/api/expenses?limit=1').get_json()['items'][0]
+    client.put(f"/api/expenses/{expense['id']}", json=expense)
+    assert resultcache.stats()['entries'] == 0
+    assert client.get('/api/stats/summary').headers['ETag'] != first.headers['ETag']
@@ -0,0 +1,167 @@
+"""Incremental rollup maintenance against a brute-force expansion.
+
+Every kind of write the app has (create, update, delete, batch, import,
+deleting a category or payment method) is followed by ``rollups.check()``
+and a comparison of ``/api/stats/summary`` with the expenses expanded from
+scratch. All amounts are in USD, so the summary needs no conversion.
+"""
+import io
+import json
+from collections import defaultdict
+from datetime import date
+
+import pytest
+
+import rollups
+from database import connect
+from recurrence import month_window, occurrences
+from stats import month_span
+
+
+def expense(title, amount, billing_date, interval='once', **fields):
+    return {'title': title, 'amount': amount, 'currency': 'USD',
+            'billing_date': billing_date, 'billing_interval': interval, **fields}
+
+
+def months_ago(n, day=1):
+    today = date.today()
+    index = today.year * 12 + today.month - 1 - n
+    return date(index // 12, index % 12 + 1, day).isoformat()
+
+
+def brute_force(db, user_id):
+    """Month totals and this month's totals by category name, from the expenses."""
+    today = date.today()
+    months = month_span(today.year, today.month, 12)
+    names = {r['id']: r['name'] for r in db.execute('SELECT id, name FROM categories')}
+    totals, categories = defaultdict(float), defaultdict(float)
+    for e in db.execute('SELECT * FROM expenses WHERE user_id=?', (user_id,)):
+        if e['billing_interval'] != 'once' and not e['is_active']:
+            continue
+        for y, m in months:
+            n = len(occurrences(e, *month_window(y, m)))
+            totals[f'{y}-{m:02d}'] += n * e['amount']
+            if (y, m) == (today.year, today.month) and n:
+                categories[names.get(e['category_id'])] += n * e['amount']
+    return ([{'month': f'{y}-{m:02d}', 'total': round(totals[f'{y}-{m:02d}'], 2)} for y, m in months],
+            {name: round(total, 2) for name, total in categories.items()})
+
+
+def assert_consistent(app, user_id, client):
+    summary = client.get('/api/stats/summary?currency=USD').get_json()
+    db = connect(app.config['DATABASE'])
+    try:
+        assert rollups.check(db, user_id) == []
+        monthly, categories = brute_force(db, user_id)
+    finally:
+        db.close()
+    assert summary['monthly_totals'] == monthly
+    assert summary['month_total'] == monthly[-1]['total']
+    assert {c['name']: c['total'] for c in summary['categories'] if c['total']} == \
+        {k: v for k, v in categories.items() if v}
+
+
+@pytest.fixture
+def user(app, fresh_user):
+    user_id, client = fresh_user
+    categories = client.get('/api/categories').get_json()
+    methods = client.get('/api/payment-methods').get_json()
+    # Build the rollups first, so every later write goes through apply()
+    assert client.get('/api/stats/summary').status_code == 200
+    return user_id, client, [c['id'] for c in categories], [m['id'] for m in methods]
+
+
+def create(client, data):
+    response = client.post('/api/expenses', json=data)
+    assert response.status_code == 200
+    return response.get_json()['id']
+
+
+def test_new_account_summary(app, fresh_user):
+    user_id, client = fresh_user
+    summary = client.get('/api/stats/summary').get_json()
+    assert summary['month_total'] == 0 and summary['top_expenses'] == []
+    assert_consistent(app, user_id, client)
+
+
+def test_mixed_writes_leave_no_drift(app, user):
+    user_id, client, categories, methods = user
+    rent = create(client, expense('Rent', 900, months_ago(14, 31), 'monthly',
+                                  category_id=categories[0], payment_method_id=methods[0]))
+    gym = create(client, expense('Gym', 12.5, months_ago(3, 2), 'weekly', category_id=categories[1]))
+    create(client, expense('Laptop', 1500, months_ago(0, 1), category_id=categories[1]))
+    create(client, expense('Domain', 20, months_ago(11, 15), 'yearly', payment_method_id=methods[1]))
+    create(client, expense('Plants', 7, months_ago(2, 5), 'custom', custom_interval_days=10))
+    assert_consistent(app, user_id, client)
+
+    client.put(f'/api/expenses/{rent}', json=expense('Rent', 950, months_ago(6, 30), 'monthly',
+                                                       category_id=categories[2]))
+    client.put(f'/api/expenses/{gym}', json=expense('Gym', 12.5, months_ago(3, 2), 'biweekly',
+                                                      category_id=categories[1]))
+    assert_consistent(app, user_id, client)
+
+    client.delete(f'/api/expenses/{gym}')
+    assert_consistent(app, user_id, client)
+
+    response = client.post('/api/expenses/batch', json=[
+        {'op': 'create', 'data': expense('Coffee', 3.2, months_ago(1, 9), 'daily',
+                                         category_id=categories[0])},
+        {'op': 'update', 'id': rent, 'data': expense('Rent', 1000, months_ago(6, 30), 'monthly',
+                                                     category_id=categories[0],
+                                                     payment_method_id=methods[0])},
+        {'op': 'create', 'data': expense('Gift', 50, months_ago(5, 20))},
+    ])
+    assert response.status_code == 200
+    assert_consistent(app, user_id, client)
+
+    lines = [json.dumps(expense(f'Imported {i}', 10 + i, months_ago(i % 12, 10),
+                                'monthly' if i % 3 else 'once', category_id=categories[1]))
+             for i in range(8)]
+    response = client.post('/api/expenses/import?format=ndjson',
+                           data={'file': (io.BytesIO('\n'.join(lines).encode()), 'x.ndjson')},
+                           content_type='multipart/form-data')
+    assert response.get_json()['imported'] == 8
+    assert_consistent(app, user_id, client)
+
+    # Deleting a category or payment method folds their rollups into "none"
+    client.delete(f'/api/categories/{categories[1]}')
+    client.delete(f'/api/payment-methods/{methods[0]}')
+    assert_consistent(app, user_id, client)
+
+
+def test_deactivated_recurring_expenses_leave_every_month(app, user):
+    """``is_active`` pauses a recurring expense everywhere, past months included.
+
+    The flag carries no end date, so stats treat it like the calendar does:
+    an inactive recurring expense has no occurrences at all, and
+    reactivating it brings its whole history back. One-time expenses count
+    whatever the flag says.
+    """
+    user_id, client, _, _ = user
+    data = expense('Streaming', 15, months_ago(8, 3), 'monthly')
+    eid = create(client, data)
+    create(client, expense('Old fridge', 400, months_ago(4, 3), is_active=0))
+    before = client.get('/api/stats/summary?currency=USD').get_json()['monthly_totals']
+    assert [m['total'] for m in before[-9:]] == [15] * 4 + [415] + [15] * 4
+
+    client.put(f'/api/expenses/{eid}', json=dict(data, is_active=0))
+    paused = client.get('/api/stats/summary?currency=USD').get_json()
+    assert [m['total'] for m in paused['monthly_totals'][-9:]] == [0] * 4 + [400] + [0] * 4
+    assert paused['recurring_count'] == 0
+    assert_consistent(app, user_id, client)
+
+    client.put(f'/api/expenses/{eid}', json=dict(data, is_active=1))
+    assert client.get('/api/stats/summary?currency=USD').get_json()['monthly_totals'] == before
+    assert_consistent(app, user_id, client)
+
+
+def test_check_reports_drift_and_rebuild_repairs_it(app, user):
+    user_id, client, _, _ = user
+    create(client, expense('Rent', 900, months_ago(2, 1), 'monthly'))
+    db = connect(app.config['DATABASE'])
+    db.execute('UPDATE monthly_rollups SET total = total + 1 WHERE user_id=?', (user_id,))
+    problems = rollups.check(db, user_id)
+    assert problems and all(p['stored'][0] == p['expected'][0] + 1 for p in problems)
+    rollups.rebuild(db, user_id)
+    assert rollups.check(db, user_id) == []
+    db.close()
@@ -0,0 +1,165 @@
+"""The materialised occurrences window against ``recurrence.occurrences``."""
+import io
+import json
+from datetime import date, timedelta
+
+import pytest
+
+import schedule
+from database import connect
+from recurrence import month_window, occurrences
+
+
+def expense(title, amount, billing_date, interval='once', **fields):
+    return {'title': title, 'amount': amount, 'currency': 'USD',
+            'billing_date': billing_date, 'billing_interval': interval, **fields}
+
+
+def month(offset, day=1):
+    today = date.today()
+    index = today.year * 12 + today.month - 1 + offset
+    return date(index // 12, index % 12 + 1, day)
+
+
+def expected_days(db, user_id, start, end):
+    """``{day: sorted expense ids}`` expanded from scratch, active expenses only."""
+    days = {}
+    for e in db.execute('SELECT * FROM expenses WHERE user_id=? AND is_active=1', (user_id,)):
+        for d in occurrences(e, start, end):
+            days.setdefault(d.isoformat(), []).append(e['id'])
+    return {d: sorted(ids) for d, ids in days.items()}
+
+
+def calendar_days(client, year, month_):
+    body = client.get(f'/api/calendar?year={year}&month={month_}').get_json()
+    return {d: sorted(i['id'] for i in items) for d, items in body.items() if items}
+
+
+@pytest.fixture
+def db(app):
+    db = connect(app.config['DATABASE'])
+    yield db
+    db.close()
+
+
+def assert_consistent(db, user_id, client):
+    assert schedule.check(db, user_id) == []
+    # Every month of the window plus one on each side (expanded at request time)
+    for offset in range(-schedule.config.SCHEDULE_PAST_MONTHS - 1,
+                        schedule.config.SCHEDULE_AHEAD_MONTHS + 2):
+        first = month(offset)
+        assert calendar_days(client, first.year, first.month) == \
+            expected_days(db, user_id, *month_window(first.year, first.month)), first
+
+
+def create(client, data):
+    response = client.post('/api/expenses', json=data)
+    assert response.status_code == 200
+    return response.get_json()['id']
+
+
+def test_writes_keep_the_window_in_sync(db, fresh_user):
+    user_id, client = fresh_user
+    client.get('/api/calendar')                     # builds the window
+    assert schedule.window(db, user_id) == schedule.target_window()
+
+    rent = create(client, expense('Rent', 900, month(-14, 31).isoformat(), 'monthly'))
+    gym = create(client, expense('Gym', 12, month(-1, 3).isoformat(), 'weekly'))
+    create(client, expense('Laptop', 1500, month(2, 9).isoformat()))
+    create(client, expense('Old', 10, month(-20, 9).isoformat()))
+    create(client, expense('Plants', 7, month(-2, 5).isoformat(), 'custom', custom_interval_days=10))
+    create(client, expense('Paused', 5, month(-1, 1).isoformat(), 'daily', is_active=0))
+    assert_consistent(db, user_id, client)
+
+    client.put(f'/api/expenses/{rent}', json=expense('Rent', 900, month(1, 29).isoformat(), 'yearly'))
+    client.put(f'/api/expenses/{gym}', json=expense('Gym', 12, month(-1, 3).isoformat(), 'weekly',
+                                                      is_active=0))
+    assert_consistent(db, user_id, client)
+
+    response = client.post('/api/expenses/batch', json=[
+        {'op': 'delete', 'id': rent},
+        {'op': 'update', 'id': gym, 'data': expense('Gym', 12, month(0, 2).isoformat(), 'biweekly')},
+        {'op': 'create', 'data': expense('Coffee', 3, month(0, 1).isoformat(), 'daily')},
+    ])
+    assert response.status_code == 200
+    lines = [json.dumps(expense(f'Imported {i}', 5, month(i - 3, 28).isoformat(), 'monthly'))
+             for i in range(4)]
+    response = client.post('/api/expenses/import?format=ndjson',
+                           data={'file': (io.BytesIO('\n'.join(lines).encode()), 'x.ndjson')},
+                           content_type='multipart/form-data')
+    assert response.get_json()['imported'] == 4
+    assert_consistent(db, user_id, client)
+
+
+def test_refresh_waits_for_the_window(db, fresh_user):
+    user_id, client = fresh_user
+    create(client, expense('Rent', 900, month(0, 1).isoformat(), 'monthly'))
+    assert schedule.window(db, user_id) is None
+    assert db.execute('SELECT COUNT(*) FROM occurrences WHERE user_id=?', (user_id,)).fetchone()[0] == 0
+    assert schedule.advance(db, user_id)
+    assert not schedule.advance(db, user_id)
+    assert schedule.check(db, user_id) == []
+    db.rollback()
+
+
+def test_advance_extends_then_rebuilds(db, fresh_user):
+    user_id, client = fresh_user
+    create(client, expense('Rent', 900, month(-30, 15).isoformat(), 'monthly'))
+    create(client, expense('Later', 40, month(30, 1).isoformat()))
+    today = date.today()
+    schedule.advance(db, user_id, today)
+    for later in (month(2, 1), month(3, 1), month(40, 1)):
+        # Two months on the window slides; far later it is rebuilt
+        assert schedule.advance(db, user_id, later)
+        assert schedule.window(db, user_id) == schedule.target_window(later)
+        assert schedule.check(db, user_id) == []
+        first = db.execute('SELECT MIN(day) FROM occurrences WHERE user_id=?', (user_id,)).fetchone()[0]
+        assert first >= schedule.target_window(later)[0].isoformat()
+    db.rollback()
+
+
+def test_cli_check_rebuild_and_refresh(db, fresh_user, capsys):
+    user_id, client = fresh_user
+    create(client, expense('Rent', 900, month(-2, 10).isoformat(), 'monthly'))
+    client.get('/api/calendar')
+    argv = lambda command: ['schedule.py', command, str(user_id)]
+    assert schedule.main(argv('check')) == 0
+
+    db.execute('DELETE FROM occurrences WHERE user_id=? AND day=?',
+               (user_id, month(0, 10).isoformat()))
+    db.execute('INSERT INTO occurrences (user_id, day, expense_id) '
+               'SELECT user_id, ?, expense_id FROM occurrences WHERE user_id=? LIMIT 1',
+               (month(0, 11).isoformat(), user_id))
+    db.commit()
+    assert schedule.main(argv('check')) == 1
+    out = capsys.readouterr().out
+    assert 'missing' in out and 'unexpected' in out
+
+    assert schedule.main(argv('rebuild')) == 0
+    assert schedule.main(argv('check')) == 0
+    assert schedule.main(argv('refresh')) == 0        # already current: nothing to do
+    assert schedule.main(['schedule.py']) == 2
+
+
+def test_upcoming_days(db, fresh_user):
+    user_id, client = fresh_user
+    today = date.today()
+    create(client, expense('Coffee', 3, (today - timedelta(days=40)).isoformat(), 'daily'))
+    create(client, expense('Rent', 900, (today + timedelta(days=5)).isoformat(), 'monthly'))
+    create(client, expense('Paid', 20, (today - timedelta(days=1)).isoformat()))
+    amounts = {r['id']: r['amount'] for r in db.execute(
+        'SELECT id, amount FROM expenses WHERE user_id=?', (user_id,))}
+    for days in (1, 7, 30, 400):
+        body = client.get(f'/api/upcoming?days={days}&currency=USD').get_json()
+        end = today + timedelta(days=days)
+        expected = expected_days(db, user_id, today, end)
+        got = {}
+        for item in body['items']:
+            got.setdefault(item['date'], []).append(item['id'])
+        assert {d: sorted(ids) for d, ids in got.items()} == expected
+        assert body['start'] == today.isoformat()
+        assert body['end'] == (end - timedelta(days=1)).isoformat()
+        assert body['total'] == round(sum(amounts[i] for ids in expected.values() for i in ids), 2)
+    assert client.get('/api/upcoming?days=0').status_code == 400
+    assert client.get('/api/upcoming?days=abc').status_code == 400
+    assert client.get('/api/upcoming?days=99999').status_code == 400
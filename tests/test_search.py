@@ -0,0 +1,96 @@
+"""/api/expenses/search: prefix matching, folding, snippets and tenancy."""
+import pytest
+
+from database import connect, migrate_search_index
+
+EXPENSE = {'amount': 9.5, 'currency': 'EUR', 'billing_date': '2026-03-01'}
+
+
+def signed_in(app, user_id):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+    return client
+
+
+def search(client, q, **args):
+    response = client.get('/api/expenses/search', query_string={'q': q, **args})
+    assert response.status_code == 200
+    return response.get_json()['items']
+
+
+@pytest.fixture
+def expenses(app, client):
+    """A few searchable expenses for user 1 and one for user 2; removed afterwards."""
+    other = signed_in(app, 2)
+    created = []
+    for owner, title, description in [
+            (client, 'Zwölfpfund Café', 'croissants <b>&amp; coffee</b>'),
+            (client, 'Quarzlampe repair', 'workshop visit'),
+            (client, 'Notes', 'quarzlampe bulbs'),
+            (other, 'Quarzlampe spare', 'not yours')]:
+        response = owner.post('/api/expenses', json=dict(EXPENSE, title=title, description=description))
+        created.append((owner, response.get_json()['id']))
+    yield
+    for owner, eid in created:
+        owner.delete(f'/api/expenses/{eid}')
+
+
+def test_words_match_as_prefixes_and_titles_rank_first(client, expenses):
+    items = search(client, 'quarz')
+    assert [i['title'] for i in items] == ['Quarzlampe repair', 'Notes']
+    assert items[0]['title_snippet'] == '<mark>Quarzlampe</mark> repair'
+    assert items[1]['title_snippet'] == 'Notes'
+    assert items[1]['description_snippet'] == '<mark>quarzlampe</mark> bulbs'
+    assert [i['title'] for i in search(client, 'quarz rep')] == ['Quarzlampe repair']
+
+
+def test_diacritics_are_folded(client, expenses):
+    assert [i['title'] for i in search(client, 'zwolf')] == ['Zwölfpfund Café']
+    assert [i['title'] for i in search(client, 'CAFE')] == ['Zwölfpfund Café']
+
+
+def test_snippets_are_html_escaped(client, expenses):
+    item = search(client, 'croissants')[0]
+    assert item['description_snippet'] == \
+        '<mark>croissants</mark> &lt;b&gt;&amp;amp; coffee&lt;/b&gt;'
+
+
+def test_other_tenants_rows_are_never_matched(app, client, expenses):
+    assert 'Quarzlampe spare' not in [i['title'] for i in search(client, 'quarzlampe')]
+    assert [i['title'] for i in search(signed_in(app, 2), 'quarzlampe')] == ['Quarzlampe spare']
+    assert search(signed_in(app, 3), 'quarzlampe') == []
+
+
+def test_list_filters_and_required_q(client, expenses):
+    assert search(client, 'quarz', date_from='2026-04-01') == []
+    assert client.get('/api/expenses/search?q=%20*').status_code == 400
+
+
+@pytest.fixture
+def without_fts(app):
+    db = connect(app.config['DATABASE'])
+    db.executescript('''
+        DROP TRIGGER expenses_fts_insert; DROP TRIGGER expenses_fts_delete;
+        DROP TRIGGER expenses_fts_update; DROP TABLE expenses_fts;
+    ''')
+    yield db
+    migrate_search_index(db)
+    db.commit()
+    db.close()
+
+
+def test_like_fallback_without_the_index(client, expenses, without_fts):
+    items = search(client, 'quarzlampe')
+    assert sorted(i['title'] for i in items) == ['Notes', 'Quarzlampe repair']
+    assert all(i['rank'] is None and i['title_snippet'] is None for i in items)
+
+
+def test_index_without_owner_column_is_rebuilt(client, expenses, without_fts):
+    without_fts.execute("CREATE VIRTUAL TABLE expenses_fts USING fts5("
+                        "title, description, content='expenses', content_rowid='id')")
+    assert migrate_search_index(without_fts)
+    without_fts.commit()
+    assert [r[1] for r in without_fts.execute('PRAGMA table_info(expenses_fts)')] == \
+        ['title', 'description', 'user_id']
+    assert [i['title'] for i in search(client, 'quarz')] == ['Quarzlampe repair', 'Notes']
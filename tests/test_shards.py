@@ -0,0 +1,60 @@
+"""Splitting a database into shards keeps every user's sync state."""
+import pytest
+
+import config
+import shards
+from bench.generate import generate
+from database import bump_data_version, connect
+
+SYNC_LOG = 'SELECT kind, row_id, version, deleted, changed_at FROM sync_log WHERE user_id=? ORDER BY 1, 2'
+
+
+def sync_state(db, user_id):
+    version = db.execute('SELECT version FROM data_versions WHERE user_id=?', (user_id,)).fetchone()
+    return version and version[0], [tuple(r) for r in db.execute(SYNC_LOG, (user_id,))]
+
+
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    path = str(tmp_path / 'directory.db')
+    generate(path, users=3, expenses=40)
+    db = connect(path)
+    # A few versions of history, including a tombstone, per user
+    for user_id in (1, 2, 3):
+        for version in range(3):
+            ids = [r[0] for r in db.execute('SELECT id FROM expenses WHERE user_id=? ORDER BY id LIMIT 2',
+                                            (user_id,))]
+            db.execute('UPDATE expenses SET amount = amount + 1 WHERE id=?', (ids[0],))
+            if version == 2:
+                db.execute('DELETE FROM expenses WHERE id=?', (ids[1],))
+            bump_data_version(db, user_id)
+            db.commit()
+    db.close()
+    monkeypatch.setattr(config, 'DB_SHARDING', 'bucket')
+    monkeypatch.setattr(config, 'DB_SHARD_BUCKETS', 2)
+    monkeypatch.setattr(config, 'DB_SHARD_DIR', str(tmp_path / 'shards'))
+    return path
+
+
+def test_split_keeps_sync_log_and_version(source):
+    directory = connect(source)
+    before = {uid: sync_state(directory, uid) for uid in (1, 2, 3)}
+    directory.close()
+    assert all(version == 3 and any(log[3] for log in rows) for version, rows in before.values())
+
+    assert sum(shards.split(source).values()) == 3
+    for uid, state in before.items():
+        db = connect(shards.db_path(uid, source))
+        assert sync_state(db, uid) == state
+        db.close()
+
+
+def test_verify_rejects_a_rewritten_log(source):
+    shards.split(source)
+    db = connect(shards.db_path(1, source))
+    db.execute('ATTACH DATABASE ? AS src', (source,))
+    shards._verify(db, 1)
+    db.execute('UPDATE main.sync_log SET version = version + 1 WHERE user_id=1')
+    with pytest.raises(SystemExit):
+        shards._verify(db, 1)
+    db.close()
@@ -0,0 +1,24 @@
+"""/api/sync sends expense rows that stay valid when their category changes."""
+
+
+def test_expense_rows_carry_only_their_own_columns(client, app):
+    from database import connect
+    db = connect(app.config['DATABASE'])
+    columns = {r[1] for r in db.execute('PRAGMA table_info(expenses)')}
+    db.close()
+    full = client.get('/api/sync').get_json()
+    assert full['full'] and full['expenses']
+    assert all(set(e) == columns for e in full['expenses'])
+
+    category = next(c for c in full['categories'] if c['user_id'] == 1)
+
+    def rename(name):
+        client.put(f"/api/categories/{category['id']}",
+                   json={'name': name, 'icon': category['icon'], 'color': category['color']})
+    # The generated rows were logged without a version bump; start after a write
+    rename('Before')
+    token = client.get('/api/sync').get_json()['token']
+    rename('Renamed')
+    delta = client.get(f'/api/sync?since={token}').get_json()
+    assert not delta['full'] and delta['expenses'] == []
+    assert [c['name'] for c in delta['categories']] == ['Renamed']